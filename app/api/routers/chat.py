@@ -1,81 +1,133 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from typing import AsyncIterator, Optional, Tuple
 from app.api.schemas import ChatRequest, ChatResponse
 from app.services.rag_service import rag_service
+from app.services.answer_cache import answer_cache
+from app.services.retrieval_planner import retrieval_planner, RetrievalResult
 from app.services.memory_service import memory_service
 from app.services.llm_service import llm_service
+from app.services.llm_admission import llm_admission, LLMOverloadedError, PRIORITIES
+from app.services.llm_router import LLMTimeoutError
+from app.utils.sse import coalesce_frames, encode_event
+from app.core.config import settings
+import asyncio
 import logging
-import json
+import time
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1", tags=["聊天"])
 
+# 流式接口回放缓存回答时每个 chunk 的字符数
+REPLAY_CHUNK_CHARS = 32
+
+
+def _overloaded(e: LLMOverloadedError) -> HTTPException:
+    """模型服务繁忙：返回 429/503，并告诉客户端多久之后重试"""
+    logger.warning(f"模型服务繁忙，拒绝请求: {e}")
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _validate_filters(request: ChatRequest):
+    """过滤条件或租户写错时直接返回 400，而不是静默退化为不使用 RAG"""
+    if request.use_rag:
+        try:
+            rag_service.vector_store.validate_scope(
+                request.filters,
+                rag_service.search_tenants(request.tenant, request.include_shared)
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+def _affinity_key(request: ChatRequest) -> str:
+    """同一会话的多轮对话发往同一个推理副本，复用副本上已缓存的历史前缀"""
+    return request.conversation_id or request.user_id
+
+
+async def _retrieve(request: ChatRequest) -> RetrievalResult:
+    """并发获取对话历史、知识库检索结果和相关记忆"""
+    return await retrieval_planner.plan(
+        request.user_id,
+        request.message,
+        use_rag=request.use_rag,
+        use_memory=request.use_memory,
+        filters=request.filters,
+        tenant=request.tenant,
+        include_shared=request.include_shared
+    )
+
+
+async def _cached_answer(
+    request: ChatRequest,
+    retrieval: RetrievalResult
+) -> Tuple[Optional[str], Optional[tuple]]:
+    """查找语义缓存，返回 (缓存的回答, 写入缓存用的键)
+
+    缓存在用户之间共享，回答依赖个人记忆或对话历史时，以及检索失败（rag_results 为 None）时
+    不读写缓存，键为 None。
+    """
+    if not answer_cache.enabled:
+        return None, None
+    if (
+        not request.use_cache
+        or retrieval.personal_memories
+        or retrieval.conversation_history
+        or retrieval.rag_results is None
+    ):
+        answer_cache.bypass()
+        return None, None
+    query_vector = retrieval.query_vector
+    if query_vector is None:
+        query_vector = await rag_service.embed_query_async(request.message)
+    key = (
+        query_vector,
+        answer_cache.fingerprint(retrieval.rag_results, scope=f"rag={request.use_rag}"),
+        rag_service.kb_version()
+    )
+    return answer_cache.lookup(*key), key
+
+
+async def _replay(answer: str) -> AsyncIterator[str]:
+    """把缓存的回答切成块，按流式接口的格式回放"""
+    for i in range(0, len(answer), REPLAY_CHUNK_CHARS):
+        yield answer[i:i + REPLAY_CHUNK_CHARS]
+
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """聊天接口"""
+    _validate_filters(request)
     try:
-        # 获取对话历史
-        conversation_history = memory_service.get_conversation_history(
-            request.user_id,
-            limit=20
-        )
-        logger.info(conversation_history)
-        # RAG 检索
-        context = []
-        sources = []
-        if request.use_rag:
-            try:
-                rag_results = rag_service.search(request.message)
-                context = [r["text"] for r in rag_results]
-                sources = [
-                    {
-                        "text": r["text"],
-                        "score": r["score"],
-                        "metadata": r.get("metadata", {})
-                    }
-                    for r in rag_results
-                ]
-                logger.info("rag检索向量知识库")
-                logger.info(sources)
-            except Exception as e:
-                logger.error(f"RAG 检索失败: {e}", exc_info=True)
-                # RAG 失败时继续处理，但不使用 RAG 结果
-                rag_results = []
-                context = []
-                sources = []
-        
-        # 获取相关记忆
-        memories_used = []
-        user_memories = []
-        if request.use_memory:
-            memories = memory_service.get_relevant_memories(
-                request.user_id,
-                request.message,
-                top_k=5
+        # 对话历史、知识库检索、相关记忆并发获取（查询只向量化一次）
+        retrieval = await _retrieve(request)
+        sources = retrieval.sources
+        memories_used = retrieval.memories_used
+        logger.info(f"知识库来源: {sources}")
+        logger.info(f"使用的记忆: {memories_used}")
+
+        # 检索上下文相同的相似问题已经回答过时直接复用，跳过 LLM 生成
+        response_text, cache_key = await _cached_answer(request, retrieval)
+        cached = response_text is not None
+        if not cached:
+            # 生成回复
+            response_text = await llm_service.agenerate_with_context(
+                user_message=request.message,
+                context=retrieval.context,
+                conversation_history=retrieval.conversation_history,
+                user_memories=retrieval.memories,
+                core_memories=retrieval.core_memories,
+                priority=PRIORITIES[request.priority],
+                affinity_key=_affinity_key(request)
             )
-            memories_used = [
-                {
-                    "content": m["content"],
-                    "type": m["memory_type"],
-                    "importance": m["importance"]
-                }
-                for m in memories
-            ]
-            user_memories = memories
-            logger.info("查询记忆")
-            logger.info(memories_used)
-        
-        # 生成回复
-        response_text = llm_service.generate_with_context(
-            user_message=request.message,
-            context=context,
-            conversation_history=conversation_history,
-            user_memories=user_memories
-        )
+            if cache_key is not None:
+                answer_cache.store(*cache_key, response_text)
         
         # 保存对话
-        memory_service.save_conversation(
+        await asyncio.to_thread(
+            memory_service.save_conversation,
             user_id=request.user_id,
             user_message=request.message,
             assistant_message=response_text
@@ -84,94 +136,112 @@ async def chat(request: ChatRequest):
         return ChatResponse(
             response=response_text,
             sources=sources,
-            memories_used=memories_used
+            memories_used=memories_used,
+            cached=cached
         )
     
+    except LLMOverloadedError as e:
+        raise _overloaded(e)
+    except LLMTimeoutError as e:
+        logger.warning(f"模型服务超时: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"聊天处理失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
-    """流式聊天接口"""
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """流式聊天接口
+
+    检索和模型服务准入在响应开始前完成，繁忙时直接返回 429/503；
+    客户端中途断开时立即取消 LLM 生成，已生成的部分回答标记 truncated 后保存。
+    """
+    _validate_filters(request)
+    try:
+        # 对话历史、知识库检索、相关记忆并发获取（查询只向量化一次）
+        retrieval = await _retrieve(request)
+        cached_response, cache_key = await _cached_answer(request, retrieval)
+        # 未命中缓存时先排队获取模型服务的并发名额，生成结束后释放
+        lease = None if cached_response is not None else await llm_admission.acquire(PRIORITIES[request.priority])
+    except LLMOverloadedError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"流式聊天处理失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
     async def generate():
         try:
-            # 获取对话历史
-            conversation_history = memory_service.get_conversation_history(
-                request.user_id,
-                limit=20
-            )
-            
-            # RAG 检索
-            context = []
-            sources = []
-            if request.use_rag:
-                try:
-                    rag_results = rag_service.search(request.message)
-                    context = [r["text"] for r in rag_results]
-                    sources = [
-                        {
-                            "text": r["text"],
-                            "score": r["score"],
-                            "metadata": r.get("metadata", {})
-                        }
-                        for r in rag_results
-                    ]
-                except Exception as e:
-                    logger.error(f"RAG 检索失败: {e}", exc_info=True)
-                    sources = []
-            
-            # 获取相关记忆
-            memories_used = []
-            user_memories = []
-            if request.use_memory:
-                memories = memory_service.get_relevant_memories(
-                    request.user_id,
-                    request.message,
-                    top_k=5
-                )
-                memories_used = [
-                    {
-                        "content": m["content"],
-                        "type": m["memory_type"],
-                        "importance": m["importance"]
-                    }
-                    for m in memories
-                ]
-                user_memories = memories
-            
             # 先发送元数据（sources 和 memories）
             metadata = {
                 "type": "metadata",
-                "sources": sources,
-                "memories_used": memories_used
+                "sources": retrieval.sources,
+                "memories_used": retrieval.memories_used,
+                "cached": cached_response is not None
             }
-            yield f"data: {json.dumps(metadata, ensure_ascii=False)}\n\n"
+            yield encode_event(metadata)
             
-            # 流式生成回复
+            if cached_response is not None:
+                # 命中语义缓存：按块回放缓存的回答
+                chunks = _replay(cached_response)
+            else:
+                # 流式生成回复（异步迭代，等待 token 时不阻塞其他请求）
+                # 相邻 token 合并成帧发送，减少逐 token 的编码和网络开销
+                chunks = coalesce_frames(
+                    llm_service.astream_with_context(
+                        user_message=request.message,
+                        context=retrieval.context,
+                        conversation_history=retrieval.conversation_history,
+                        user_memories=retrieval.memories,
+                        core_memories=retrieval.core_memories,
+                        lease=lease,
+                        affinity_key=_affinity_key(request)
+                    ),
+                    http_request.is_disconnected,
+                    window=settings.chat_stream_window,
+                    max_bytes=settings.chat_stream_max_bytes,
+                    poll_interval=settings.chat_disconnect_poll_interval
+                )
             full_response = ""
-            for chunk in llm_service.stream_with_context(
-                user_message=request.message,
-                context=context,
-                conversation_history=conversation_history,
-                user_memories=user_memories
-            ):
-                full_response += chunk
-                # 发送每个文本块
-                data = {
-                    "type": "chunk",
-                    "content": chunk
-                }
-                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            chunk_count = 0
+            started = time.perf_counter()
+            try:
+                async for chunk in chunks:
+                    full_response += chunk
+                    chunk_count += 1
+                    # 发送每个文本块
+                    data = {
+                        "type": "chunk",
+                        "content": chunk
+                    }
+                    yield encode_event(data)
+            except (ClientDisconnect, asyncio.CancelledError, GeneratorExit) as e:
+                # 客户端中途断开：不再输出，部分回答标记 truncated 后在后台保存
+                if cached_response is None:
+                    llm_service.record_stream(True, chunk_count, len(full_response), time.perf_counter() - started)
+                asyncio.ensure_future(chunks.aclose())
+                asyncio.get_running_loop().run_in_executor(None, lambda: memory_service.save_conversation(
+                    user_id=request.user_id,
+                    user_message=request.message,
+                    assistant_message=full_response,
+                    metadata={"truncated": True}
+                ))
+                if isinstance(e, ClientDisconnect):
+                    return
+                raise
+            if cached_response is None:
+                llm_service.record_stream(False, chunk_count, len(full_response), time.perf_counter() - started)
+                if cache_key is not None:
+                    answer_cache.store(*cache_key, full_response)
             
             # 发送完成信号
             done = {
                 "type": "done"
             }
-            yield f"data: {json.dumps(done, ensure_ascii=False)}\n\n"
+            yield encode_event(done)
             
             # 保存完整对话
-            memory_service.save_conversation(
+            await asyncio.to_thread(
+                memory_service.save_conversation,
                 user_id=request.user_id,
                 user_message=request.message,
                 assistant_message=full_response
@@ -183,7 +253,11 @@ async def chat_stream(request: ChatRequest):
                 "type": "error",
                 "message": str(e)
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield encode_event(error_data)
+        finally:
+            # 生成结束时 astream 已释放名额，这里兜底没有走到生成的情况
+            if lease is not None:
+                lease.release()
     
     return StreamingResponse(
         generate(),
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import List
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from typing import AsyncIterator, List, Optional
 from app.api.schemas import (
     DocumentAddRequest, DocumentAddResponse,
     DocumentItem, DocumentListResponse,
-    DocumentDeleteRequest, DocumentDeleteResponse
+    DocumentDeleteRequest, DocumentDeleteResponse,
+    DocumentUpsertRequest, DocumentUpsertResponse
 )
 from app.services.rag_service import rag_service
+from app.services.export_service import export_ndjson
+from app.core.vector_store import MAX_PAGE_SIZE, TENANT_FIELD
+from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,50 +24,100 @@ async def add_documents(request: DocumentAddRequest):
     """添加文档到知识库"""
     try:
         metadatas = request.metadatas or [{}] * len(request.texts)
-        rag_service.add_documents(request.texts, metadatas)
+        stats = await rag_service.add_documents_async(request.texts, metadatas, request.tenant)
         
         return DocumentAddResponse(
             success=True,
             message="文档添加成功",
-            count=len(request.texts)
+            count=len(request.texts),
+            chunk_count=stats["chunks"],
+            doc_ids=stats["doc_ids"],
+            stats=stats
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"添加文档失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _iter_upload(file: UploadFile, block_size: int) -> AsyncIterator[bytes]:
+    """按固定大小分块读取上传文件"""
+    while True:
+        block = await file.read(block_size)
+        if not block:
+            break
+        yield block
+
+
 @router.post("/documents/upload", response_model=DocumentAddResponse)
-async def upload_documents(files: List[UploadFile] = File(...)):
-    """上传文档文件"""
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    tenant: Optional[str] = Form(None)
+):
+    """上传文档文件（流式读取、分块并入库）"""
     try:
-        texts = []
-        metadatas = []
-        for file in files:
-            content = await file.read()
-            texts.append(content.decode("utf-8"))
-            metadatas.append({
-                "source": "file",
-                "filename": file.filename,
-                "content_type": file.content_type
-            })
-
-        rag_service.add_documents(texts, metadatas)
+        pipeline = rag_service.create_pipeline().start()
+        file_stats = []
+        try:
+            for file in files:
+                metadata = rag_service.with_doc_identity({
+                    "source": "file",
+                    "filename": file.filename,
+                    "content_type": file.content_type
+                }, tenant)
+                chunk_count = await rag_service.add_byte_stream(
+                    pipeline,
+                    _iter_upload(file, settings.ingest_upload_block_size),
+                    metadata
+                )
+                file_stats.append({
+                    "filename": file.filename,
+                    "doc_id": metadata["doc_id"],
+                    "tenant": metadata[TENANT_FIELD],
+                    "chunks": chunk_count
+                })
+            stats = await run_in_threadpool(pipeline.join)
+            # 同名文件重新上传时删除旧版本中不再出现的块
+            stats["deleted"] = await run_in_threadpool(
+                rag_service.prune_resynced,
+                pipeline,
+                [{"doc_id": item["doc_id"], TENANT_FIELD: item["tenant"]} for item in file_stats]
+            )
+        except BaseException:
+            # 任一文件失败时整个请求不生效，删除已经写入的文档块，保留原始错误
+            removed = await run_in_threadpool(rag_service.abort_pipeline, pipeline)
+            if removed:
+                logger.warning(f"文档上传失败，已删除本次写入的 {removed} 个文档块")
+            raise
+        stats["files"] = file_stats
 
         return DocumentAddResponse(
             success=True,
             message="文档上传成功",
-            count=len(texts)
+            count=len(files),
+            chunk_count=stats["chunks"],
+            doc_ids=[item["doc_id"] for item in file_stats],
+            stats=stats
         )
+    except UnicodeDecodeError as e:
+        logger.error(f"文档上传失败，文件不是 UTF-8 编码: {e}")
+        raise HTTPException(status_code=400, detail=f"文件不是 UTF-8 编码: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"文档上传失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/documents", response_model=DocumentListResponse)
-async def get_documents(limit: int = 100):
-    """获取文档列表"""
+async def get_documents(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None
+):
+    """分页获取文档列表（按 id 升序，cursor 为上一页返回的 next_cursor）"""
     try:
-        documents = rag_service.get_all_documents(limit)
+        documents = await run_in_threadpool(rag_service.get_all_documents, limit, cursor)
         
         # 将 ID 转换为字符串（避免 JavaScript 大整数精度问题）
         documents_with_str_id = [
@@ -76,13 +132,43 @@ async def get_documents(limit: int = 100):
         return DocumentListResponse(
             success=True,
             documents=documents_with_str_id,
-            total=len(documents_with_str_id)
+            total=len(documents_with_str_id),
+            next_cursor=documents_with_str_id[-1].id if len(documents_with_str_id) == limit else None
         )
     except Exception as e:
         logger.error(f"获取文档失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/documents/export")
+async def export_documents(
+    cursor: Optional[int] = None,
+    with_vectors: bool = False,
+    page_size: int = Query(1000, ge=1, le=MAX_PAGE_SIZE),
+    tenant: Optional[str] = None
+):
+    """流式导出知识库（NDJSON，每行一个文档块，按 id 升序）
+
+    中断后把已收到的最后一行的 id 作为 cursor 重新请求即可续传。
+    """
+    try:
+        # 先校验参数并取第一页，出错时还能返回正常的错误状态码
+        pages = export_ndjson(rag_service.vector_store, cursor, with_vectors, page_size, tenant)
+        first = await run_in_threadpool(next, pages, b"")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"导出文档失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def stream():
+        yield first
+        yield from pages
+
+    # 同步生成器由 StreamingResponse 放到线程池中迭代
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.delete("/documents",response_model=DocumentDeleteResponse)
 async def delete_documents(request: DocumentDeleteRequest):
     try:
@@ -104,3 +190,40 @@ async def delete_documents(request: DocumentDeleteRequest):
     except Exception as e:
         logger.error(f"删除文档失败{e}",exc_info = True)
         raise HTTPException(status_code=500,detail=str(e))
+
+
+@router.put("/documents/{doc_id}", response_model=DocumentUpsertResponse)
+async def upsert_document(doc_id: str, request: DocumentUpsertRequest):
+    """按文档增量更新：只重新向量化变化的文档块"""
+    try:
+        result = await run_in_threadpool(
+            rag_service.upsert_document, doc_id, request.text, request.metadata, request.tenant
+        )
+        return DocumentUpsertResponse(success=True, **result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"更新文档失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/documents/{doc_id}", response_model=DocumentDeleteResponse)
+async def delete_document(doc_id: str, tenant: Optional[str] = None):
+    """删除租户内的整个文档"""
+    try:
+        deleted_count = await run_in_threadpool(rag_service.delete_document, doc_id, tenant)
+        if deleted_count == 0:
+            raise HTTPException(status_code=404, detail="文档不存在")
+
+        return DocumentDeleteResponse(
+            success=True,
+            message=f"成功删除文档 {doc_id} 的 {deleted_count} 个文档块",
+            deleted_count=deleted_count
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"删除文档失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
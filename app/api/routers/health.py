@@ -1,5 +1,9 @@
 from fastapi import APIRouter,HTTPException
 from app.services.rag_service import rag_service
+from app.services.answer_cache import answer_cache
+from app.services.llm_service import llm_service
+from app.services.llm_admission import llm_admission
+from app.services.context_compressor import context_compressor
 import logging
 
 
@@ -11,10 +15,15 @@ router = APIRouter(prefix="/api/v1",tags=["健康检查"])
 async def health():
     """健康检查"""
     try:
-        milvus_status = rag_service.milvus_client.get_stats()
+        milvus_status = rag_service.vector_store.get_stats()
         return {
             "status":"healthy",
             "milvus":milvus_status,
+            "answer_cache":answer_cache.get_stats(),
+            "context_compression":context_compressor.get_stats(),
+            "llm_streams":llm_service.get_stream_stats(),
+            "llm_admission":llm_admission.get_stats(),
+            "llm_router":llm_service.router.get_stats(),
             "mongodb":"connected"
         }
     except Exception as e:
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.api.schemas import TenantStatsResponse, TenantPurgeResponse
+from app.services.rag_service import rag_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1/admin", tags=["租户管理"])
+
+
+@router.get("/tenants/{tenant}/stats", response_model=TenantStatsResponse)
+async def tenant_stats(tenant: str):
+    """租户知识库统计"""
+    try:
+        stats = await run_in_threadpool(rag_service.tenant_stats, tenant)
+        return TenantStatsResponse(success=True, **stats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"获取租户统计失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/tenants/{tenant}", response_model=TenantPurgeResponse)
+async def purge_tenant(tenant: str):
+    """清空租户知识库"""
+    try:
+        deleted_count = await run_in_threadpool(rag_service.purge_tenant, tenant)
+        return TenantPurgeResponse(success=True, tenant=tenant, deleted_count=deleted_count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"清空租户失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
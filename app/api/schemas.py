@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import Any, List, Literal, Optional, Dict
 from datetime import datetime
 
 
@@ -10,6 +10,17 @@ class ChatRequest(BaseModel):
     use_memory: bool = Field(default=True, description="是否使用记忆")
     use_rag: bool = Field(default=True, description="是否使用RAG检索")
     conversation_id:Optional[str] = Field(None,description="对话ID")
+    filters: Optional[Dict[str, Any]] = Field(
+        None,
+        description="检索过滤条件，如 {\"source\": \"wiki\", \"created_at\": {\"gte\": 1700000000}}"
+    )
+    tenant: Optional[str] = Field(None, description="检索的租户知识库，不填时只检索共享知识库")
+    include_shared: Optional[bool] = Field(None, description="是否同时检索共享知识库，默认见配置")
+    use_cache: bool = Field(default=True, description="是否使用语义回答缓存（需在配置中开启）")
+    priority: Literal["interactive", "batch"] = Field(
+        default="interactive",
+        description="模型服务繁忙时的排队优先级，批量任务请使用 batch"
+    )
 
 
 class ChatResponse(BaseModel):
@@ -18,6 +29,7 @@ class ChatResponse(BaseModel):
     sources: List[Dict] = Field(default=[], description="知识库来源")
     memories_used: List[Dict] = Field(default=[], description="使用的记忆")
     conversation_id: Optional[str] = Field(None, description="对话ID")
+    cached: bool = Field(default=False, description="回答是否来自语义缓存")
 
 
 class MemoryAddRequest(BaseModel):
@@ -40,6 +52,7 @@ class DocumentListResponse(BaseModel):
     success: bool
     documents: List[DocumentItem]
     total: int
+    next_cursor: Optional[str] = Field(None, description="下一页游标，没有更多数据时为空")
 
 class DocumentDeleteRequest(BaseModel):
     """删除文档请求"""
@@ -55,12 +68,48 @@ class DocumentAddRequest(BaseModel):
     """添加文档请求"""
     texts: List[str] = Field(..., description="文档文本列表")
     metadatas: Optional[List[Dict]] = Field(None, description="文档元数据")
+    tenant: Optional[str] = Field(None, description="写入的租户知识库，不填时写入共享知识库")
 
 class DocumentAddResponse(BaseModel):
     """添加文档响应"""
     success: bool
     message: str
     count: int
+    chunk_count: Optional[int] = Field(None, description="写入的文档块数量")
+    doc_ids: Optional[List[str]] = Field(None, description="文档ID")
+    stats: Optional[Dict] = Field(None, description="入库流水线各阶段统计")
+
+class DocumentUpsertRequest(BaseModel):
+    """按文档增量更新请求"""
+    text: str = Field(..., description="文档全文")
+    metadata: Optional[Dict] = Field(None, description="文档元数据")
+    tenant: Optional[str] = Field(None, description="文档所属租户，不填时为共享知识库")
+
+class DocumentUpsertResponse(BaseModel):
+    """按文档增量更新响应"""
+    success: bool
+    doc_id: str
+    tenant: str = Field(..., description="文档所属租户")
+    version: int = Field(..., description="本次更新后的文档版本")
+    chunks: int = Field(..., description="文档块总数")
+    unchanged: int = Field(..., description="未变化的文档块数")
+    embedded: int = Field(..., description="重新向量化的文档块数")
+    reused: int = Field(..., description="复用原向量重新写入的文档块数")
+    deleted: int = Field(..., description="删除的旧文档块数")
+
+
+class TenantStatsResponse(BaseModel):
+    """租户知识库统计响应"""
+    success: bool
+    tenant: str
+    chunks: int = Field(..., description="文档块数量")
+    documents: int = Field(..., description="文档数量")
+
+class TenantPurgeResponse(BaseModel):
+    """清空租户知识库响应"""
+    success: bool
+    tenant: str
+    deleted_count: int
 
 
 # 在现有代码后添加
@@ -22,6 +22,30 @@ class Settings(BaseSettings):
     openai_api_key: Optional[str] = Field(default=None, alias="OPENAI_API_KEY")
     # 本地模型部署
     llm_base_url : Optional[str] = Field(default=None,alias="LLM_BASE_URL")
+    # 多个推理副本（逗号分隔），配置后在副本之间路由，优先于 llm_base_url
+    llm_base_urls: str = Field(default="", alias="LLM_BASE_URLS")
+    # 副本健康检查间隔（秒，0 表示不检查）；连续失败多少次后暂停使用多少秒
+    llm_health_interval: float = Field(default=10.0, alias="LLM_HEALTH_INTERVAL")
+    llm_eject_failures: int = Field(default=3, alias="LLM_EJECT_FAILURES")
+    llm_eject_seconds: float = Field(default=30.0, alias="LLM_EJECT_SECONDS")
+    # 会话固定的副本比最空闲的副本多出超过这么多个进行中请求时，改走最空闲的副本
+    llm_affinity_slack: int = Field(default=4, alias="LLM_AFFINITY_SLACK")
+    # 提示词布局：default 或 prefix_cache（固定前缀在前、易变内容在后，便于推理服务复用前缀缓存）
+    llm_prompt_layout: str = Field(default="default", alias="LLM_PROMPT_LAYOUT")
+    # 模型服务准入控制：并发上限（0 表示不限制）、排队上限、排队等待期限（秒）
+    llm_max_concurrency: int = Field(default=8, alias="LLM_MAX_CONCURRENCY")
+    llm_max_queue: int = Field(default=64, alias="LLM_MAX_QUEUE")
+    llm_queue_timeout: float = Field(default=10.0, alias="LLM_QUEUE_TIMEOUT")
+    llm_batch_queue_timeout: float = Field(default=60.0, alias="LLM_BATCH_QUEUE_TIMEOUT")
+    # 单次模型请求的截止时间（秒，流式请求为首个 token 的截止时间，0 表示不限制）
+    llm_request_timeout: float = Field(default=30.0, alias="LLM_REQUEST_TIMEOUT")
+    # 流式请求为后面的副本和备用模型保留的时间（秒，最多为剩余时间的一半），其余时间都给当前副本
+    llm_failover_reserve: float = Field(default=5.0, alias="LLM_FAILOVER_RESERVE")
+    # 对冲请求：超过副本的 P95 延迟（样本不足时用 llm_hedge_delay 秒）仍未返回时向下一个副本或备用模型再发一份
+    llm_hedge_enabled: bool = Field(default=False, alias="LLM_HEDGE_ENABLED")
+    llm_hedge_delay: float = Field(default=2.0, alias="LLM_HEDGE_DELAY")
+    # 备用模型（逗号分隔的 "模型@地址"，只写地址时使用 llm_model），副本都失败时依次尝试
+    llm_fallbacks: str = Field(default="", alias="LLM_FALLBACKS")
 
 
     
@@ -30,6 +54,32 @@ class Settings(BaseSettings):
     milvus_port: int = Field(default=19530, alias="MILVUS_PORT")
     milvus_collection_name: str = Field(default="knowledge_base", alias="MILVUS_COLLECTION")
     milvus_dimension: int = Field(default=768, alias="MILVUS_DIMENSION")
+    milvus_metric_type: str = Field(default="COSINE", alias="MILVUS_METRIC_TYPE")
+    # 索引类型: AUTO | FLAT | IVF_FLAT | IVF_SQ8 | IVF_PQ | HNSW
+    milvus_index_type: str = Field(default="IVF_FLAT", alias="MILVUS_INDEX_TYPE")
+    milvus_nlist: int = Field(default=1024, alias="MILVUS_NLIST")
+    milvus_nprobe: int = Field(default=10, alias="MILVUS_NPROBE")
+    milvus_pq_m: int = Field(default=8, alias="MILVUS_PQ_M")
+    milvus_hnsw_m: int = Field(default=16, alias="MILVUS_HNSW_M")
+    milvus_hnsw_ef_construction: int = Field(default=200, alias="MILVUS_HNSW_EF_CONSTRUCTION")
+    milvus_hnsw_ef: int = Field(default=64, alias="MILVUS_HNSW_EF")
+    # 写入可见性: strong | bounded | periodic
+    milvus_write_visibility: str = Field(default="strong", alias="MILVUS_WRITE_VISIBILITY")
+    milvus_consistency_level: str = Field(default="Bounded", alias="MILVUS_CONSISTENCY_LEVEL")
+    milvus_flush_interval: float = Field(default=5.0, alias="MILVUS_FLUSH_INTERVAL")
+    milvus_flush_rows: int = Field(default=10000, alias="MILVUS_FLUSH_ROWS")
+    # partition key 哈希分区数（仅在创建集合时生效）
+    milvus_num_partitions: int = Field(default=64, alias="MILVUS_NUM_PARTITIONS")
+    # 连接池大小（连接别名数）和单次调用超时（秒，0 表示不限制）
+    milvus_pool_size: int = Field(default=4, alias="MILVUS_POOL_SIZE")
+    milvus_timeout: float = Field(default=10.0, alias="MILVUS_TIMEOUT")
+
+    # 向量存储后端: milvus | local
+    vector_store_backend: str = Field(default="milvus", alias="VECTOR_STORE_BACKEND")
+    vector_store_path: str = Field(default="data/vector_store", alias="VECTOR_STORE_PATH")
+    # local 后端索引类型: AUTO | FLAT | HNSW（HNSW 需要安装 hnswlib）
+    vector_store_index_type: str = Field(default="AUTO", alias="VECTOR_STORE_INDEX_TYPE")
+    vector_store_save_interval: float = Field(default=5.0, alias="VECTOR_STORE_SAVE_INTERVAL")
     
     # MongoDB 配置
     mongodb_uri: str = Field(default="mongodb://localhost:27017", alias="MONGODB_URI")
@@ -44,9 +94,73 @@ class Settings(BaseSettings):
     
     # RAG 配置
     rag_top_k: int = Field(default=5, alias="RAG_TOP_K")
-    rag_similarity_threshold: float = Field(default=0.7, alias="RAG_SIMILARITY_THRESHOLD")
+    # 相似度分数已按度量方式换算到 [0, 1]（向量归一化时等于余弦相似度）
+    rag_similarity_threshold: float = Field(default=0.3, alias="RAG_SIMILARITY_THRESHOLD")
     rag_chunk_size: int = Field(default=500, alias="RAG_CHUNK_SIZE")
     rag_chunk_overlap: int = Field(default=50, alias="RAG_CHUNK_OVERLAP")
+    # 混合检索（词法 BM25 + 向量，RRF 融合）
+    rag_hybrid_enabled: bool = Field(default=False, alias="RAG_HYBRID_ENABLED")
+    rag_hybrid_candidates: int = Field(default=20, alias="RAG_HYBRID_CANDIDATES")
+    rag_rrf_k: int = Field(default=60, alias="RAG_RRF_K")
+    rag_lexical_index_path: str = Field(default="data/lexical_index", alias="RAG_LEXICAL_INDEX_PATH")
+    rag_lexical_save_interval: float = Field(default=30.0, alias="RAG_LEXICAL_SAVE_INTERVAL")
+    # 交叉编码器重排
+    rag_rerank_enabled: bool = Field(default=False, alias="RAG_RERANK_ENABLED")
+    rag_rerank_model: str = Field(
+        default="cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        alias="RAG_RERANK_MODEL"
+    )
+    rag_rerank_candidates: int = Field(default=20, alias="RAG_RERANK_CANDIDATES")
+    rag_rerank_top_n: int = Field(default=3, alias="RAG_RERANK_TOP_N")
+    rag_rerank_budget_ms: float = Field(default=300.0, alias="RAG_RERANK_BUDGET_MS")
+    rag_rerank_cache_size: int = Field(default=10000, alias="RAG_RERANK_CACHE_SIZE")
+    # 上下文压缩：合并同一文档相邻/重叠的块，去掉向量相似度超过阈值的近似重复块（0 表示不去重），
+    # 可选只保留与问题相似度不低于 sentence_threshold 的句子
+    rag_compress_enabled: bool = Field(default=False, alias="RAG_COMPRESS_ENABLED")
+    rag_compress_dedup_threshold: float = Field(default=0.95, alias="RAG_COMPRESS_DEDUP_THRESHOLD")
+    rag_compress_extract: bool = Field(default=False, alias="RAG_COMPRESS_EXTRACT")
+    rag_compress_sentence_threshold: float = Field(default=0.5, alias="RAG_COMPRESS_SENTENCE_THRESHOLD")
+    # MMR：从 mmr_candidates 个候选中按相关性和多样性选块，边际相关性低于首个块的 mmr_min_ratio 倍时停止
+    rag_mmr_enabled: bool = Field(default=False, alias="RAG_MMR_ENABLED")
+    rag_mmr_candidates: int = Field(default=20, alias="RAG_MMR_CANDIDATES")
+    rag_mmr_lambda: float = Field(default=0.7, alias="RAG_MMR_LAMBDA")
+    rag_mmr_min_ratio: float = Field(default=0.5, alias="RAG_MMR_MIN_RATIO")
+    # 异步接口的线程隔离舱：检索和写入各用独立的有界线程池
+    rag_search_workers: int = Field(default=16, alias="RAG_SEARCH_WORKERS")
+    rag_write_workers: int = Field(default=4, alias="RAG_WRITE_WORKERS")
+
+    # 对话检索各阶段超时（秒，0 表示不限制），超时的阶段按空结果处理
+    chat_embed_timeout: float = Field(default=2.0, alias="CHAT_EMBED_TIMEOUT")
+    chat_history_timeout: float = Field(default=2.0, alias="CHAT_HISTORY_TIMEOUT")
+    chat_rag_timeout: float = Field(default=5.0, alias="CHAT_RAG_TIMEOUT")
+    chat_memory_timeout: float = Field(default=2.0, alias="CHAT_MEMORY_TIMEOUT")
+    # 流式回答检查客户端断开的间隔（秒）
+    chat_disconnect_poll_interval: float = Field(default=0.5, alias="CHAT_DISCONNECT_POLL_INTERVAL")
+    # 流式回答合并成帧的时间窗口（秒，0 表示逐块发送）和单帧字节上限
+    chat_stream_window: float = Field(default=0.03, alias="CHAT_STREAM_WINDOW")
+    chat_stream_max_bytes: int = Field(default=1024, alias="CHAT_STREAM_MAX_BYTES")
+
+    # 语义回答缓存
+    answer_cache_enabled: bool = Field(default=False, alias="ANSWER_CACHE_ENABLED")
+    answer_cache_threshold: float = Field(default=0.95, alias="ANSWER_CACHE_THRESHOLD")
+    answer_cache_max_entries: int = Field(default=10000, alias="ANSWER_CACHE_MAX_ENTRIES")
+    answer_cache_ttl: float = Field(default=86400.0, alias="ANSWER_CACHE_TTL")
+
+    # 入库流水线配置
+    ingest_chunk_workers: int = Field(default=1, alias="INGEST_CHUNK_WORKERS")
+    ingest_embed_workers: int = Field(default=1, alias="INGEST_EMBED_WORKERS")
+    ingest_insert_workers: int = Field(default=1, alias="INGEST_INSERT_WORKERS")
+    ingest_queue_size: int = Field(default=16, alias="INGEST_QUEUE_SIZE")
+    ingest_embed_batch_size: int = Field(default=64, alias="INGEST_EMBED_BATCH_SIZE")
+    ingest_insert_batch_size: int = Field(default=2000, alias="INGEST_INSERT_BATCH_SIZE")
+    ingest_insert_max_bytes: int = Field(default=16 * 1024 * 1024, alias="INGEST_INSERT_MAX_BYTES")
+    # 去重模式: off | skip | reuse
+    ingest_dedup: str = Field(default="skip", alias="INGEST_DEDUP")
+    ingest_upload_block_size: int = Field(default=256 * 1024, alias="INGEST_UPLOAD_BLOCK_SIZE")
+
+    # 多租户配置
+    tenant_shared: str = Field(default="shared", alias="TENANT_SHARED")
+    tenant_include_shared: bool = Field(default=True, alias="TENANT_INCLUDE_SHARED")
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -0,0 +1,835 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from pathlib import Path
+from app.core.config import settings
+from app.core.vector_store import (
+    VectorStore,
+    PROMOTED_FIELDS,
+    TENANT_FIELD,
+    MAX_PAGE_SIZE,
+    normalize_tenant
+)
+import numpy as np
+import threading
+import logging
+import atexit
+import pickle
+import shutil
+import time
+import os
+
+try:
+    import hnswlib
+except ImportError:  # 可选依赖，未安装时只使用精确检索
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，不做跨进程互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# 本地存储支持的索引类型
+LOCAL_INDEX_TYPES = ("AUTO", "FLAT", "HNSW")
+
+# AUTO 模式下切换到 HNSW 的行数（矩阵乘法的精确检索在这个规模以下足够快）
+LOCAL_AUTO_HNSW_MIN_ROWS = 50_000
+
+# 过滤后的候选数不超过该值时直接精确检索，比在 HNSW 图上带过滤搜索更快
+HNSW_EXACT_MAX_CANDIDATES = 4096
+
+# 持久化格式版本
+STORE_FORMAT_VERSION = 1
+
+_INITIAL_CAPACITY = 1024
+
+# 标量列（字段名 -> numpy 类型）
+_SCALAR_DTYPES = {
+    "content_hash": object,
+    "doc_id": object,
+    "doc_version": np.int64,
+    TENANT_FIELD: object,
+    **{name: (np.int64 if field_type is int else object) for name, (field_type, _) in PROMOTED_FIELDS.items()}
+}
+
+_HNSW_SPACES = {"COSINE": "cosine", "IP": "ip", "L2": "l2"}
+
+
+class _Segment:
+    """一份完整数据：向量矩阵（mmap）、标量列、文本和元数据，以及可选的 HNSW 图
+
+    槽位按写入顺序分配，主键单调递增，因此槽位顺序就是主键顺序。
+    删除只打标记，保存时空洞过多再压缩。
+    """
+
+    def __init__(self, directory: Path, dimension: int, metric_type: str):
+        self.directory = directory
+        self.dimension = dimension
+        self.metric_type = metric_type
+        self.size = 0
+        self.alive_count = 0
+        self.next_id = 1
+        self.vectors: Optional[np.memmap] = None
+        self.sq_norms = np.empty(0, dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.alive = np.empty(0, dtype=bool)
+        self.scalars: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=dtype) for name, dtype in _SCALAR_DTYPES.items()
+        }
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.slot_of: Dict[int, int] = {}
+        self.hnsw = None
+        # 每次压缩后槽位重新编号，向量和 HNSW 文件换一代新文件名，state.pkl 提交后才删除旧文件
+        self.generation = 0
+
+    @property
+    def name(self) -> str:
+        return self.directory.name
+
+    @property
+    def vectors_path(self) -> Path:
+        return self._vectors_path(self.generation)
+
+    @property
+    def hnsw_path(self) -> Path:
+        return self._hnsw_path(self.generation)
+
+    def _vectors_path(self, generation: int) -> Path:
+        return self.directory / ("vectors.npy" if not generation else f"vectors.{generation}.npy")
+
+    def _hnsw_path(self, generation: int) -> Path:
+        return self.directory / ("hnsw.bin" if not generation else f"hnsw.{generation}.bin")
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.vectors is None else len(self.vectors)
+
+    # ---- 写入 ----
+
+    def append(self, texts: List[str], vectors: np.ndarray, metadatas: List[dict], columns: Dict[str, list]) -> List[int]:
+        count = len(texts)
+        self._grow(self.size + count)
+        start, end = self.size, self.size + count
+        ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+
+        self.vectors[start:end] = vectors
+        self.sq_norms[start:end] = np.einsum("ij,ij->i", vectors, vectors)
+        self.ids[start:end] = ids
+        self.alive[start:end] = True
+        for name, values in columns.items():
+            self.scalars[name][start:end] = values
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        for slot, ext_id in enumerate(ids.tolist(), start):
+            self.slot_of[ext_id] = slot
+        if self.hnsw is not None:
+            self.hnsw.add_items(vectors, np.arange(start, end))
+
+        self.size = end
+        self.alive_count += count
+        self.next_id += count
+        return ids.tolist()
+
+    def remove(self, ids: List[int]) -> List[int]:
+        removed = []
+        for ext_id in ids:
+            slot = self.slot_of.pop(int(ext_id), None)
+            if slot is None:
+                continue
+            self.alive[slot] = False
+            if self.hnsw is not None:
+                self.hnsw.mark_deleted(slot)
+            removed.append(int(ext_id))
+        self.alive_count -= len(removed)
+        return removed
+
+    def _grow(self, required: int):
+        if required <= self.capacity:
+            return
+        capacity = max(required, self.capacity * 2, _INITIAL_CAPACITY)
+        path = self.vectors_path
+        tmp = path.with_name(path.name + ".tmp")
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(capacity, self.dimension))
+        if self.size:
+            grown[:self.size] = self.vectors[:self.size]
+        grown.flush()
+        del grown
+        self.vectors = None
+        os.replace(tmp, path)
+        self.vectors = np.load(path, mmap_mode="r+")
+
+        for name in ("sq_norms", "ids", "alive"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        for name, old in self.scalars.items():
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            if old.dtype == object:
+                new[len(old):] = ""
+            self.scalars[name] = new
+        if self.hnsw is not None:
+            self.hnsw.resize_index(capacity)
+
+    def compact(self):
+        """去掉已删除的行，重新编号槽位（主键不变）
+
+        压缩后的向量写入下一代文件，上次保存的文件保持不变，落盘前崩溃时仍能按旧 state.pkl 加载。
+        """
+        keep = np.flatnonzero(self.alive[:self.size])
+        vectors = np.array(self.vectors[keep])
+        texts = [self.texts[slot] for slot in keep]
+        metadatas = [self.metadatas[slot] for slot in keep]
+        ids = self.ids[keep]
+        scalars = {name: column[keep] for name, column in self.scalars.items()}
+        had_hnsw = self.hnsw is not None
+        next_id = self.next_id
+        generation = self.generation + 1
+
+        self.__init__(self.directory, self.dimension, self.metric_type)
+        self.next_id = next_id
+        self.generation = generation
+        if len(keep):
+            self._grow(len(keep))
+            self.vectors[:len(keep)] = vectors
+            self.sq_norms[:len(keep)] = np.einsum("ij,ij->i", vectors, vectors)
+            self.ids[:len(keep)] = ids
+            self.alive[:len(keep)] = True
+            for name, column in scalars.items():
+                self.scalars[name][:len(keep)] = column
+        self.texts, self.metadatas = texts, metadatas
+        self.size = self.alive_count = len(keep)
+        self.slot_of = {int(ext_id): slot for slot, ext_id in enumerate(ids.tolist())}
+        if had_hnsw:
+            self.build_hnsw()
+
+    # ---- HNSW ----
+
+    def build_hnsw(self):
+        index = hnswlib.Index(space=_HNSW_SPACES[self.metric_type], dim=self.dimension)
+        index.init_index(
+            max_elements=max(self.capacity, _INITIAL_CAPACITY),
+            ef_construction=settings.milvus_hnsw_ef_construction,
+            M=settings.milvus_hnsw_m
+        )
+        alive = np.flatnonzero(self.alive[:self.size])
+        if len(alive):
+            index.add_items(np.asarray(self.vectors[alive]), alive)
+        self.hnsw = index
+        logger.info(f"本地向量存储 HNSW 图构建完成: {len(alive)} 条")
+
+    # ---- 持久化 ----
+
+    def save(self):
+        self.write_state(self.snapshot())
+
+    def snapshot(self) -> dict:
+        """落盘向量矩阵和 HNSW 图，返回当前 state 的副本（需在存储的锁内调用）
+
+        文本和元数据只复制列表本身，序列化交给 write_state 在锁外完成。
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.vectors is None:
+            self._grow(1)
+        self.vectors.flush()
+        if self.hnsw is not None:
+            hnsw_tmp = self.hnsw_path.with_name(self.hnsw_path.name + ".tmp")
+            self.hnsw.save_index(str(hnsw_tmp))
+            os.replace(hnsw_tmp, self.hnsw_path)
+        return {
+            "version": STORE_FORMAT_VERSION,
+            "size": self.size,
+            "next_id": self.next_id,
+            "ids": self.ids[:self.size].copy(),
+            "alive": self.alive[:self.size].copy(),
+            "scalars": {name: column[:self.size].copy() for name, column in self.scalars.items()},
+            "texts": self.texts[:self.size],
+            "metadatas": self.metadatas[:self.size],
+            "hnsw": self.hnsw is not None,
+            "generation": self.generation,
+        }
+
+    def write_state(self, state: dict):
+        """序列化 snapshot 返回的 state 并原子替换 state.pkl，之后删除其他代的文件
+
+        耗时与数据量成正比，可以在存储的锁外调用，但多次保存之间需要按 snapshot 的顺序串行执行。
+        """
+        target = self.directory / "state.pkl"
+        tmp = target.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, target)
+
+        # state.pkl 已指向这一代文件，之前各代的文件不再需要
+        current = {self._vectors_path(state["generation"]), self._hnsw_path(state["generation"])}
+        for path in [*self.directory.glob("vectors*.npy"), *self.directory.glob("hnsw*.bin")]:
+            if path not in current:
+                path.unlink(missing_ok=True)
+
+    def load(self) -> bool:
+        target = self.directory / "state.pkl"
+        if not target.exists():
+            return False
+        with open(target, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"本地向量存储格式版本不兼容: {state.get('version')}")
+
+        # 向量文件可能包含上次保存之后写入的行，以 state 中的行数为准
+        self.generation = state.get("generation", 0)
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+        capacity = len(self.vectors)
+        size = state["size"]
+        self.size = size
+        self.next_id = state["next_id"]
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.ids[:size] = state["ids"]
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.alive[:size] = state["alive"]
+        for name, dtype in _SCALAR_DTYPES.items():
+            column = np.empty(capacity, dtype=dtype)
+            if dtype is object:
+                column[:] = ""
+            column[:size] = state["scalars"][name]
+            self.scalars[name] = column
+        self.texts = state["texts"]
+        self.metadatas = state["metadatas"]
+        self.sq_norms = np.zeros(capacity, dtype=np.float32)
+        for start in range(0, size, 65536):
+            block = np.asarray(self.vectors[start:min(start + 65536, size)])
+            self.sq_norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        alive_slots = np.flatnonzero(self.alive[:size])
+        self.slot_of = {int(self.ids[slot]): int(slot) for slot in alive_slots}
+        self.alive_count = len(alive_slots)
+
+        if state.get("hnsw") and hnswlib is not None:
+            hnsw_path = self.hnsw_path
+            if hnsw_path.exists():
+                index = hnswlib.Index(space=_HNSW_SPACES[self.metric_type], dim=self.dimension)
+                index.load_index(str(hnsw_path), max_elements=capacity)
+                if index.get_current_count() == size:
+                    self.hnsw = index
+            if self.hnsw is None:
+                self.build_hnsw()
+        return True
+
+    def close(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+
+
+class LocalVectorStore(VectorStore):
+    """进程内嵌入式向量存储
+
+    向量保存为内存映射的 float32 矩阵，检索默认用矩阵乘法精确计算（BLAS 向量化），
+    安装 hnswlib 后可选 HNSW 图近似检索。数据保存在本地目录，后台定期落盘。
+    插入、检索、删除和分页读取的语义与 MilvusClient 一致，不需要 Milvus 服务。
+    """
+
+    def __init__(self, collection_name: Optional[str] = None, path: Optional[str] = None):
+        self.collection_name = collection_name or settings.milvus_collection_name
+        self.dimension = settings.milvus_dimension
+        self.metric_type = settings.milvus_metric_type.upper()
+        root = Path(path or settings.vector_store_path)
+        if not root.is_absolute():
+            root = Path(__file__).parent.parent.parent / root
+        self.root = root / self.collection_name
+        self.index_type = settings.vector_store_index_type.upper()
+        if self.index_type not in LOCAL_INDEX_TYPES:
+            raise ValueError(f"不支持的本地索引类型: {self.index_type}，可选: {', '.join(LOCAL_INDEX_TYPES)}")
+        if self.index_type == "HNSW" and hnswlib is None:
+            logger.warning("未安装 hnswlib，本地向量存储使用精确检索（pip install hnswlib 启用 HNSW）")
+
+        self._lock = threading.RLock()
+        # 保存、压缩和整体替换串行执行；序列化 state 时只持有这把锁，不阻塞检索和写入
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._closed = threading.Event()
+
+        # 数据目录同一时间只能由一个进程打开：保存时会删除其他代的文件，两个进程同时写会互相破坏数据
+        self._lock_file = self._acquire_directory_lock()
+        self._segment = self._open_current()
+        self._apply_index_type(self._segment, self.index_type)
+        self._refresh_index_info()
+
+        self._saver = threading.Thread(target=self._autosave_loop, name="local-vector-store-saver", daemon=True)
+        self._saver.start()
+        # 本地存储是唯一的数据副本，进程正常退出时落盘
+        atexit.register(self.close)
+        logger.info(f"本地向量存储: {self.root}（{self._segment.alive_count} 条）")
+
+    # ---- 目录和索引 ----
+
+    def _acquire_directory_lock(self):
+        """对数据目录加排他的文件锁，已被其他进程持有时立即失败"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            logger.warning("当前平台不支持 fcntl，无法阻止多个进程同时打开本地向量存储")
+            return None
+        lock_file = open(self.root / "LOCK", "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.seek(0)
+            owner = lock_file.read().strip() or "未知"
+            lock_file.close()
+            raise RuntimeError(
+                f"本地向量存储 {self.root} 已被其他进程（pid {owner}）打开，"
+                f"请先停止该进程（例如 API 服务）再执行"
+            )
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        return lock_file
+
+    def _open_current(self) -> _Segment:
+        """打开 CURRENT 指向的数据目录，不存在时新建"""
+        current = self.root / "CURRENT"
+        if current.exists():
+            segment = _Segment(self.root / current.read_text().strip(), self.dimension, self.metric_type)
+            if segment.load():
+                return segment
+        segment = self._new_segment()
+        segment.save()
+        self._set_current(segment)
+        return segment
+
+    def _new_segment(self) -> _Segment:
+        directory = self.root / f"g{int(time.time() * 1000)}"
+        directory.mkdir(parents=True, exist_ok=False)
+        return _Segment(directory, self.dimension, self.metric_type)
+
+    def _set_current(self, segment: _Segment):
+        tmp = self.root / "CURRENT.tmp"
+        tmp.write_text(segment.name)
+        os.replace(tmp, self.root / "CURRENT")
+
+    def _apply_index_type(self, segment: _Segment, index_type: str):
+        """按索引类型构建或丢弃 HNSW 图"""
+        want_hnsw = hnswlib is not None and (
+            index_type == "HNSW"
+            or (index_type == "AUTO" and segment.alive_count >= LOCAL_AUTO_HNSW_MIN_ROWS)
+        )
+        if want_hnsw and segment.hnsw is None:
+            segment.build_hnsw()
+        elif not want_hnsw:
+            segment.hnsw = None
+
+    def _refresh_index_info(self):
+        segment = self._segment
+        if segment.hnsw is not None:
+            self.index_params = {
+                "metric_type": self.metric_type,
+                "index_type": "HNSW",
+                "params": {"M": settings.milvus_hnsw_m, "efConstruction": settings.milvus_hnsw_ef_construction}
+            }
+        else:
+            self.index_params = {"metric_type": self.metric_type, "index_type": "FLAT", "params": {}}
+        self.physical_collection = self.physical_name()
+
+    def physical_name(self) -> str:
+        return f"{self.collection_name}/{self._segment.name}"
+
+    # ---- 写入 ----
+
+    def insert(self, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> List[int]:
+        """插入文档向量，返回自动生成的主键"""
+        if len(texts) != len(vectors) or len(texts) != len(metadatas):
+            raise ValueError("文本、向量和元数据数量必须一致")
+        if not texts:
+            return []
+        matrix = self._as_matrix(vectors)
+        columns = self.scalar_columns(texts, metadatas)
+        with self._lock:
+            ids = self._segment.append(list(texts), matrix, list(metadatas), columns)
+            self._dirty = True
+        logger.info(f"已插入 {len(texts)} 条文档")
+        return ids
+
+    def _as_matrix(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[1] != self.dimension:
+            raise ValueError(f"向量维度必须为 {self.dimension}，收到: {matrix.shape}")
+        return matrix
+
+    def delete(self, ids: List[int]):
+        """删除文档"""
+        if not ids:
+            logger.warning("没有提供要删除的文档ID")
+            return
+        with self._lock:
+            removed = self._segment.remove(ids)
+            self._dirty = True
+        logger.info(f"已删除 {len(removed)} 条文档")
+
+    def delete_by_doc(self, doc_id: str, tenant: Optional[str] = None) -> List[int]:
+        """删除租户内某个文档的全部文档块，返回被删除的 id"""
+        ids = [row["id"] for row in self.query_by_doc(doc_id, ["id"], tenant)]
+        self.delete(ids)
+        return ids
+
+    def purge_tenant(self, tenant: str) -> List[int]:
+        """删除租户的全部数据，返回被删除的 id"""
+        tenant = normalize_tenant(tenant)
+        with self._lock:
+            segment = self._segment
+            mask = self._mask(segment, None, [tenant])
+            ids = segment.ids[:segment.size][mask].tolist()
+            if ids:
+                segment.remove(ids)
+                self._dirty = True
+        logger.info(f"已清空租户 '{tenant}' 的 {len(ids)} 个文档块")
+        return ids
+
+    def bulk_load(
+        self,
+        batches: Iterable[Tuple[List[str], List[List[float]], List[dict]]],
+        index_type: Optional[str] = None,
+        expected_rows: int = 0,
+        workers: int = 1
+    ) -> dict:
+        """写入新的数据目录，完成后切换 CURRENT 并删除旧目录"""
+        started = time.time()
+        index_type = (index_type or self.index_type).upper()
+        if index_type not in LOCAL_INDEX_TYPES:
+            # Milvus 的 IVF 类索引在本地存储中没有对应实现
+            index_type = "AUTO"
+        segment = self._new_segment()
+        try:
+            for texts, vectors, metadatas in batches:
+                segment.append(list(texts), self._as_matrix(vectors), list(metadatas), self.scalar_columns(texts, metadatas))
+            self._apply_index_type(segment, index_type)
+            segment.save()
+        except Exception:
+            logger.error(f"批量导入失败，删除目录 '{segment.directory}'")
+            segment.close()
+            shutil.rmtree(segment.directory, ignore_errors=True)
+            raise
+
+        # 等待进行中的保存完成后再切换，旧目录删除时不会有保存还在写入
+        with self._save_lock, self._lock:
+            old = self._segment
+            self._set_current(segment)
+            self._segment = segment
+            self._refresh_index_info()
+            self._dirty = False
+        old.close()
+        shutil.rmtree(old.directory, ignore_errors=True)
+
+        elapsed = time.time() - started
+        logger.info(f"批量导入完成: {segment.alive_count} 条 -> {segment.directory}，耗时 {elapsed:.1f}s")
+        return {
+            "collection_name": self.collection_name,
+            "physical_collection": self.physical_collection,
+            "index": self.index_params,
+            "total_documents": segment.alive_count,
+            "elapsed_seconds": round(elapsed, 2)
+        }
+
+    # ---- 检索 ----
+
+    def _mask(self, segment: _Segment, filters: Optional[Dict[str, Any]], tenants: Optional[List[str]]) -> np.ndarray:
+        """满足过滤条件和租户范围的存活行"""
+        size = segment.size
+        mask = segment.alive[:size].copy()
+        for field_name, op, value in self.parse_filters(filters):
+            column = segment.scalars[field_name][:size]
+            if op == "==":
+                mask &= column == value
+            elif op == "in":
+                mask &= np.isin(column, value)
+            elif op == ">":
+                mask &= column > value
+            elif op == ">=":
+                mask &= column >= value
+            elif op == "<":
+                mask &= column < value
+            else:
+                mask &= column <= value
+        if tenants:
+            mask &= np.isin(segment.scalars[TENANT_FIELD][:size], [normalize_tenant(t) for t in tenants])
+        return mask
+
+    def _distances(self, segment: _Segment, query: np.ndarray, slots: Optional[np.ndarray]) -> np.ndarray:
+        """精确计算距离（COSINE / IP 越大越相似，L2 为平方欧氏距离）"""
+        if slots is None:
+            matrix, sq_norms = segment.vectors[:segment.size], segment.sq_norms[:segment.size]
+        else:
+            matrix, sq_norms = segment.vectors[slots], segment.sq_norms[slots]
+        dots = matrix @ query
+        if self.metric_type == "COSINE":
+            norms = np.sqrt(sq_norms) * np.linalg.norm(query)
+            return dots / np.where(norms == 0, 1.0, norms)
+        if self.metric_type == "IP":
+            return dots
+        return np.maximum(sq_norms - 2 * dots + float(query @ query), 0.0)
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        tenants: Optional[List[str]] = None
+    ) -> List[dict]:
+        """向量相似度搜索（过滤后的候选少时直接精确检索）"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        larger_is_closer = self.metric_type in ("COSINE", "IP")
+        with self._lock:
+            segment = self._segment
+            if not segment.alive_count:
+                return []
+            scoped = bool(filters or tenants)
+            mask = self._mask(segment, filters, tenants)
+            candidates = int(mask.sum())
+            if candidates == 0:
+                return []
+            top_k = min(top_k, candidates)
+
+            slots = None
+            if segment.hnsw is not None and candidates > HNSW_EXACT_MAX_CANDIDATES:
+                slots = self._hnsw_search(segment, query, top_k, mask if scoped else None)
+            if slots is not None:
+                distances = self._distances(segment, query, slots)
+            else:
+                if candidates < segment.size // 2:
+                    slots = np.flatnonzero(mask)
+                    distances = self._distances(segment, query, slots)
+                else:
+                    slots = np.arange(segment.size)
+                    distances = self._distances(segment, query, None)
+                    distances = np.where(mask, distances, -np.inf if larger_is_closer else np.inf)
+                keys = -distances if larger_is_closer else distances
+                if len(keys) > top_k:
+                    top = np.argpartition(keys, top_k - 1)[:top_k]
+                    slots, distances = slots[top], distances[top]
+
+            order = np.argsort(-distances if larger_is_closer else distances, kind="stable")
+            return [
+                {
+                    "id": int(segment.ids[slot]),
+                    "text": segment.texts[slot],
+                    "metadata": segment.metadatas[slot],
+                    "distance": float(distances[i]),
+                    "score": self.distance_to_score(float(distances[i]))
+                }
+                for i, slot in ((i, int(slots[i])) for i in order)
+            ]
+
+    def _hnsw_search(self, segment: _Segment, query: np.ndarray, top_k: int, mask: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """在 HNSW 图上检索候选槽位，失败时返回 None 改用精确检索"""
+        segment.hnsw.set_ef(max(top_k, settings.milvus_hnsw_ef))
+        try:
+            if mask is None:
+                labels, _ = segment.hnsw.knn_query(query, k=top_k)
+            else:
+                labels, _ = segment.hnsw.knn_query(query, k=top_k, filter=lambda slot: bool(mask[slot]))
+        except RuntimeError:
+            # 过滤条件太严格时图上可能找不到足够的邻居
+            return None
+        return labels[0].astype(np.int64)
+
+    def get_by_ids(
+        self,
+        ids: List[int],
+        with_vectors: bool = False,
+        filters: Optional[Dict[str, Any]] = None,
+        tenants: Optional[List[str]] = None
+    ) -> List[dict]:
+        """按主键批量读取文档块（可附加过滤条件和租户范围）"""
+        if not ids:
+            return []
+        output_fields = ["id", "text", "metadata"] + (["vector"] if with_vectors else [])
+        with self._lock:
+            segment = self._segment
+            mask = self._mask(segment, filters, tenants) if (filters or tenants) else segment.alive[:segment.size]
+            slots = [segment.slot_of.get(int(ext_id)) for ext_id in ids]
+            return [self._row(segment, slot, output_fields) for slot in slots if slot is not None and mask[slot]]
+
+    def find_by_hashes(
+        self,
+        hashes: List[str],
+        with_vectors: bool = False,
+        tenant: Optional[str] = None
+    ) -> Dict[str, dict]:
+        """在某个租户内按内容哈希批量查找已存在的文档块，返回 {hash: {"id", "vector", "doc_ids"}}"""
+        if not hashes:
+            return {}
+        with self._lock:
+            segment = self._segment
+            mask = self._mask(segment, None, [normalize_tenant(tenant)])
+            mask &= np.isin(segment.scalars["content_hash"][:segment.size], list(set(hashes)))
+            found = {}
+            for slot in np.flatnonzero(mask):
+                stored = found.setdefault(segment.scalars["content_hash"][slot], {
+                    "id": int(segment.ids[slot]),
+                    "vector": segment.vectors[slot].tolist() if with_vectors else None,
+                    "doc_ids": set()
+                })
+                if segment.scalars["doc_id"][slot]:
+                    stored["doc_ids"].add(segment.scalars["doc_id"][slot])
+            return found
+
+    def query_by_doc(self, doc_id: str, output_fields: List[str], tenant: Optional[str] = None) -> List[dict]:
+        """取出租户内某个文档的全部文档块"""
+        with self._lock:
+            segment = self._segment
+            mask = self._mask(segment, None, [normalize_tenant(tenant)])
+            mask &= segment.scalars["doc_id"][:segment.size] == doc_id
+            return [self._row(segment, slot, output_fields) for slot in np.flatnonzero(mask)]
+
+    def _row(self, segment: _Segment, slot: int, output_fields: List[str]) -> dict:
+        row = {}
+        for field_name in output_fields:
+            if field_name == "id":
+                row["id"] = int(segment.ids[slot])
+            elif field_name == "text":
+                row["text"] = segment.texts[slot]
+            elif field_name == "metadata":
+                row["metadata"] = segment.metadatas[slot]
+            elif field_name == "vector":
+                row["vector"] = segment.vectors[slot].tolist()
+            else:
+                value = segment.scalars[field_name][slot]
+                row[field_name] = int(value) if isinstance(value, np.integer) else value
+        return row
+
+    def export_pages(
+        self,
+        cursor: Optional[int] = None,
+        with_vectors: bool = False,
+        page_size: int = 1000,
+        tenant: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[List[dict]]:
+        """从游标（上一页最后一个主键）之后按主键顺序分页读取文档块"""
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"page_size 需要在 1 ~ {MAX_PAGE_SIZE} 之间")
+        tenants = [normalize_tenant(tenant)] if tenant else None
+        return self._iter_pages(cursor, with_vectors, page_size, tenants, limit)
+
+    def _iter_pages(self, cursor, with_vectors, page_size, tenants, limit) -> Iterator[List[dict]]:
+        output_fields = ["id", "text", "metadata"] + (["vector"] if with_vectors else [])
+        remaining = limit if limit is not None else float("inf")
+        last_id = cursor if cursor is not None else 0
+        while remaining > 0:
+            # 每页单独加锁并按主键定位，两页之间的写入和压缩不影响游标
+            with self._lock:
+                segment = self._segment
+                start = int(np.searchsorted(segment.ids[:segment.size], last_id, side="right"))
+                mask = self._mask(segment, None, tenants)[start:]
+                slots = start + np.flatnonzero(mask)[:int(min(page_size, remaining))]
+                page = [self._row(segment, int(slot), output_fields) for slot in slots]
+            if not page:
+                return
+            remaining -= len(page)
+            last_id = page[-1]["id"]
+            yield page
+
+    def query_all(self, limit: int = 1000, cursor: Optional[int] = None) -> List[dict]:
+        """按主键顺序读取一页文档（从游标之后开始）"""
+        formatted_results = []
+        for page in self.export_pages(cursor, page_size=min(limit, MAX_PAGE_SIZE), limit=limit):
+            for result in page:
+                formatted_results.append({
+                    "id": str(result["id"]),
+                    "text": result["text"],
+                    "metadata": result["metadata"],
+                })
+        logger.info(f"查询到 {len(formatted_results)} 条文档")
+        return formatted_results
+
+    def tenant_stats(self, tenant: str) -> dict:
+        """单个租户的文档块数和文档数"""
+        tenant = normalize_tenant(tenant)
+        with self._lock:
+            segment = self._segment
+            mask = self._mask(segment, None, [tenant])
+            doc_ids = set(segment.scalars["doc_id"][:segment.size][mask].tolist()) - {""}
+            return {"tenant": tenant, "chunks": int(mask.sum()), "documents": len(doc_ids)}
+
+    def count(self) -> int:
+        return self._segment.alive_count
+
+    def get_stats(self) -> dict:
+        """获取集合统计信息"""
+        return {
+            "collection_name": self.collection_name,
+            "total_documents": self.count(),
+            "index_type": self.index_params.get("index_type"),
+            "backend": "local",
+            "path": str(self._segment.directory)
+        }
+
+    # ---- 运维 ----
+
+    def rebuild_index(self, index_type: Optional[str] = None, batch_size: int = 2000) -> dict:
+        """压缩已删除的行并按索引类型重建 HNSW 图（主键不变）"""
+        started = time.time()
+        index_type = (index_type or self.index_type).upper()
+        if index_type not in LOCAL_INDEX_TYPES:
+            raise ValueError(f"不支持的本地索引类型: {index_type}，可选: {', '.join(LOCAL_INDEX_TYPES)}")
+        with self._save_lock, self._lock:
+            segment = self._segment
+            segment.hnsw = None
+            segment.compact()
+            self._apply_index_type(segment, index_type)
+            segment.save()
+            self._dirty = False
+            self._refresh_index_info()
+        elapsed = time.time() - started
+        return {
+            "collection_name": self.collection_name,
+            "physical_collection": self.physical_collection,
+            "index": self.index_params,
+            "total_documents": segment.alive_count,
+            "elapsed_seconds": round(elapsed, 2)
+        }
+
+    def flush(self):
+        """落盘（删除过多时先压缩）
+
+        锁内只做压缩、构建 HNSW 图、落盘向量和复制 state，文本和元数据的序列化在锁外进行。
+        """
+        with self._save_lock:
+            with self._lock:
+                segment = self._segment
+                if segment.size and segment.alive_count < segment.size * 0.7:
+                    segment.compact()
+                if self.index_type == "AUTO" and segment.hnsw is None:
+                    self._apply_index_type(segment, "AUTO")
+                    self._refresh_index_info()
+                state = segment.snapshot()
+                self._dirty = False
+            try:
+                segment.write_state(state)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _autosave_loop(self):
+        while not self._closed.wait(timeout=settings.vector_store_save_interval):
+            if not self._dirty:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"本地向量存储保存失败: {e}", exc_info=True)
+
+    def close(self):
+        """停止后台保存并落盘"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._dirty:
+            self.flush()
+        self._segment.close()
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
@@ -8,37 +8,144 @@ from pymilvus import (
 )
 
 
-from typing import List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from app.core.config import settings
+from app.core.vector_store import (
+    VectorStore,
+    PROMOTED_FIELDS,
+    TENANT_FIELD,
+    MAX_PAGE_SIZE,
+    normalize_tenant
+)
+import itertools
+import threading
 import logging
+import json
+import math
+import time
 
 logger = logging.getLogger(__name__)
 
 
-class MilvusClient:
+# 支持的向量索引类型
+INDEX_TYPES = ("FLAT", "IVF_FLAT", "IVF_SQ8", "IVF_PQ", "HNSW")
+
+# AUTO 模式下的分档阈值（按实体数量）
+AUTO_FLAT_MAX_ENTITIES = 10_000
+AUTO_HNSW_MAX_ENTITIES = 2_000_000
+AUTO_IVF_SQ8_MAX_ENTITIES = 20_000_000
+
+# 写入可见性策略
+#   strong   每次写入后 flush，立即落盘可见（最慢，产生大量小 segment）
+#   bounded  不显式 flush，依赖 Milvus 一致性级别保证可见
+#   periodic 后台定时或累计行数达到阈值时 flush
+WRITE_VISIBILITY_MODES = ("strong", "bounded", "periodic")
+
+# 标量字段索引（字段名 -> 索引类型）
+SCALAR_INDEXES = {
+    "content_hash": "INVERTED",
+    "doc_id": "INVERTED",
+    "source": "INVERTED",
+    "filename": "INVERTED",
+    "topic": "INVERTED",
+    "created_at": "STL_SORT",
+}
+
+# 按 content_hash 批量查询时每批的数量
+HASH_LOOKUP_BATCH_SIZE = 1000
+
+# 连接池中第一个连接沿用 pymilvus 的默认别名（utility 等管理操作使用该连接）
+DEFAULT_ALIAS = "default"
+
+
+class MilvusClient(VectorStore):
     """Milvus 向量数据库客户端"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        collection_name: Optional[str] = None,
+        write_visibility: Optional[str] = None
+    ):
         self.host = settings.milvus_host
         self.port = settings.milvus_port
-        self.collection_name = settings.milvus_collection_name
+        self.collection_name = collection_name or settings.milvus_collection_name
         self.dimension = settings.milvus_dimension
+        self.metric_type = settings.milvus_metric_type.upper()
         self.collection: Optional[Collection] = None
+        self.index_params: dict = {}
+        # 连接池：每个别名一条独立的 gRPC 通道，检索和查询轮流使用
+        self.pool_size = max(1, settings.milvus_pool_size)
+        self.timeout = settings.milvus_timeout or None
+        self._aliases: List[str] = []
+        self._read_collections: List[Collection] = []
+        self._read_counter = itertools.count()
+        self._index_checked_at = 0.0
+        # 重建索引期间阻塞本进程的写入，搜索不受影响
+        self._write_lock = threading.RLock()
+
+        # 写入可见性策略
+        self.write_visibility = (write_visibility or settings.milvus_write_visibility).lower()
+        if self.write_visibility not in WRITE_VISIBILITY_MODES:
+            raise ValueError(
+                f"不支持的写入可见性策略: {self.write_visibility}，可选: {', '.join(WRITE_VISIBILITY_MODES)}"
+            )
+        self._pending_rows = 0
+        self._flush_wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
         self._connect()
         self._ensure_collection()
+
+        if self.write_visibility == "periodic":
+            self._flusher = threading.Thread(
+                target=self._flush_loop,
+                name=f"milvus-flusher-{self.collection_name}",
+                daemon=True
+            )
+            self._flusher.start()
     
     def _connect(self):
-        """连接 Milvus"""
+        """连接 Milvus（按连接池大小建立多个连接别名）"""
         try:
-            connections.connect(
-                alias="default",
-                host=self.host,
-                port=self.port
-            )
-            logger.info(f"已连接到 Milvus: {self.host}:{self.port}")
+            self._aliases = [DEFAULT_ALIAS] + [
+                f"{DEFAULT_ALIAS}-pool-{i}" for i in range(1, self.pool_size)
+            ]
+            for alias in self._aliases:
+                connections.connect(
+                    alias=alias,
+                    host=self.host,
+                    port=self.port
+                )
+            logger.info(f"已连接到 Milvus: {self.host}:{self.port}（连接数 {self.pool_size}）")
         except Exception as e:
             logger.error(f"连接 Milvus 失败: {e}")
             raise
+
+    def _build_schema(self) -> CollectionSchema:
+        """集合 schema（一旦创建不可修改）"""
+        fields = [
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
+            FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=self.dimension),
+            FieldSchema(name="metadata", dtype=DataType.JSON),
+            # 文档块内容哈希，用于入库去重
+            FieldSchema(name="content_hash", dtype=DataType.VARCHAR, max_length=64),
+            # 所属文档及版本，用于按文档增量更新和删除
+            FieldSchema(name="doc_id", dtype=DataType.VARCHAR, max_length=256),
+            FieldSchema(name="doc_version", dtype=DataType.INT64),
+            # 租户作为 partition key，同一租户的数据落在同一批分区，检索时只扫描相关分区
+            FieldSchema(name=TENANT_FIELD, dtype=DataType.VARCHAR, max_length=128, is_partition_key=True),
+        ]
+        # 从 metadata 提升出来的标量字段，可在检索时直接过滤
+        for field_name, (field_type, max_length) in PROMOTED_FIELDS.items():
+            if field_type is int:
+                fields.append(FieldSchema(name=field_name, dtype=DataType.INT64))
+            else:
+                fields.append(FieldSchema(name=field_name, dtype=DataType.VARCHAR, max_length=max_length))
+        return CollectionSchema(fields, "知识库集合")
     
     def _ensure_collection(self):
         """确保集合存在，不存在则创建"""
@@ -46,80 +153,387 @@ class MilvusClient:
             self.collection = Collection(self.collection_name)
             logger.info(f"集合 '{self.collection_name}' 已存在")
         else:
-            # 创建集合
-            # 一张集合模版
-            # 一旦创建不可修改
-            fields = [
-                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-                FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-                FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=self.dimension),
-                FieldSchema(name="metadata", dtype=DataType.JSON),
-            ]
-            schema = CollectionSchema(fields, "知识库集合")
-            self.collection = Collection(self.collection_name, schema)
-            
-            # 创建索引
-            index_params = {
-                "metric_type": "COSINE",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 1024}
-            }
-            self.collection.create_index("vector", index_params)
-            logger.info(f"已创建集合 '{self.collection_name}'")
+            # 物理集合带版本后缀，通过别名对外提供服务，
+            # 这样重建索引时只需切换别名，不会中断检索
+            physical_name = self._new_physical_name()
+            collection = self._create_collection(physical_name)
+            collection.create_index("vector", self.build_index_params(settings.milvus_index_type, 0))
+            self._create_scalar_indexes(collection)
+            utility.create_alias(physical_name, self.collection_name)
+            self.collection = Collection(self.collection_name)
+            logger.info(f"已创建集合 '{physical_name}'（别名 '{self.collection_name}'）")
         
         # 加载集合到内存
         self.collection.load()
+        self._bind_read_collections()
+        self._refresh_index_info()
+
+        # 旧集合可能缺少新增的标量字段，相关功能自动降级
+        self.field_names = {field.name for field in self.collection.schema.fields}
+        missing = [field.name for field in self._build_schema().fields if field.name not in self.field_names]
+        if missing:
+            logger.warning(
+                f"集合 '{self.collection_name}' 缺少字段 {missing}，相关功能不可用；"
+                f"执行 `python manage.py rebuild-index-offline` 可迁移到最新 schema"
+            )
+
+        recommended = self.build_index_params("AUTO", self.collection.num_entities)
+        if (
+            settings.milvus_index_type.upper() == "AUTO"
+            and recommended["index_type"] != self.index_params.get("index_type")
+        ):
+            logger.warning(
+                f"当前索引 {self.index_params.get('index_type')} 与数据规模不匹配，"
+                f"建议执行 `python manage.py rebuild-index-offline` 切换为 {recommended['index_type']}"
+            )
+
+    def _bind_read_collections(self):
+        """为连接池中的每个连接创建集合句柄（通过别名访问，切换物理集合后重新绑定）"""
+        self._read_collections = [self.collection] + [
+            Collection(self.collection_name, using=alias) for alias in self._aliases[1:]
+        ]
+
+    def _reader(self) -> Collection:
+        """轮流取一个连接上的集合句柄，分散并发的检索和查询"""
+        collections = self._read_collections or [self.collection]
+        return collections[next(self._read_counter) % len(collections)]
+
+    def _create_collection(self, physical_name: str) -> Collection:
+        """按最新 schema 创建物理集合"""
+        return Collection(
+            physical_name,
+            self._build_schema(),
+            num_partitions=settings.milvus_num_partitions
+        )
+
+    def _create_scalar_indexes(self, collection: Collection):
+        """为标量字段创建索引，加速过滤和按值查找"""
+        for field_name, index_type in SCALAR_INDEXES.items():
+            collection.create_index(field_name, {"index_type": index_type}, index_name=f"idx_{field_name}")
+
+    def _new_physical_name(self) -> str:
+        """生成新的物理集合名称"""
+        return f"{self.collection_name}_{int(time.time() * 1000)}"
+
+    def _refresh_index_info(self):
+        """读取集合上实际存在的索引参数（检索参数以它为准）"""
+        indexes = [index for index in self.collection.indexes if index.field_name == "vector"]
+        if indexes:
+            params = dict(indexes[0].params)
+            # 兼容不同版本返回的 params 格式
+            if isinstance(params.get("params"), str):
+                params["params"] = json.loads(params["params"])
+            self.index_params = params
+        else:
+            self.index_params = {}
+        self.physical_collection = self.physical_name()
+        self._index_checked_at = time.monotonic()
+
+    def build_index_params(self, index_type: str, num_entities: int) -> dict:
+        """根据配置（或数据规模）构建索引参数"""
+        index_type = (index_type or "AUTO").upper()
+        if index_type == "AUTO":
+            return self._auto_index_params(num_entities)
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}，可选: AUTO, {', '.join(INDEX_TYPES)}")
+
+        if index_type == "FLAT":
+            params = {}
+        elif index_type == "HNSW":
+            params = {
+                "M": settings.milvus_hnsw_m,
+                "efConstruction": settings.milvus_hnsw_ef_construction
+            }
+        elif index_type == "IVF_PQ":
+            params = {"nlist": settings.milvus_nlist, "m": self._pq_m(settings.milvus_pq_m)}
+        else:
+            params = {"nlist": settings.milvus_nlist}
+
+        return {
+            "metric_type": self.metric_type,
+            "index_type": index_type,
+            "params": params
+        }
+
+    def _auto_index_params(self, num_entities: int) -> dict:
+        """按实体数量自动选择索引"""
+        if num_entities < AUTO_FLAT_MAX_ENTITIES:
+            # 小数据集：暴力检索最准，速度也足够
+            index_type, params = "FLAT", {}
+        elif num_entities < AUTO_HNSW_MAX_ENTITIES:
+            # 中等规模：HNSW 召回高、延迟低，内存可接受
+            index_type, params = "HNSW", {"M": 16, "efConstruction": 200}
+        else:
+            # 大规模：IVF 量化索引控制内存，nlist 取 4*sqrt(n)
+            nlist = int(min(65536, max(1024, 4 * math.sqrt(num_entities))))
+            if num_entities < AUTO_IVF_SQ8_MAX_ENTITIES:
+                index_type, params = "IVF_SQ8", {"nlist": nlist}
+            else:
+                index_type, params = "IVF_PQ", {"nlist": nlist, "m": self._pq_m(self.dimension // 8)}
+
+        return {
+            "metric_type": self.metric_type,
+            "index_type": index_type,
+            "params": params
+        }
+
+    def _pq_m(self, m: int) -> int:
+        """IVF_PQ 的 m 必须整除向量维度，取不超过 m 的最大约数"""
+        m = max(1, min(m, self.dimension))
+        while self.dimension % m != 0:
+            m -= 1
+        return m
+
+    def _search_params(self, top_k: int) -> dict:
+        """根据实际索引类型构建检索参数"""
+        index_type = self.index_params.get("index_type", "FLAT")
+        build_params = self.index_params.get("params", {}) or {}
+        auto = settings.milvus_index_type.upper() == "AUTO"
+
+        if index_type == "HNSW":
+            # ef 必须不小于 top_k
+            ef = max(top_k, 64 if auto else settings.milvus_hnsw_ef)
+            params = {"ef": ef}
+        elif index_type.startswith("IVF"):
+            nlist = int(build_params.get("nlist", settings.milvus_nlist))
+            nprobe = max(8, nlist // 32) if auto else settings.milvus_nprobe
+            params = {"nprobe": min(nprobe, nlist)}
+        else:
+            params = {}
+
+        return {
+            "metric_type": self.index_params.get("metric_type", self.metric_type),
+            "params": params
+        }
     
-    def insert(self, texts: List[str], vectors: List[List[float]], metadatas: List[dict]):
-        """插入文档向量"""
+    def insert(self, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> List[int]:
+        """插入文档向量，返回自动生成的主键"""
         if len(texts) != len(vectors) or len(texts) != len(metadatas):
             raise ValueError("文本、向量和元数据数量必须一致")
         
-        # # 准备数据，按照字段顺序
-        # data = []
-        # for text, vector, metadata in zip(texts, vectors, metadatas):
-        #     data.append({
-        #         text,
-        #         vector,
-        #        metadata
-        #     })
-
-            # Milvus 按列格式插入数据（列表的列表）
-
-        # 不需要插入id
-        data = [
-            texts,      # 所有文本的列表
-            vectors,    # 所有向量的列表（列表的列表）
-            metadatas   # 所有元数据的列表
-        ]
+        data = self._build_insert_data(self.collection, texts, vectors, metadatas)
         
-        self.collection.insert(data)
-        # 将内存中的数据写入磁盘
-        # flush() = “现在就把插入的数据真正存下来”
-        # 决定数据是否能被索引 & 稳定查询
-        # 不要每条数据都 flush，批量更好
-        self.collection.flush()
+        with self._write_lock:
+            result = self.collection.insert(data, timeout=self.timeout)
+        self._after_write(len(texts))
         logger.info(f"已插入 {len(texts)} 条文档")
+        return list(result.primary_keys)
     
-    def search(self, query_vector: List[float], top_k: int = 5) -> List[dict]:
-        """向量相似度搜索"""
-        # search_params = {
-        #     "metric_type": "L2",
-        #     "params": {"nprobe": 10}
-        # }
-        # 余弦相似度
-        search_params = {
-            "metric_type": "COSINE",
-            "params": {"nprobe": 10}
+    def _build_insert_data(
+        self,
+        collection: Collection,
+        texts: List[str],
+        vectors: List[List[float]],
+        metadatas: List[dict]
+    ) -> list:
+        """按集合 schema 的字段顺序组织列数据（不需要插入 id）"""
+        columns = {
+            "text": texts,          # 所有文本的列表
+            "vector": vectors,      # 所有向量的列表（列表的列表）
+            "metadata": metadatas,  # 所有元数据的列表
+            **self.scalar_columns(texts, metadatas)
         }
+        # Milvus 按列格式插入数据（列表的列表），旧集合没有的字段直接忽略
+        return [
+            columns[field.name]
+            for field in collection.schema.fields
+            if not field.auto_id
+        ]
+    
+    def find_by_hashes(
+        self,
+        hashes: List[str],
+        with_vectors: bool = False,
+        tenant: Optional[str] = None
+    ) -> Dict[str, dict]:
+        """在某个租户内按内容哈希批量查找已存在的文档块，返回 {hash: {"id", "vector", "doc_ids"}}"""
+        if not hashes or "content_hash" not in self.field_names:
+            return {}
+        tenant_expr = self.tenant_expr([normalize_tenant(tenant)])
+
+        output_fields = ["id", "content_hash"] + (["vector"] if with_vectors else [])
+        if "doc_id" in self.field_names:
+            output_fields.append("doc_id")
+        unique_hashes = list(dict.fromkeys(hashes))
+        found = {}
+        for start in range(0, len(unique_hashes), HASH_LOOKUP_BATCH_SIZE):
+            batch = unique_hashes[start:start + HASH_LOOKUP_BATCH_SIZE]
+            results = self._reader().query(
+                expr=self._and_expr(f"content_hash in {json.dumps(batch)}", tenant_expr),
+                output_fields=output_fields,
+                **self._read_kwargs()
+            )
+            for row in results:
+                stored = found.setdefault(row["content_hash"], {
+                    "id": row["id"],
+                    "vector": row.get("vector"),
+                    "doc_ids": set()
+                })
+                if row.get("doc_id") is not None:
+                    stored["doc_ids"].add(row["doc_id"])
+        return found
+
+    def build_filter_expr(self, filters: Optional[Dict[str, Any]]) -> str:
+        """把过滤条件转换为 Milvus 表达式"""
+        clauses = []
+        for field_name, op, value in self.parse_filters(filters):
+            self._require_field(field_name)
+            if op == "in":
+                clauses.append(f"{field_name} in [{', '.join(self._expr_literal(v) for v in value)}]")
+            else:
+                clauses.append(f"{field_name} {op} {self._expr_literal(value)}")
+        return " and ".join(clauses)
+
+    def validate_scope(self, filters: Optional[Dict[str, Any]], tenants: Optional[List[str]]):
+        """旧集合缺少过滤或租户字段时同样视为不合法"""
+        self.build_filter_expr(filters)
+        self.tenant_expr(tenants)
+
+    def tenant_expr(self, tenants: Optional[List[str]]) -> str:
+        """租户范围表达式（命中 partition key，Milvus 只扫描这些租户所在的分区）
+
+        旧集合没有租户字段时全部数据都属于共享租户，只查共享租户等价于不过滤。
+        """
+        if not tenants:
+            return ""
+        tenants = list(dict.fromkeys(normalize_tenant(tenant) for tenant in tenants))
+        if TENANT_FIELD not in self.field_names:
+            if tenants == [settings.tenant_shared]:
+                return ""
+            self._require_field(TENANT_FIELD)
+        if len(tenants) == 1:
+            return f"{TENANT_FIELD} == {json.dumps(tenants[0], ensure_ascii=False)}"
+        return f"{TENANT_FIELD} in {json.dumps(tenants, ensure_ascii=False)}"
+
+    @staticmethod
+    def _and_expr(*exprs: str) -> str:
+        """用 and 连接非空的表达式"""
+        exprs = [expr for expr in exprs if expr]
+        if len(exprs) <= 1:
+            return exprs[0] if exprs else ""
+        return " and ".join(f"({expr})" for expr in exprs)
+
+    @staticmethod
+    def _expr_literal(value: Any) -> str:
+        """表达式字面量（字符串统一转义）"""
+        if isinstance(value, int):
+            return str(value)
+        return json.dumps(value, ensure_ascii=False)
+
+    def query_by_doc(self, doc_id: str, output_fields: List[str], tenant: Optional[str] = None) -> List[dict]:
+        """取出租户内某个文档的全部文档块"""
+        self._require_field("doc_id")
+        expr = self._and_expr(f"doc_id == {json.dumps(doc_id)}", self.tenant_expr([normalize_tenant(tenant)]))
+        return self._query_all_matching(expr, output_fields)
+
+    def delete_by_doc(self, doc_id: str, tenant: Optional[str] = None) -> List[int]:
+        """删除租户内某个文档的全部文档块，返回被删除的 id"""
+        ids = [row["id"] for row in self.query_by_doc(doc_id, ["id"], tenant)]
+        self.delete(ids)
+        return ids
+
+    def _require_field(self, field_name: str):
+        if field_name not in self.field_names:
+            raise ValueError(
+                f"集合 '{self.collection_name}' 缺少字段 {field_name}，"
+                f"请执行 `python manage.py rebuild-index-offline` 迁移到最新 schema"
+            )
+
+    def _query_all_matching(self, expr: str, output_fields: List[str], batch_size: int = 1000) -> List[dict]:
+        """取出满足条件的全部数据（不受 query 的 limit 上限限制）"""
+        rows = []
+        for batch in self.iter_entities(expr, output_fields, batch_size):
+            rows.extend(batch)
+        return rows
+
+    def iter_entities(
+        self,
+        expr: str,
+        output_fields: List[str],
+        batch_size: int = 1000,
+        limit: Optional[int] = None
+    ) -> Iterator[List[dict]]:
+        """用查询迭代器按主键顺序分批读取数据（内存占用只与批大小有关）"""
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size,
+            limit=limit if limit is not None else -1,
+            expr=expr,
+            output_fields=output_fields,
+            **self._consistency_kwargs()
+        )
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                yield batch
+        finally:
+            iterator.close()
+
+    def export_pages(
+        self,
+        cursor: Optional[int] = None,
+        with_vectors: bool = False,
+        page_size: int = 1000,
+        tenant: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[List[dict]]:
+        """从游标（上一页最后一个主键）之后按主键顺序分页读取文档块"""
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"page_size 需要在 1 ~ {MAX_PAGE_SIZE} 之间")
+        expr = self._and_expr(
+            f"id > {int(cursor)}" if cursor is not None else "",
+            self.tenant_expr([tenant]) if tenant else ""
+        )
+        output_fields = ["id", "text", "metadata"] + (["vector"] if with_vectors else [])
+        return self.iter_entities(expr, output_fields, batch_size=page_size, limit=limit)
+
+    def get_by_ids(
+        self,
+        ids: List[int],
+        with_vectors: bool = False,
+        filters: Optional[Dict[str, Any]] = None,
+        tenants: Optional[List[str]] = None
+    ) -> List[dict]:
+        """按主键批量读取文档块（可附加过滤条件和租户范围）"""
+        if not ids:
+            return []
+        output_fields = ["id", "text", "metadata"] + (["vector"] if with_vectors else [])
+        expr = self._and_expr(
+            f"id in [{','.join(str(int(i)) for i in ids)}]",
+            self.build_filter_expr(filters),
+            self.tenant_expr(tenants)
+        )
+        return self._reader().query(
+            expr=expr,
+            output_fields=output_fields,
+            **self._read_kwargs()
+        )
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        tenants: Optional[List[str]] = None
+    ) -> List[dict]:
+        """向量相似度搜索（过滤条件和租户范围下推到 Milvus expr）"""
+        # 索引可能被其他进程重建，定期刷新索引信息
+        if time.monotonic() - self._index_checked_at > 60:
+            self._refresh_index_info()
+
+        search_params = self._search_params(top_k)
+        expr = self._and_expr(self.build_filter_expr(filters), self.tenant_expr(tenants)) or None
 
         
-        results = self.collection.search(
+        results = self._reader().search(
             data=[query_vector], # 根据向量查询
             anns_field="vector", # 向量字段
             param=search_params, # 查询参数
             limit=top_k, # 返回结果数量
-            output_fields=["text", "metadata"] # 返回字段 text 文本 metadata 元数据
+            expr=expr, # 标量过滤条件
+            output_fields=["text", "metadata"], # 返回字段 text 文本 metadata 元数据
+            **self._read_kwargs()
         )
 
         
@@ -133,34 +547,189 @@ class MilvusClient:
                     "text": hit.entity.get("text"), # 命中记录的文本
                     "metadata": hit.entity.get("metadata"), # 命中记录的元数据
                     "distance": hit.distance, # 默然存在       
-                    "score": 1 / (1 + hit.distance)  # 转换为相似度分数
+                    "score": self.distance_to_score(hit.distance)  # 转换为相似度分数
                 })
         
         return formatted_results
 
+    def _consistency_kwargs(self) -> dict:
+        """非 strong 模式下检索使用配置的一致性级别，未 flush 的数据同样可见"""
+        if self.write_visibility == "strong":
+            return {}
+        return {"consistency_level": settings.milvus_consistency_level}
 
-        
+    def _read_kwargs(self) -> dict:
+        """检索和查询的公共参数：一致性级别 + 单次调用超时"""
+        return {**self._consistency_kwargs(), "timeout": self.timeout}
+
+    def rebuild_index(self, index_type: Optional[str] = None, batch_size: int = 2000) -> dict:
+        """离线重建索引：运行前必须停止所有写入（包括其他进程中的 API 服务）
+
+        新建影子集合并按新索引构建，数据复制完成后切换别名并删除旧集合，切换前检索始终走旧集合。
+        写锁只挡住本进程的写入：其他进程在最后一次追平之后写入的数据会随旧集合一起删除，
+        复制期间的删除也不会同步到新集合。自增主键会重新分配，词法索引需要重建。
+        """
+        index_type = index_type or settings.milvus_index_type
+        started = time.time()
+
+        with self._write_lock:
+            old_physical = self.physical_name()
+            self.flush()
+            num_entities = self.collection.num_entities
+            index_params = self.build_index_params(index_type, num_entities)
+            logger.info(f"开始重建索引: {self.index_params.get('index_type')} -> {index_params['index_type']}，共 {num_entities} 条")
+
+            shadow_name = self._new_physical_name()
+            shadow = self._create_collection(shadow_name)
+            try:
+                last_id = self._copy_entities(self.collection, shadow, batch_size)
+                shadow.flush()
+                # 数据写入后再建索引，IVF 类索引可以用全量数据训练
+                shadow.create_index("vector", index_params)
+                self._create_scalar_indexes(shadow)
+                shadow.load()
+
+                # 追平复制期间写入旧集合的数据
+                last_id = self._copy_entities(self.collection, shadow, batch_size, min_id=last_id)
+                shadow.flush()
+            except Exception:
+                logger.error(f"重建索引失败，删除影子集合 '{shadow_name}'")
+                utility.drop_collection(shadow_name)
+                raise
+
+            self._switch_to(shadow, old_physical)
 
-    def query_all(self,limit :int = 1000) -> List[dict]:
-        """查询所有文档"""
+        elapsed = time.time() - started
+        logger.info(f"索引重建完成: {shadow_name}，耗时 {elapsed:.1f}s")
+        return {
+            "collection_name": self.collection_name,
+            "physical_collection": shadow_name,
+            "index": self.index_params,
+            "total_documents": self.collection.num_entities,
+            "elapsed_seconds": round(elapsed, 2)
+        }
+
+    def bulk_load(
+        self,
+        batches: Iterable[Tuple[List[str], List[List[float]], List[dict]]],
+        index_type: Optional[str] = None,
+        expected_rows: int = 0,
+        workers: int = 1
+    ) -> dict:
+        """把 (texts, vectors, metadatas) 批次整体写入新的物理集合并替换当前集合
 
+        用于从快照恢复：数据全部写入后再建索引，最后切换别名并删除旧集合。
+        """
+        started = time.time()
+        with self._write_lock:
+            old_physical = self.physical_name()
+            shadow_name = self._new_physical_name()
+            shadow = self._create_collection(shadow_name)
+            rows = 0
+            try:
+                # 读取下一批的同时写入前几批，最多 workers * 2 个批次在途
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="milvus-bulk-load") as executor:
+                    pending = deque()
+                    for texts, vectors, metadatas in batches:
+                        pending.append(executor.submit(
+                            shadow.insert, self._build_insert_data(shadow, texts, vectors, metadatas)
+                        ))
+                        rows += len(texts)
+                        while len(pending) > workers * 2:
+                            pending.popleft().result()
+                    while pending:
+                        pending.popleft().result()
+                shadow.flush()
+                index_params = self.build_index_params(index_type or settings.milvus_index_type, expected_rows or rows)
+                shadow.create_index("vector", index_params)
+                self._create_scalar_indexes(shadow)
+                shadow.load()
+            except Exception:
+                logger.error(f"批量导入失败，删除集合 '{shadow_name}'")
+                utility.drop_collection(shadow_name)
+                raise
 
-        results = self.collection.query(
-            expr="id >= 0",
-            output_fields=["text", "metadata","id"],
-            limit=limit
+            self._switch_to(shadow, old_physical)
+
+        elapsed = time.time() - started
+        logger.info(f"批量导入完成: {rows} 条 -> {shadow_name}，耗时 {elapsed:.1f}s")
+        return {
+            "collection_name": self.collection_name,
+            "physical_collection": shadow_name,
+            "index": self.index_params,
+            "total_documents": rows,
+            "elapsed_seconds": round(elapsed, 2)
+        }
+
+    def _switch_to(self, shadow: Collection, old_physical: str):
+        """把别名切换到新的物理集合并删除旧集合"""
+        if old_physical == self.collection_name:
+            # 旧版本直接使用了物理集合名，需要先删除才能创建同名别名，期间有短暂不可用
+            logger.warning(f"集合 '{self.collection_name}' 不是别名，切换期间会短暂不可用")
+            self.collection = shadow
+            utility.drop_collection(old_physical)
+            utility.create_alias(shadow.name, self.collection_name)
+        else:
+            utility.alter_alias(shadow.name, self.collection_name)
+            utility.drop_collection(old_physical)
+
+        self.collection = Collection(self.collection_name)
+        self._bind_read_collections()
+        self._refresh_index_info()
+        self.field_names = {field.name for field in self.collection.schema.fields}
+
+    def physical_name(self) -> str:
+        """别名背后的物理集合名称"""
+        if self.collection_name in utility.list_collections():
+            return self.collection_name
+        for name in utility.list_collections():
+            if self.collection_name in utility.list_aliases(name):
+                return name
+        return self.collection_name
+
+    def _copy_entities(self, source: Collection, target: Collection, batch_size: int, min_id: int = -1) -> int:
+        """按主键顺序把 source 中 id > min_id 的数据复制到 target，返回最后一个 id"""
+        iterator = source.query_iterator(
+            batch_size=batch_size,
+            expr=f"id > {min_id}",
+            output_fields=["id", "text", "vector", "metadata"],
+            # 追平时要读到刚写入的数据
+            consistency_level="Strong"
         )
+        copied = 0
+        last_id = min_id
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                target.insert(self._build_insert_data(
+                    target,
+                    [row["text"] for row in batch],
+                    [row["vector"] for row in batch],
+                    [row.get("metadata") or {} for row in batch]
+                ))
+                last_id = max(last_id, max(row["id"] for row in batch))
+                copied += len(batch)
+        finally:
+            iterator.close()
+        logger.info(f"已复制 {copied} 条数据到 '{target.name}'")
+        return last_id
+
+
+        
+
+    def query_all(self, limit: int = 1000, cursor: Optional[int] = None) -> List[dict]:
+        """按主键顺序读取一页文档（从游标之后开始）"""
         formatted_results = []
-        logger.info(f"查询到 {len(results)} 条文档")
-        logger.info(f"results: {results}")
-
-        for result in results:
-            formatted_results.append({
-                "id": str(result.get("id")),
-                "text": result.get("text",""),
-                "metadata": result.get("metadata",{}),
-            })
-        logger.info(f"formatted_results: {formatted_results}")
+        for page in self.export_pages(cursor, page_size=min(limit, MAX_PAGE_SIZE), limit=limit):
+            for result in page:
+                formatted_results.append({
+                    "id": str(result.get("id")),
+                    "text": result.get("text",""),
+                    "metadata": result.get("metadata",{}),
+                })
+        logger.info(f"查询到 {len(formatted_results)} 条文档")
     
         return formatted_results
     
@@ -176,18 +745,99 @@ class MilvusClient:
         ids_str = ",".join(str(id) for id in ids)
         expr = f"id in [{ids_str}]"
         logger.info(f"删除表达式: {expr}")
-        self.collection.delete(expr)
-        
-        # 将内存中的数据写入磁盘
-        self.collection.flush()
+        with self._write_lock:
+            self.collection.delete(expr, timeout=self.timeout)
+        self._after_write(len(ids))
         logger.info(f"已删除 {len(ids)} 条文档")
+
+    def _after_write(self, rows: int):
+        """按写入可见性策略决定是否 flush"""
+        if self.write_visibility == "strong":
+            # 将内存中的数据写入磁盘
+            # flush() = “现在就把插入的数据真正存下来”
+            # 每次都 flush 会封存大量小 segment，批量写入时建议使用 periodic
+            self.flush()
+        elif self.write_visibility == "periodic":
+            with self._write_lock:
+                self._pending_rows += rows
+                if self._pending_rows >= settings.milvus_flush_rows:
+                    self._flush_wakeup.set()
+
+    def flush(self):
+        """封存 segment 并落盘"""
+        with self._write_lock:
+            self.collection.flush()
+            self._pending_rows = 0
+
+    def _flush_loop(self):
+        """后台 flush：到达时间间隔或累计行数阈值时执行"""
+        while not self._closed.is_set():
+            self._flush_wakeup.wait(timeout=settings.milvus_flush_interval)
+            self._flush_wakeup.clear()
+            if self._pending_rows == 0:
+                continue
+            try:
+                pending = self._pending_rows
+                self.flush()
+                logger.info(f"后台 flush 完成: {pending} 行")
+            except Exception as e:
+                logger.error(f"后台 flush 失败: {e}", exc_info=True)
+
+    def close(self):
+        """停止后台 flush 并落盘剩余数据"""
+        self._closed.set()
+        self._flush_wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        if self._pending_rows:
+            self.flush()
+        # 默认连接可能被 utility 等其他代码使用，只断开连接池额外建立的连接
+        for alias in self._aliases[1:]:
+            connections.disconnect(alias)
+        self._read_collections = []
     
 
 
+    def count(self) -> int:
+        """实体数量（num_entities 只统计已 flush 的数据）"""
+        if self.write_visibility == "strong":
+            return self.collection.num_entities
+        result = self._reader().query(expr="", output_fields=["count(*)"], **self._read_kwargs())
+        return int(result[0]["count(*)"]) if result else 0
+
+    def tenant_stats(self, tenant: str) -> dict:
+        """单个租户的文档块数和文档数"""
+        expr = self.tenant_expr([tenant])
+        result = self._reader().query(expr=expr, output_fields=["count(*)"], **self._read_kwargs())
+        chunks = int(result[0]["count(*)"]) if result else 0
+        doc_ids = set()
+        if "doc_id" in self.field_names:
+            for batch in self.iter_entities(expr, ["doc_id"], batch_size=5000):
+                doc_ids.update(row["doc_id"] for row in batch if row["doc_id"])
+        return {"tenant": normalize_tenant(tenant), "chunks": chunks, "documents": len(doc_ids)}
+
+    def purge_tenant(self, tenant: str) -> List[int]:
+        """删除租户的全部数据，返回被删除的 id"""
+        tenant = normalize_tenant(tenant)
+        expr = self.tenant_expr([tenant])
+        if not expr:
+            raise ValueError("旧集合没有租户字段，不能按租户清空，请先执行 `python manage.py rebuild-index-offline`")
+        ids = [row["id"] for row in self._query_all_matching(expr, ["id"], batch_size=5000)]
+        if ids:
+            with self._write_lock:
+                # 按 partition key 表达式删除，不需要把所有 id 拼进表达式
+                self.collection.delete(expr, timeout=self.timeout)
+            self._after_write(len(ids))
+        logger.info(f"已清空租户 '{tenant}' 的 {len(ids)} 个文档块")
+        return ids
+
     def get_stats(self) -> dict:
         """获取集合统计信息"""
-        stats = self.collection.num_entities
+        stats = self.count()
         return {
             "collection_name": self.collection_name,
-            "total_documents": stats
-        }
\ No newline at end of file
+            "total_documents": stats,
+            "index_type": self.index_params.get("index_type"),
+            "write_visibility": self.write_visibility
+        }
@@ -0,0 +1,277 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.text_processor import content_hash
+import numpy as np
+import re
+
+
+# 向量存储后端
+#   milvus  Milvus 服务（默认）
+#   local   进程内嵌入式存储，数据保存在本地目录，适合单机小规模部署、测试和基准
+VECTOR_STORE_BACKENDS = ("milvus", "local")
+
+# 从 metadata 提升为标量列的字段（字段名 -> (类型, VARCHAR 最大长度)），检索时可作为过滤条件
+PROMOTED_FIELDS = {
+    "source": (str, 128),
+    "filename": (str, 512),
+    "topic": (str, 128),
+    "created_at": (int, None),  # Unix 时间戳（秒）
+}
+
+# 允许在检索过滤中使用的字段
+FILTERABLE_FIELDS = ("doc_id",) + tuple(PROMOTED_FIELDS)
+
+# 范围过滤操作符
+RANGE_OPERATORS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+# 租户字段，检索按租户限定范围
+TENANT_FIELD = "tenant"
+_TENANT_RE = re.compile(r"^[A-Za-z0-9_\-.:@]{1,128}$")
+
+# 分页读取时单页最大行数（Milvus 单次查询的结果窗口上限）
+MAX_PAGE_SIZE = 16384
+
+
+def normalize_tenant(tenant: Optional[str]) -> str:
+    """校验租户名称，未指定时归入共享租户"""
+    if tenant is None or tenant == "":
+        return settings.tenant_shared
+    if not _TENANT_RE.match(tenant):
+        raise ValueError(f"非法的租户名称: {tenant!r}（只允许字母、数字和 _-.:@，最长 128）")
+    return tenant
+
+
+def _promoted_value(field_name: str, value: Any):
+    """把 metadata 中的值转换为标量列的值，缺失或无法转换时使用空值"""
+    field_type, max_length = PROMOTED_FIELDS[field_name]
+    if field_type is int:
+        try:
+            return int(value or 0)
+        except (TypeError, ValueError):
+            return 0
+    return str(value or "")[:max_length]
+
+
+class VectorStore(ABC):
+    """向量存储接口
+
+    各后端的插入、检索、删除、分页读取语义保持一致：
+    主键自动生成且单调递增，search 返回的 distance 含义与度量方式一致（COSINE / IP 越大越相似，L2 越小越相似）。
+    """
+
+    collection_name: str
+    dimension: int
+    metric_type: str
+    index_params: dict
+    # 当前数据所在的物理位置，数据被整体替换（主键重新分配）时会变化
+    physical_collection: str
+
+    # ---- 写入 ----
+
+    @abstractmethod
+    def insert(self, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> List[int]:
+        """插入文档向量，返回自动生成的主键"""
+
+    @abstractmethod
+    def delete(self, ids: List[int]):
+        """按主键删除"""
+
+    @abstractmethod
+    def delete_by_doc(self, doc_id: str, tenant: Optional[str] = None) -> List[int]:
+        """删除租户内某个文档的全部文档块，返回被删除的 id"""
+
+    @abstractmethod
+    def purge_tenant(self, tenant: str) -> List[int]:
+        """删除租户的全部数据，返回被删除的 id"""
+
+    @abstractmethod
+    def bulk_load(
+        self,
+        batches: Iterable[Tuple[List[str], List[List[float]], List[dict]]],
+        index_type: Optional[str] = None,
+        expected_rows: int = 0,
+        workers: int = 1
+    ) -> dict:
+        """用 (texts, vectors, metadatas) 批次整体替换当前数据"""
+
+    # ---- 读取 ----
+
+    @abstractmethod
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        tenants: Optional[List[str]] = None
+    ) -> List[dict]:
+        """向量相似度搜索，返回 [{"id", "text", "metadata", "distance", "score"}]"""
+
+    @abstractmethod
+    def get_by_ids(
+        self,
+        ids: List[int],
+        with_vectors: bool = False,
+        filters: Optional[Dict[str, Any]] = None,
+        tenants: Optional[List[str]] = None
+    ) -> List[dict]:
+        """按主键批量读取文档块"""
+
+    @abstractmethod
+    def find_by_hashes(
+        self,
+        hashes: List[str],
+        with_vectors: bool = False,
+        tenant: Optional[str] = None
+    ) -> Dict[str, dict]:
+        """在某个租户内按内容哈希查找已存在的文档块
+
+        返回 {hash: {"id", "vector", "doc_ids"}}，id / vector 取其中一个块，doc_ids 为包含该内容的全部文档。
+        """
+
+    @abstractmethod
+    def query_by_doc(self, doc_id: str, output_fields: List[str], tenant: Optional[str] = None) -> List[dict]:
+        """取出租户内某个文档的全部文档块"""
+
+    @abstractmethod
+    def export_pages(
+        self,
+        cursor: Optional[int] = None,
+        with_vectors: bool = False,
+        page_size: int = 1000,
+        tenant: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[List[dict]]:
+        """从游标（上一页最后一个主键）之后按主键顺序分页读取 id / text / metadata (/ vector)"""
+
+    @abstractmethod
+    def query_all(self, limit: int = 1000, cursor: Optional[int] = None) -> List[dict]:
+        """按主键顺序读取一页文档（id 转为字符串）"""
+
+    @abstractmethod
+    def tenant_stats(self, tenant: str) -> dict:
+        """单个租户的文档块数和文档数"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """实体数量"""
+
+    @abstractmethod
+    def get_stats(self) -> dict:
+        """统计信息"""
+
+    # ---- 运维 ----
+
+    @abstractmethod
+    def rebuild_index(self, index_type: Optional[str] = None, batch_size: int = 2000) -> dict:
+        """重建向量索引"""
+
+    @abstractmethod
+    def physical_name(self) -> str:
+        """当前数据所在的物理位置"""
+
+    @abstractmethod
+    def flush(self):
+        """落盘"""
+
+    @abstractmethod
+    def close(self):
+        """停止后台任务并落盘"""
+
+    # ---- 各后端共用的实现 ----
+
+    def parse_filters(self, filters: Optional[Dict[str, Any]]) -> List[Tuple[str, str, Any]]:
+        """校验过滤条件并转换为 [(字段, 操作符, 值)]
+
+        值为标量表示等于，列表表示 in，字典表示范围（gt / gte / lt / lte）。
+        """
+        if not filters:
+            return []
+        clauses = []
+        for field_name, value in filters.items():
+            if field_name not in FILTERABLE_FIELDS:
+                raise ValueError(f"不支持的过滤字段: {field_name}，可选: {', '.join(FILTERABLE_FIELDS)}")
+            if isinstance(value, dict):
+                unknown = set(value) - set(RANGE_OPERATORS)
+                if unknown:
+                    raise ValueError(f"不支持的范围操作符: {sorted(unknown)}，可选: {', '.join(RANGE_OPERATORS)}")
+                for op, bound in value.items():
+                    clauses.append((field_name, RANGE_OPERATORS[op], self._filter_value(field_name, bound)))
+            elif isinstance(value, (list, tuple)):
+                if not value:
+                    raise ValueError(f"过滤字段 {field_name} 的取值列表不能为空")
+                clauses.append((field_name, "in", [self._filter_value(field_name, v) for v in value]))
+            else:
+                clauses.append((field_name, "==", self._filter_value(field_name, value)))
+        return clauses
+
+    def _filter_value(self, field_name: str, value: Any):
+        """按字段类型转换过滤值"""
+        if field_name in PROMOTED_FIELDS and PROMOTED_FIELDS[field_name][0] is int:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"过滤字段 {field_name} 需要数值，收到: {value!r}")
+            return int(value)
+        return str(value)
+
+    def validate_scope(self, filters: Optional[Dict[str, Any]], tenants: Optional[List[str]]):
+        """检索前校验过滤条件和租户范围，不合法时抛出 ValueError"""
+        self.parse_filters(filters)
+        for tenant in tenants or []:
+            normalize_tenant(tenant)
+
+    def scalar_columns(self, texts: List[str], metadatas: List[dict]) -> Dict[str, list]:
+        """由文本和 metadata 派生的标量列"""
+        columns = {
+            "content_hash": [content_hash(text) for text in texts],
+            "doc_id": [metadata.get("doc_id", "") for metadata in metadatas],
+            "doc_version": [int(metadata.get("doc_version", 0)) for metadata in metadatas],
+            TENANT_FIELD: [normalize_tenant(metadata.get(TENANT_FIELD)) for metadata in metadatas],
+        }
+        for field_name in PROMOTED_FIELDS:
+            columns[field_name] = [
+                _promoted_value(field_name, metadata.get(field_name))
+                for metadata in metadatas
+            ]
+        return columns
+
+    def compute_distances(self, query_vector: List[float], vectors: List[List[float]]) -> List[float]:
+        """按度量方式计算距离（与 search 返回的 distance 含义一致）"""
+        if len(vectors) == 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        metric = self.index_params.get("metric_type", self.metric_type)
+        if metric == "COSINE":
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+            distances = matrix @ query / np.where(norms == 0, 1.0, norms)
+        elif metric == "IP":
+            distances = matrix @ query
+        else:
+            distances = ((matrix - query) ** 2).sum(axis=1)
+        return distances.tolist()
+
+    def distance_to_score(self, distance: float) -> float:
+        """把 distance 转换为 [0, 1] 的相似度分数
+
+        不同度量方式换算到同一尺度（向量归一化时都等于余弦相似度），
+        相似度阈值的含义不随 metric_type 变化：
+        COSINE / IP 的 distance 本身就是相似度；L2 为平方欧氏距离，单位向量上 cos = 1 - d² / 2。
+        """
+        metric = self.index_params.get("metric_type", self.metric_type)
+        if metric in ("COSINE", "IP"):
+            similarity = distance
+        else:
+            similarity = 1 - distance / 2
+        return min(max(float(similarity), 0.0), 1.0)
+
+
+def create_vector_store(collection_name: Optional[str] = None, backend: Optional[str] = None) -> VectorStore:
+    """按配置创建向量存储"""
+    backend = (backend or settings.vector_store_backend).lower()
+    if backend == "milvus":
+        from app.core.milvus_client import MilvusClient
+        return MilvusClient(collection_name=collection_name)
+    if backend == "local":
+        from app.core.local_vector_store import LocalVectorStore
+        return LocalVectorStore(collection_name=collection_name)
+    raise ValueError(f"不支持的向量存储后端: {backend}，可选: {', '.join(VECTOR_STORE_BACKENDS)}")
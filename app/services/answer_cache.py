@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.text_processor import content_hash
+import numpy as np
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """语义回答缓存
+
+    条目按检索上下文指纹分组，新问题只与上下文相同的已回答问题比较向量相似度，
+    相似度达到阈值时直接返回缓存的回答，跳过 LLM 生成。
+    知识库版本变化时整体失效；使用了个人记忆的对话不读写缓存。
+    """
+
+    def __init__(self):
+        self.enabled = settings.answer_cache_enabled
+        self.threshold = settings.answer_cache_threshold
+        self.max_entries = settings.answer_cache_max_entries
+        self.ttl = settings.answer_cache_ttl
+
+        # 指纹 -> [(单位化查询向量, 回答, 写入时间)]，按最近使用排序
+        self._groups: "OrderedDict[str, List[Tuple[np.ndarray, str, float]]]" = OrderedDict()
+        self._entries = 0
+        self._kb_version = None
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "invalidations": 0}
+
+    @staticmethod
+    def fingerprint(results: List[Dict], scope: str = "") -> str:
+        """检索上下文指纹：检索范围 + 命中文档块（id 和内容）"""
+        parts = [scope] + [f"{r.get('id')}:{content_hash(r['text'])}" for r in results]
+        return content_hash("\n".join(parts))
+
+    def bypass(self):
+        """记录一次不走缓存的请求"""
+        if self.enabled:
+            with self._lock:
+                self.stats["bypassed"] += 1
+
+    def lookup(self, query_vector: List[float], fingerprint: str, kb_version) -> Optional[str]:
+        """查找语义相近且检索上下文相同的已缓存回答"""
+        if not self.enabled:
+            return None
+        query = self._unit(query_vector)
+        now = time.time()
+        with self._lock:
+            self.stats["lookups"] += 1
+            self._check_version(kb_version)
+            entries = self._groups.get(fingerprint)
+            if entries:
+                fresh = [entry for entry in entries if now - entry[2] <= self.ttl]
+                self._entries -= len(entries) - len(fresh)
+                entries[:] = fresh
+            if entries:
+                similarities = np.stack([entry[0] for entry in entries]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._groups.move_to_end(fingerprint)
+                    self.stats["hits"] += 1
+                    logger.info(f"语义缓存命中: 相似度 {similarities[best]:.4f}")
+                    return entries[best][1]
+            elif entries is not None:
+                del self._groups[fingerprint]
+            self.stats["misses"] += 1
+        return None
+
+    def store(self, query_vector: List[float], fingerprint: str, kb_version, answer: str):
+        """缓存回答（空回答不缓存）"""
+        if not self.enabled or not answer:
+            return
+        query = self._unit(query_vector)
+        with self._lock:
+            self._check_version(kb_version)
+            group = self._groups.setdefault(fingerprint, [])
+            group.append((query, answer, time.time()))
+            self._groups.move_to_end(fingerprint)
+            self._entries += 1
+            self.stats["stores"] += 1
+            while self._entries > self.max_entries and self._groups:
+                _, evicted = self._groups.popitem(last=False)
+                self._entries -= len(evicted)
+
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self._clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            entries = self._entries
+        served = stats["hits"] + stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            **stats,
+            "hit_rate": round(stats["hits"] / served, 4) if served else 0.0
+        }
+
+    def _check_version(self, kb_version):
+        """知识库变化后缓存的回答可能过时，整体失效"""
+        if kb_version != self._kb_version:
+            if self._entries:
+                self._clear()
+            self._kb_version = kb_version
+
+    def _clear(self):
+        if self._entries:
+            self.stats["invalidations"] += 1
+            logger.info(f"语义缓存失效: 清除 {self._entries} 条")
+        self._groups.clear()
+        self._entries = 0
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# 全局语义回答缓存实例
+answer_cache = AnswerCache()
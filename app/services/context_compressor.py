@@ -0,0 +1,275 @@
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.vector_store import TENANT_FIELD
+from app.services.embedding_service import embedding_service
+import numpy as np
+import threading
+import logging
+import math
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# 没有相邻序号时，两个文档块首尾至少重叠这么多字符才认为是连续的文本
+MIN_OVERLAP_CHARS = 20
+# 句子切分：保留句末标点
+_SENTENCE_RE = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]*")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文每字约一个 token，其余字符约四个一个"""
+    cjk = len(_CJK_RE.findall(text))
+    others = len(text) - cjk - text.count(" ") - text.count("\n")
+    return cjk + math.ceil(max(others, 0) / 4)
+
+
+def _overlap(left: str, right: str) -> int:
+    """left 的结尾与 right 的开头重叠的最大字符数（不足 MIN_OVERLAP_CHARS 时返回 0）"""
+    probe = right[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = left.find(probe)
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _doc_key(result: Dict) -> Optional[tuple]:
+    metadata = result.get("metadata") or {}
+    if metadata.get("doc_id") is None:
+        return None
+    return metadata.get(TENANT_FIELD), metadata["doc_id"]
+
+
+class ContextCompressor:
+    """检索结果的上下文压缩
+
+    在检索结果送进提示词之前：
+    1. 去掉近似重复的文档块（重复上传的同一内容等）：与排名更靠前的其他文档的块向量相似度超过阈值时丢弃
+    2. 合并同一文档中相邻或首尾重叠的块（分块时相邻块有 chunk_overlap 个字符的重叠），重叠部分只保留一份
+    3. 可选：每个块只保留与问题相关的句子
+    按估算的 token 数统计每次请求节省的提示词长度。
+    """
+
+    def __init__(self):
+        self.dedup_threshold = settings.rag_compress_dedup_threshold
+        self.extract = settings.rag_compress_extract
+        self.sentence_threshold = settings.rag_compress_sentence_threshold
+
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "chunks_in": 0,
+            "chunks_out": 0,
+            "merged": 0,
+            "deduplicated": 0,
+            "sentences_dropped": 0,
+            "tokens_in": 0,
+            "tokens_out": 0
+        }
+
+    def compress(
+        self,
+        query_vector: List[float],
+        results: List[Dict],
+        vector_store,
+        vectors: Optional[Dict[int, List[float]]] = None
+    ) -> List[Dict]:
+        """压缩检索结果，返回新的结果列表（顺序按各组中排名最靠前的块）
+
+        vectors 为已经读取的文档块向量（id → 向量），缺少时从向量存储读取。
+        """
+        if not results:
+            return results
+        started = time.perf_counter()
+        tokens_in = sum(estimate_tokens(r["text"]) for r in results)
+        counts = {"merged": 0, "deduplicated": 0, "sentences_dropped": 0}
+
+        compressed = results
+        if self.dedup_threshold and len(compressed) > 1:
+            compressed = self._deduplicate(compressed, vector_store, vectors, counts)
+        if len(compressed) > 1:
+            compressed = self._merge_adjacent(compressed, counts)
+        if self.extract and query_vector is not None:
+            compressed = self._extract_sentences(query_vector, compressed, counts)
+
+        tokens_out = sum(estimate_tokens(r["text"]) for r in compressed)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["chunks_in"] += len(results)
+            self.stats["chunks_out"] += len(compressed)
+            self.stats["tokens_in"] += tokens_in
+            self.stats["tokens_out"] += tokens_out
+            for key, value in counts.items():
+                self.stats[key] += value
+        logger.info(
+            f"上下文压缩: {len(results)} → {len(compressed)} 个块, 约 {tokens_in} → {tokens_out} tokens"
+            f"（节省 {tokens_in - tokens_out}）, 合并 {counts['merged']}, 去重 {counts['deduplicated']}, "
+            f"删除句子 {counts['sentences_dropped']}, 耗时 {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        return compressed
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            requests = self.stats["requests"]
+            saved = self.stats["tokens_in"] - self.stats["tokens_out"]
+            return {
+                **self.stats,
+                "tokens_saved": saved,
+                "avg_tokens_saved": round(saved / requests, 1) if requests else 0.0,
+                "saved_ratio": round(saved / self.stats["tokens_in"], 4) if self.stats["tokens_in"] else 0.0
+            }
+
+    def _deduplicate(
+        self,
+        results: List[Dict],
+        vector_store,
+        vectors: Optional[Dict[int, List[float]]],
+        counts: dict
+    ) -> List[Dict]:
+        """按排名依次保留，与已保留的其他文档的块向量过于相似时丢弃（同一文档的块交给合并处理）"""
+        if vectors is None or any(r["id"] not in vectors for r in results):
+            try:
+                rows = vector_store.get_by_ids([r["id"] for r in results], with_vectors=True)
+            except Exception as e:
+                logger.warning(f"读取文档块向量失败，跳过去重: {e}")
+                return results
+            vectors = {row["id"]: row["vector"] for row in rows}
+
+        kept: List[Dict] = []
+        kept_vectors: List[np.ndarray] = []
+        kept_docs: List[Optional[tuple]] = []
+        for r in results:
+            vector = vectors.get(r["id"])
+            if vector is None:
+                kept.append(r)
+                continue
+            vector = np.asarray(vector, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            doc = _doc_key(r)
+            duplicate = any(
+                (doc is None or doc != kept_doc) and float(vector @ kept_vector) >= self.dedup_threshold
+                for kept_vector, kept_doc in zip(kept_vectors, kept_docs)
+            )
+            if duplicate:
+                counts["deduplicated"] += 1
+                continue
+            kept.append(r)
+            kept_vectors.append(vector)
+            kept_docs.append(doc)
+        return kept
+
+    def _merge_adjacent(self, results: List[Dict], counts: dict) -> List[Dict]:
+        """合并同一文档中相邻或首尾重叠的块
+
+        同一版本中 chunk_index 相邻的块直接拼接（去掉重叠部分）；
+        没有序号或版本不同的块（增量更新时未变化的块保留旧序号）只有文本首尾重叠时才合并。
+        """
+        groups: Dict[tuple, List[int]] = {}
+        for i, r in enumerate(results):
+            doc = _doc_key(r)
+            if doc is not None:
+                groups.setdefault(doc, []).append(i)
+
+        # 每个结果所在的合并组：位置 → 该组按文档顺序排列的成员
+        runs_at: Dict[int, List[Dict]] = {}
+        absorbed = set()
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            ordered = sorted(members, key=lambda i: self._position(results[i]))
+            run = [ordered[0]]
+            text = results[ordered[0]]["text"]
+            for i in ordered[1:] + [None]:
+                joined = self._join(results[run[-1]], text, results[i]) if i is not None else None
+                if joined is not None:
+                    run.append(i)
+                    text = joined
+                    continue
+                if len(run) > 1:
+                    best = min(run)
+                    runs_at[best] = [results[j] for j in run] + [text]
+                    absorbed.update(j for j in run if j != best)
+                    counts["merged"] += len(run) - 1
+                if i is not None:
+                    run = [i]
+                    text = results[i]["text"]
+
+        merged = []
+        for i, r in enumerate(results):
+            if i in absorbed:
+                continue
+            if i in runs_at:
+                *members, text = runs_at[i]
+                r = {
+                    **r,
+                    "text": text,
+                    "score": max(m["score"] for m in members),
+                    "metadata": members[0].get("metadata"),
+                    "merged_ids": [m["id"] for m in members]
+                }
+            merged.append(r)
+        return merged
+
+    @staticmethod
+    def _position(result: Dict) -> tuple:
+        metadata = result.get("metadata") or {}
+        index = metadata.get("chunk_index")
+        return (index is None, index if index is not None else 0)
+
+    @staticmethod
+    def _join(previous: Dict, text: str, current: Dict) -> Optional[str]:
+        """能把 current 接到已合并的 text 后面时返回拼接后的文本，否则返回 None"""
+        following = current["text"]
+        if following in text:
+            return text
+        overlap = _overlap(text, following)
+        if overlap:
+            return text + following[overlap:]
+        before = previous.get("metadata") or {}
+        after = current.get("metadata") or {}
+        if (
+            before.get("chunk_index") is not None
+            and after.get("chunk_index") == before["chunk_index"] + 1
+            and after.get("doc_version") == before.get("doc_version")
+        ):
+            return text + "\n\n" + following
+        return None
+
+    def _extract_sentences(self, query_vector: List[float], results: List[Dict], counts: dict) -> List[Dict]:
+        """每个块只保留与问题的向量相似度不低于阈值的句子（至少保留最相关的一句），保持原文顺序"""
+        sentences = [[s.strip() for s in _SENTENCE_RE.findall(r["text"]) if s.strip()] for r in results]
+        flat = [s for group in sentences if len(group) > 2 for s in group]
+        if not flat:
+            return results
+        vectors = np.asarray(embedding_service.encode(flat), dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+        similarities = iter(vectors @ query / np.where(norms == 0, 1.0, norms))
+
+        extracted = []
+        for r, group in zip(results, sentences):
+            if len(group) <= 2:
+                extracted.append(r)
+                continue
+            scores = [next(similarities) for _ in group]
+            best = max(range(len(group)), key=lambda i: scores[i])
+            keep = [i for i in range(len(group)) if scores[i] >= self.sentence_threshold or i == best]
+            counts["sentences_dropped"] += len(group) - len(keep)
+            # 不相邻的句子之间用省略号隔开
+            parts = []
+            for n, i in enumerate(keep):
+                if n and i != keep[n - 1] + 1:
+                    parts.append("……")
+                parts.append(group[i])
+            extracted.append({**r, "text": "".join(parts)})
+        return extracted
+
+
+# 全局上下文压缩实例
+context_compressor = ContextCompressor()
@@ -0,0 +1,34 @@
+from typing import Iterator, Optional
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def export_ndjson(
+    vector_store,
+    cursor: Optional[int] = None,
+    with_vectors: bool = False,
+    page_size: int = 1000,
+    tenant: Optional[str] = None
+) -> Iterator[bytes]:
+    """把知识库导出为 NDJSON，每页编码为一个字节块
+
+    每行一个文档块，按主键升序输出；中断后以最后一行的 id 作为 cursor 即可续传。
+    任意时刻内存中只保留一页数据。
+    """
+    exported = 0
+    for page in vector_store.export_pages(cursor, with_vectors=with_vectors, page_size=page_size, tenant=tenant):
+        lines = []
+        for row in page:
+            record = {
+                "id": str(row["id"]),
+                "text": row["text"],
+                "metadata": row.get("metadata") or {}
+            }
+            if with_vectors:
+                record["vector"] = [float(x) for x in row["vector"]]
+            lines.append(json.dumps(record, ensure_ascii=False))
+        exported += len(lines)
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+    logger.info(f"导出完成: {exported} 个文档块")
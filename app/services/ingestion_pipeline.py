@@ -0,0 +1,401 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.text_processor import content_hash
+import threading
+import hashlib
+import logging
+import queue
+import json
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+# 队列结束标记，每个下游 worker 消费一个
+_STOP = object()
+
+# 估算单行大小时的固定开销（主键、字段头等）
+_ROW_OVERHEAD_BYTES = 64
+
+# 去重模式
+#   off    不去重
+#   skip   同一文档中已存在的文档块跳过向量化和写入（其他文档已有的内容复用向量）
+#   reuse  已存在的文档块复用库中的向量（不重新向量化），仍然写入新行
+DEDUP_MODES = ("off", "skip", "reuse")
+
+
+def stable_doc_id(tenant: str, metadata: dict, text: Optional[str] = None) -> str:
+    """按来源生成稳定的文档 id，重复同步同一文档时得到同一个 doc_id，skip 去重才能识别
+
+    有文件名时按 租户 + 来源 + 文件名 生成，否则按 租户 + 全文内容哈希 生成；两者都没有时随机生成。
+    """
+    if metadata.get("filename"):
+        key = f"file\0{metadata.get('source') or ''}\0{metadata['filename']}"
+    elif text is not None:
+        key = f"text\0{content_hash(text)}"
+    else:
+        return uuid.uuid4().hex
+    return hashlib.sha256(f"{tenant}\0{key}".encode("utf-8")).hexdigest()[:32]
+
+
+def estimate_row_bytes(row: Tuple[str, List[float], dict]) -> int:
+    """估算一行 (文本, 向量, 元数据) 序列化后的大小"""
+    text, vector, metadata = row
+    return (
+        len(text.encode("utf-8"))
+        + len(vector) * 4
+        + len(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+        + _ROW_OVERHEAD_BYTES
+    )
+
+
+def insert_batches(
+    rows: Iterable[Tuple[str, List[float], dict]],
+    batch_size: Optional[int] = None,
+    max_bytes: Optional[int] = None
+) -> Iterator[List[Tuple[str, List[float], dict]]]:
+    """把待写入的行切成批次，每批不超过 batch_size 行，估算大小不超过 max_bytes（gRPC 消息上限）"""
+    batch_size = batch_size or settings.ingest_insert_batch_size
+    max_bytes = max_bytes or settings.ingest_insert_max_bytes
+    batch: List[Tuple[str, List[float], dict]] = []
+    batch_bytes = 0
+    for row in rows:
+        row_bytes = estimate_row_bytes(row)
+        if batch and (batch_bytes + row_bytes > max_bytes or len(batch) >= batch_size):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(row)
+        batch_bytes += row_bytes
+    if batch:
+        yield batch
+
+
+class StageStats:
+    """单个阶段的吞吐统计"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items_in: int, items_out: int, busy: float):
+        with self._lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy_seconds += busy
+
+    def as_dict(self, wall_seconds: float) -> dict:
+        # 利用率 = 忙碌时间 / (墙钟时间 * worker 数)，最接近 1 的阶段就是瓶颈
+        capacity = wall_seconds * self.workers
+        return {
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items_in / self.busy_seconds * self.workers, 1) if self.busy_seconds else None,
+            "utilization": round(self.busy_seconds / capacity, 3) if capacity else None
+        }
+
+
+class IngestionPipeline:
+    """分阶段入库流水线：分块 -> 向量化 -> 写入向量存储
+
+    阶段之间通过有界队列连接，每个阶段使用独立的线程池并发执行，
+    上游产出的数据立即流向下游，内存中最多只保留队列容量内的数据。
+    """
+
+    def __init__(
+        self,
+        text_processor,
+        vector_store,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        chunk_workers: Optional[int] = None,
+        embed_workers: Optional[int] = None,
+        insert_workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        embed_batch_size: Optional[int] = None,
+        insert_batch_size: Optional[int] = None,
+        insert_max_bytes: Optional[int] = None,
+        dedup: Optional[str] = None,
+        on_insert: Optional[Callable[[List[int], List[str], List[dict]], None]] = None
+    ):
+        self.text_processor = text_processor
+        self.vector_store = vector_store
+        self.embed_fn = embed_fn
+        # 写入成功后的回调（例如同步更新词法索引）
+        self.on_insert = on_insert
+        self.embed_batch_size = embed_batch_size or settings.ingest_embed_batch_size
+        self.insert_batch_size = insert_batch_size or settings.ingest_insert_batch_size
+        # 单次 insert 的请求体需要小于 gRPC 消息上限
+        self.insert_max_bytes = insert_max_bytes or settings.ingest_insert_max_bytes
+
+        self.dedup = (dedup or settings.ingest_dedup).lower()
+        if self.dedup not in DEDUP_MODES:
+            raise ValueError(f"不支持的去重模式: {self.dedup}，可选: {', '.join(DEDUP_MODES)}")
+        self.dedup_stats = {"embedded": 0, "skipped": 0, "reused": 0}
+        self._seen_hashes = set()
+        self._dedup_lock = threading.Lock()
+
+        queue_size = queue_size or settings.ingest_queue_size
+        self._document_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._chunk_queue: queue.Queue = queue.Queue(maxsize=queue_size * self.embed_batch_size)
+        self._vector_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+        self.stages = {
+            "chunk": StageStats("chunk", chunk_workers or settings.ingest_chunk_workers),
+            "embed": StageStats("embed", embed_workers or settings.ingest_embed_workers),
+            "insert": StageStats("insert", insert_workers or settings.ingest_insert_workers)
+        }
+        self._threads: Dict[str, List[threading.Thread]] = {}
+        self._error: Optional[BaseException] = None
+        self._failed = threading.Event()
+        self._started_at = 0.0
+        self.inserted_ids: List[int] = []
+        self._ids_lock = threading.Lock()
+
+    def start(self) -> "IngestionPipeline":
+        """启动各阶段 worker"""
+        self._started_at = time.perf_counter()
+        targets = {
+            "chunk": self._chunk_worker,
+            "embed": self._embed_worker,
+            "insert": self._insert_worker
+        }
+        for name, target in targets.items():
+            self._threads[name] = [
+                threading.Thread(target=target, name=f"ingest-{name}-{i}", daemon=True)
+                for i in range(self.stages[name].workers)
+            ]
+            for thread in self._threads[name]:
+                thread.start()
+        return self
+
+    def submit_document(self, text: str, metadata: dict):
+        """提交一篇完整文档（由分块阶段切分）"""
+        self._raise_if_failed()
+        self._document_queue.put((text, metadata))
+
+    def submit_chunk(self, chunk: str, metadata: dict):
+        """提交一个已切分好的文档块（跳过分块阶段）"""
+        self._raise_if_failed()
+        self._chunk_queue.put((chunk, metadata))
+
+    def join(self) -> dict:
+        """等待所有数据写入完成，返回各阶段统计"""
+        self._stop_stage("chunk", self._document_queue)
+        self._stop_stage("embed", self._chunk_queue)
+        self._stop_stage("insert", self._vector_queue)
+
+        if self._error is not None:
+            raise self._error
+
+        wall = time.perf_counter() - self._started_at
+        stats = {
+            "documents": self.stages["chunk"].items_in,
+            "chunks": self.stages["insert"].items_out,
+            "seconds": round(wall, 3),
+            "dedup": {"mode": self.dedup, **self.dedup_stats},
+            "stages": {name: stage.as_dict(wall) for name, stage in self.stages.items()}
+        }
+        bottleneck = max(self.stages.values(), key=lambda s: s.busy_seconds / s.workers)
+        stats["bottleneck"] = bottleneck.name
+        return stats
+
+    def run(self, texts: Iterable[str], metadatas: Iterable[dict]) -> dict:
+        """一次性提交文档并等待完成"""
+        texts, metadatas = list(texts), list(metadatas)
+        if len(texts) != len(metadatas):
+            raise ValueError(f"文本数量 ({len(texts)}) 与元数据数量 ({len(metadatas)}) 不一致")
+        self.start()
+        try:
+            for text, metadata in zip(texts, metadatas):
+                self.submit_document(text, metadata)
+        finally:
+            stats = self.join()
+        return stats
+
+    def _stop_stage(self, name: str, input_queue: queue.Queue):
+        """向阶段输入队列发送结束标记并等待该阶段所有 worker 退出（重复调用时不再等待）"""
+        threads = self._threads.pop(name, [])
+        for _ in threads:
+            input_queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def stale_ids(self, doc_id: str, tenant: Optional[str] = None) -> List[int]:
+        """重新同步文档后不再出现的旧文档块 id（join 之后调用，只在 skip 模式下有意义）
+
+        本次入库提交过的块无论新写入还是被跳过都保留，其余旧块应当删除。
+        """
+        if self.dedup != "skip":
+            return []
+        tenant_key = tenant or ""
+        rows = self.vector_store.query_by_doc(doc_id, ["id", "content_hash"], tenant)
+        return [
+            row["id"] for row in rows
+            if (tenant_key, row["content_hash"], doc_id) not in self._seen_hashes
+        ]
+
+    def _raise_if_failed(self):
+        if self._failed.is_set():
+            raise RuntimeError(f"入库流水线已失败: {self._error}")
+
+    def _fail(self, error: BaseException):
+        """记录第一个错误；之后各 worker 只消费不处理，避免上游阻塞"""
+        if not self._failed.is_set():
+            self._error = error
+            self._failed.set()
+            logger.error(f"入库流水线失败: {error}", exc_info=True)
+
+    def _chunk_worker(self):
+        stats = self.stages["chunk"]
+        while True:
+            item = self._document_queue.get()
+            if item is _STOP:
+                return
+            if self._failed.is_set():
+                continue
+            text, metadata = item
+            started = time.perf_counter()
+            try:
+                chunks = self.text_processor.split_text(text)
+            except Exception as e:
+                self._fail(e)
+                continue
+            stats.record(1, len(chunks), time.perf_counter() - started)
+            for chunk_index, chunk in enumerate(chunks):
+                self._chunk_queue.put((chunk, {**metadata, "chunk_index": chunk_index}))
+
+    def _embed_worker(self):
+        stats = self.stages["embed"]
+        stopping = False
+        while not stopping:
+            item = self._chunk_queue.get()
+            if item is _STOP:
+                return
+            # 尽量凑满一个批次再调用模型
+            batch: List[Tuple[str, dict]] = [item]
+            while len(batch) < self.embed_batch_size:
+                try:
+                    item = self._chunk_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            if self._failed.is_set():
+                continue
+            started = time.perf_counter()
+            try:
+                rows = self._embed_batch(batch)
+            except Exception as e:
+                self._fail(e)
+                continue
+            stats.record(len(batch), len(rows), time.perf_counter() - started)
+            if rows:
+                self._vector_queue.put(rows)
+
+    def _embed_batch(self, batch: List[Tuple[str, dict]]) -> List[Tuple[str, List[float], dict]]:
+        """向量化一个批次；开启去重时先按内容哈希批量查库，已存在的块不再向量化
+
+        去重以租户为范围，其他租户已有相同内容时仍需写入本租户。
+        skip 只跳过同一文档中已存在的块；其他文档已有相同内容时复用其向量，仍以本文档的 doc_id 写入，
+        否则删除原文档会连带删掉新文档依赖的内容。
+        """
+        if self.dedup == "off":
+            vectors = self.embed_fn([chunk for chunk, _ in batch])
+            return [
+                (chunk, vector, metadata)
+                for (chunk, metadata), vector in zip(batch, vectors)
+            ]
+
+        keys = [(metadata.get("tenant") or "", content_hash(chunk)) for chunk, metadata in batch]
+        hashes_by_tenant: Dict[str, List[str]] = {}
+        for tenant, chunk_hash in keys:
+            hashes_by_tenant.setdefault(tenant, []).append(chunk_hash)
+        known = {
+            (tenant, chunk_hash): stored
+            for tenant, hashes in hashes_by_tenant.items()
+            for chunk_hash, stored in self.vector_store.find_by_hashes(
+                hashes, with_vectors=True, tenant=tenant or None
+            ).items()
+        }
+
+        rows = []
+        to_embed = []
+        with self._dedup_lock:
+            for (chunk, metadata), key in zip(batch, keys):
+                stored = known.get(key)
+                doc_id = metadata.get("doc_id")
+                seen_key = (*key, doc_id)
+                same_doc = doc_id is not None and (
+                    seen_key in self._seen_hashes or (stored is not None and doc_id in stored.get("doc_ids", ()))
+                )
+                if same_doc and self.dedup == "skip":
+                    # 本文档中已存在或同一次入库中重复出现的块
+                    self.dedup_stats["skipped"] += 1
+                elif stored is not None and stored.get("vector") is not None:
+                    rows.append((chunk, stored["vector"], metadata))
+                    self.dedup_stats["reused"] += 1
+                else:
+                    to_embed.append((chunk, metadata))
+                self._seen_hashes.add(seen_key)
+            self.dedup_stats["embedded"] += len(to_embed)
+
+        if to_embed:
+            vectors = self.embed_fn([chunk for chunk, _ in to_embed])
+            rows.extend(
+                (chunk, vector, metadata)
+                for (chunk, metadata), vector in zip(to_embed, vectors)
+            )
+        return rows
+
+    def _insert_worker(self):
+        stats = self.stages["insert"]
+        buffer: List[Tuple[str, List[float], dict]] = []
+        buffer_bytes = 0
+        while True:
+            rows = self._vector_queue.get()
+            if rows is _STOP:
+                if buffer and not self._failed.is_set():
+                    self._insert(buffer, stats)
+                return
+            if self._failed.is_set():
+                continue
+            for row in rows:
+                row_bytes = estimate_row_bytes(row)
+                if buffer and (
+                    buffer_bytes + row_bytes > self.insert_max_bytes
+                    or len(buffer) >= self.insert_batch_size
+                ):
+                    self._insert(buffer, stats)
+                    buffer, buffer_bytes = [], 0
+                buffer.append(row)
+                buffer_bytes += row_bytes
+
+    def _insert(self, rows: List[Tuple[str, List[float], dict]], stats: StageStats):
+        started = time.perf_counter()
+        try:
+            ids = self.vector_store.insert(
+                [row[0] for row in rows],
+                [row[1] for row in rows],
+                [row[2] for row in rows]
+            )
+        except Exception as e:
+            self._fail(e)
+            return
+        stats.record(len(rows), len(rows), time.perf_counter() - started)
+        with self._ids_lock:
+            self.inserted_ids.extend(ids)
+        if self.on_insert is not None:
+            try:
+                self.on_insert(ids, [row[0] for row in rows], [row[2] for row in rows])
+            except Exception as e:
+                logger.error(f"写入回调失败: {e}", exc_info=True)
+
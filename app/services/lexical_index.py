@@ -0,0 +1,488 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+from array import array
+import numpy as np
+import threading
+import logging
+import pickle
+import math
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+
+# 中文按字二元组切分，英文/数字按词切分（保留错误码、标识符）
+_TOKEN_RE = re.compile(
+    r"[\u3400-\u4dbf\u4e00-\u9fff]+|[a-z0-9](?:[a-z0-9_\-\.]*[a-z0-9])?"
+)
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]")
+_SUBWORD_RE = re.compile(r"[_\-\.]")
+
+# 持久化格式版本
+INDEX_FORMAT_VERSION = 2
+
+
+def tokenize(text: str) -> List[str]:
+    """切词：中文字二元组 + 英文数字词（复合标识符额外拆出子词）"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+            if _SUBWORD_RE.search(run):
+                tokens.extend(part for part in _SUBWORD_RE.split(run) if part)
+    return tokens
+
+
+class _Postings:
+    """单个词项的倒排表：已合并的 numpy 数组 + 待合并的增量"""
+
+    __slots__ = ("slots", "tfs", "weights", "pending_slots", "pending_tfs")
+
+    def __init__(self):
+        self.slots = np.empty(0, dtype=np.int32)
+        self.tfs = np.empty(0, dtype=np.float32)
+        # 预先计算好的 BM25 词频项，查询时只需乘以 idf
+        self.weights = np.empty(0, dtype=np.float32)
+        self.pending_slots: List[int] = []
+        self.pending_tfs: List[float] = []
+
+    def __len__(self):
+        return len(self.slots) + len(self.pending_slots)
+
+
+class LexicalIndex:
+    """进程内 BM25 倒排索引
+
+    以 Milvus 主键作为文档标识，随 add_documents / delete_documents 增量更新，
+    定期持久化到本地目录。BM25 的词频项在合并时预先计算，查询只做向量化的累加。
+    每个文档块记录所属分组（租户），查询时可限定分组。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+        max_df_ratio: float = 0.25,
+        save_interval: float = 30.0
+    ):
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        # 出现在超过该比例文档中的词项视为停用词（查询中还有其他词时跳过）
+        self.max_df_ratio = max_df_ratio
+        self.save_interval = save_interval
+        self.source = ""
+
+        self._lock = threading.RLock()
+        self._reset()
+        # 全量重建期间的增删日志（None 表示没有在重建）
+        self._journal: Optional[list] = None
+
+        self._dirty = False
+        self._closed = threading.Event()
+        self._saver: Optional[threading.Thread] = None
+
+    def _reset(self):
+        self._postings: Dict[str, _Postings] = {}
+        self._ext_ids = np.empty(0, dtype=np.int64)
+        self._doc_len = np.empty(0, dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._groups = np.empty(0, dtype=np.int32)
+        self._group_codes: Dict[str, int] = {}
+        self._scratch = np.empty(0, dtype=np.float32)
+        self._slot_of: Dict[int, int] = {}
+        self._size = 0          # 已分配的槽位数
+        self._alive_count = 0
+        self._total_len = 0.0
+        # 计算预存权重时使用的平均文档长度
+        self._weight_avgdl = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._alive_count > 0
+
+    def __len__(self):
+        return self._alive_count
+
+    def add(self, ids: List[int], texts: List[str], groups: Optional[List[str]] = None):
+        """增量加入文档块"""
+        if groups is None:
+            groups = [""] * len(ids)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((self.add, (list(ids), list(texts), list(groups))))
+            self._grow(self._size + len(ids))
+            for ext_id, text, group in zip(ids, texts, groups):
+                ext_id = int(ext_id)
+                if ext_id in self._slot_of:
+                    continue
+                tokens = tokenize(text)
+                slot = self._size
+                self._size += 1
+                self._slot_of[ext_id] = slot
+                self._ext_ids[slot] = ext_id
+                self._doc_len[slot] = len(tokens)
+                self._alive[slot] = True
+                self._groups[slot] = self._group_code(group)
+                self._alive_count += 1
+                self._total_len += len(tokens)
+
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    postings = self._postings.get(token)
+                    if postings is None:
+                        postings = self._postings[token] = _Postings()
+                    postings.pending_slots.append(slot)
+                    postings.pending_tfs.append(tf)
+            self._dirty = True
+
+    def _group_code(self, group: str) -> int:
+        code = self._group_codes.get(group)
+        if code is None:
+            code = self._group_codes[group] = len(self._group_codes)
+        return code
+
+    def remove(self, ids: List[int]):
+        """删除文档块（打删除标记，空洞过多时整体压缩）"""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((self.remove, (list(ids),)))
+            for ext_id in ids:
+                slot = self._slot_of.pop(int(ext_id), None)
+                if slot is None:
+                    continue
+                self._alive[slot] = False
+                self._alive_count -= 1
+                self._total_len -= float(self._doc_len[slot])
+            if self._size and self._alive_count < self._size * 0.7:
+                self._compact()
+            self._dirty = True
+
+    def search(self, query: str, top_k: int = 20, groups: Optional[List[str]] = None) -> List[Tuple[int, float]]:
+        """BM25 检索，返回 [(id, score)]；指定 groups 时只返回这些分组的文档块"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            if not self._alive_count:
+                return []
+            allowed = None
+            if groups is not None:
+                allowed = np.array(
+                    [self._group_codes[group] for group in groups if group in self._group_codes],
+                    dtype=np.int32
+                )
+                if not len(allowed):
+                    return []
+            n = self._alive_count
+            present = [(term, self._postings[term]) for term in terms if term in self._postings]
+            if not present:
+                return []
+            # 高频词只在查询没有其他词时使用
+            selective = [(t, p) for t, p in present if len(p) <= n * self.max_df_ratio]
+            present = selective or present
+
+            # 在常驻的稠密累加器上按槽位累加，查询结束后只清零触及的槽位
+            acc = self._scratch
+            touched = []
+            for _, postings in present:
+                self._merge(postings)
+                df = len(postings.slots)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                acc[postings.slots] += postings.weights * idf
+                touched.append(postings.slots)
+
+            slots = np.concatenate(touched) if len(touched) > 1 else touched[0]
+            scores = acc[slots]
+            acc[slots] = 0
+
+            keep = self._alive[slots]
+            if allowed is not None:
+                keep &= np.isin(self._groups[slots], allowed)
+            slots, scores = slots[keep], scores[keep]
+            # 同一文档可能重复出现（最多 len(present) 次），多取一些再去重
+            limit = top_k * len(present)
+            if len(slots) > limit:
+                top = np.argpartition(-scores, limit)[:limit]
+                slots, scores = slots[top], scores[top]
+            order = np.argsort(-scores, kind="stable")
+
+            results = []
+            seen = set()
+            for i in order:
+                slot = int(slots[i])
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                results.append((int(self._ext_ids[slot]), float(scores[i])))
+                if len(results) >= top_k:
+                    break
+            return results
+
+    def _merge(self, postings: _Postings):
+        """把增量合并进 numpy 数组并计算 BM25 词频项"""
+        avgdl = self._avgdl()
+        # 平均文档长度漂移超过 20% 时全量重算权重
+        if not self._weight_avgdl or abs(avgdl - self._weight_avgdl) / self._weight_avgdl > 0.2:
+            self._reweight(avgdl)
+        if not postings.pending_slots:
+            return
+        new_slots = np.asarray(postings.pending_slots, dtype=np.int32)
+        new_tfs = np.asarray(postings.pending_tfs, dtype=np.float32)
+        postings.slots = np.concatenate([postings.slots, new_slots])
+        postings.tfs = np.concatenate([postings.tfs, new_tfs])
+        postings.weights = np.concatenate([postings.weights, self._weights(new_slots, new_tfs)])
+        postings.pending_slots = []
+        postings.pending_tfs = []
+
+    def _weights(self, slots: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        avgdl = self._weight_avgdl or 1.0
+        norm = self.k1 * (1 - self.b + self.b * self._doc_len[slots] / avgdl)
+        return (tfs * (self.k1 + 1) / (tfs + norm)).astype(np.float32)
+
+    def _reweight(self, avgdl: float):
+        self._weight_avgdl = avgdl
+        for postings in self._postings.values():
+            if len(postings.slots):
+                postings.weights = self._weights(postings.slots, postings.tfs)
+
+    def _avgdl(self) -> float:
+        return self._total_len / self._alive_count if self._alive_count else 1.0
+
+    def _grow(self, capacity: int):
+        if capacity <= len(self._ext_ids):
+            return
+        new_capacity = max(capacity, len(self._ext_ids) * 2, 1024)
+        for name, dtype in (
+            ("_ext_ids", np.int64), ("_doc_len", np.float32), ("_alive", bool),
+            ("_groups", np.int32), ("_scratch", np.float32)
+        ):
+            old = getattr(self, name)
+            grown = np.zeros(new_capacity, dtype=dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def _compact(self):
+        """去掉已删除文档，重新编号槽位"""
+        for postings in self._postings.values():
+            self._merge_pending_only(postings)
+        keep = np.flatnonzero(self._alive[:self._size])
+        remap = np.full(self._size, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+
+        for term in list(self._postings):
+            postings = self._postings[term]
+            mask = self._alive[postings.slots]
+            if not mask.any():
+                del self._postings[term]
+                continue
+            postings.slots = remap[postings.slots[mask]].astype(np.int32)
+            postings.tfs = postings.tfs[mask]
+
+        self._ext_ids = self._ext_ids[keep].copy()
+        self._doc_len = self._doc_len[keep].copy()
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._groups = self._groups[keep].copy()
+        self._scratch = np.zeros(len(keep), dtype=np.float32)
+        self._size = len(keep)
+        self._slot_of = {int(ext_id): slot for slot, ext_id in enumerate(self._ext_ids)}
+        self._reweight(self._avgdl())
+        logger.info(f"词法索引压缩完成，剩余 {self._size} 个文档块")
+
+    def _merge_pending_only(self, postings: _Postings):
+        """把增量并入数组，不检查平均文档长度漂移；新增部分的权重按当前 avgdl 补齐，与 slots 保持等长"""
+        if postings.pending_slots:
+            new_slots = np.asarray(postings.pending_slots, dtype=np.int32)
+            new_tfs = np.asarray(postings.pending_tfs, dtype=np.float32)
+            postings.slots = np.concatenate([postings.slots, new_slots])
+            postings.tfs = np.concatenate([postings.tfs, new_tfs])
+            postings.weights = np.concatenate([postings.weights, self._weights(new_slots, new_tfs)])
+            postings.pending_slots = []
+            postings.pending_tfs = []
+
+    def rebuild(self, rows: Iterable[Tuple[int, str, str]], source: str = ""):
+        """从 (id, text, group) 序列全量重建
+
+        倒排项先以 (词项, 槽位, 词频) 追加到紧凑数组，最后按词项排序一次切分成各词项的倒排表，
+        百万级文档块时不必为每个倒排项保留 Python 列表。构建期间旧索引照常使用，
+        期间的增删记入日志，切换到新索引后重放。
+        """
+        with self._lock:
+            self._journal = []
+
+        term_codes: Dict[str, int] = {}
+        group_codes: Dict[str, int] = {}
+        term_column, slot_column, tf_column = array("i"), array("i"), array("f")
+        ext_ids, doc_lens, groups = array("q"), array("f"), array("i")
+        seen = set()
+        for ext_id, text, group in rows:
+            ext_id = int(ext_id)
+            if ext_id in seen:
+                continue
+            seen.add(ext_id)
+            slot = len(ext_ids)
+            tokens = tokenize(text)
+            ext_ids.append(ext_id)
+            doc_lens.append(len(tokens))
+            code = group_codes.get(group)
+            if code is None:
+                code = group_codes[group] = len(group_codes)
+            groups.append(code)
+
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                code = term_codes.get(token)
+                if code is None:
+                    code = term_codes[token] = len(term_codes)
+                term_column.append(code)
+                slot_column.append(slot)
+                tf_column.append(tf)
+        del seen
+
+        # 按词项稳定排序后，每个词项的倒排表是一段连续区间，槽位保持升序
+        terms = np.frombuffer(term_column, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        bounds = np.zeros(len(term_codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(term_codes)), out=bounds[1:])
+        del terms, term_column
+        all_slots = np.frombuffer(slot_column, dtype=np.int32)[order]
+        del slot_column
+        all_tfs = np.frombuffer(tf_column, dtype=np.float32)[order]
+        del tf_column, order
+
+        size = len(ext_ids)
+        with self._lock:
+            self._reset()
+            self.source = source
+            self._grow(size)
+            self._ext_ids[:size] = np.frombuffer(ext_ids, dtype=np.int64)
+            self._doc_len[:size] = np.frombuffer(doc_lens, dtype=np.float32)
+            self._alive[:size] = True
+            self._groups[:size] = np.frombuffer(groups, dtype=np.int32)
+            self._group_codes = group_codes
+            self._slot_of = {ext_id: slot for slot, ext_id in enumerate(ext_ids)}
+            self._size = self._alive_count = size
+            self._total_len = float(self._doc_len[:size].sum())
+            for term, code in term_codes.items():
+                postings = _Postings()
+                postings.slots = all_slots[bounds[code]:bounds[code + 1]]
+                postings.tfs = all_tfs[bounds[code]:bounds[code + 1]]
+                self._postings[term] = postings
+            self._reweight(self._avgdl())
+
+            journal, self._journal = self._journal, None
+            for operation, args in journal:
+                operation(*args)
+            self._dirty = True
+        logger.info(f"词法索引重建完成: {self._alive_count} 个文档块（重放构建期间的 {len(journal)} 次增删）")
+
+    def save(self):
+        """原子写入索引文件"""
+        if self.path is None:
+            return
+        with self._lock:
+            for postings in self._postings.values():
+                self._merge_pending_only(postings)
+            state = {
+                "version": INDEX_FORMAT_VERSION,
+                "source": self.source,
+                "k1": self.k1,
+                "b": self.b,
+                "ext_ids": self._ext_ids[:self._size].copy(),
+                "doc_len": self._doc_len[:self._size].copy(),
+                "alive": self._alive[:self._size].copy(),
+                "groups": self._groups[:self._size].copy(),
+                "group_codes": dict(self._group_codes),
+                "postings": {term: (p.slots, p.tfs) for term, p in self._postings.items()},
+            }
+            self._dirty = False
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        target = self.path / "lexical_index.pkl"
+        tmp = target.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, target)
+        logger.info(f"词法索引已保存: {target}（{len(state['ext_ids'])} 个槽位）")
+
+    def load(self) -> bool:
+        """从索引文件加载，文件不存在或格式不兼容时返回 False"""
+        if self.path is None:
+            return False
+        target = self.path / "lexical_index.pkl"
+        if not target.exists():
+            return False
+        with open(target, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != INDEX_FORMAT_VERSION:
+            logger.warning(f"词法索引格式版本不兼容: {state.get('version')}")
+            return False
+
+        with self._lock:
+            self._reset()
+            self.source = state.get("source", "")
+            self._ext_ids = state["ext_ids"]
+            self._doc_len = state["doc_len"]
+            self._alive = state["alive"]
+            self._groups = state["groups"]
+            self._group_codes = state["group_codes"]
+            self._size = len(self._ext_ids)
+            self._scratch = np.zeros(self._size, dtype=np.float32)
+            alive_slots = np.flatnonzero(self._alive)
+            self._slot_of = {int(self._ext_ids[slot]): int(slot) for slot in alive_slots}
+            self._alive_count = len(alive_slots)
+            self._total_len = float(self._doc_len[alive_slots].sum())
+            for term, (slots, tfs) in state["postings"].items():
+                postings = _Postings()
+                postings.slots, postings.tfs = slots, tfs
+                self._postings[term] = postings
+            self._reweight(self._avgdl())
+        logger.info(f"已加载词法索引: {self._alive_count} 个文档块")
+        return True
+
+    def start_autosave(self):
+        """后台定期保存（有修改时）"""
+        if self.path is None or self._saver is not None:
+            return
+        self._saver = threading.Thread(target=self._autosave_loop, name="lexical-index-saver", daemon=True)
+        self._saver.start()
+
+    def _autosave_loop(self):
+        while not self._closed.wait(timeout=self.save_interval):
+            if not self._dirty:
+                continue
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"保存词法索引失败: {e}", exc_info=True)
+
+    def close(self):
+        """停止后台保存并落盘"""
+        self._closed.set()
+        if self._saver is not None:
+            self._saver.join(timeout=5)
+            self._saver = None
+        if self._dirty:
+            self.save()
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """倒数排名融合：score(d) = Σ 1 / (k + rank_i(d))"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,206 @@
+from typing import List, Optional
+from app.core.config import settings
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+
+
+# 优先级：数值越小越先获得模型服务的并发名额
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+
+class LLMOverloadedError(Exception):
+    """模型服务繁忙，请求未被接纳
+
+    status_code 为 429（排队已满，立即拒绝）或 503（排队超过等待期限），
+    retry_after 为建议的重试间隔（秒）。
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """排队中的请求：异步调用方用 future 唤醒，同步调用方用 Event 唤醒"""
+
+    def __init__(self, priority: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class LLMLease:
+    """一个并发名额，生成结束后释放（重复释放无效果）"""
+
+    def __init__(self, admission: "LLMAdmission"):
+        self._admission = admission
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._admission._release(time.monotonic() - self._started)
+
+    def __del__(self):
+        # 兜底：持有名额的流式响应从未开始迭代就被丢弃时也归还名额
+        self.release()
+
+
+class LLMAdmission:
+    """模型服务准入控制
+
+    同时发往模型服务的请求数不超过 max_concurrency，超出的请求按优先级排队
+    （交互式对话排在批量任务之前，同优先级先到先得）。
+    排队已满时立即拒绝（429），排队超过等待期限时拒绝（503），都带上建议的重试间隔，
+    避免突发流量把模型服务压垮、所有请求一起变慢直至超时。
+    """
+
+    def __init__(self):
+        self.max_concurrency = settings.llm_max_concurrency
+        self.max_queue = settings.llm_max_queue
+        self.queue_timeouts = {
+            PRIORITY_INTERACTIVE: settings.llm_queue_timeout,
+            PRIORITY_BATCH: settings.llm_batch_queue_timeout
+        }
+
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._queued = {priority: 0 for priority in PRIORITIES.values()}
+        # 单次生成耗时的指数移动平均，用于估算重试间隔
+        self._service_seconds = 0.0
+        self._lock = threading.Lock()
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0
+        }
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> LLMLease:
+        """异步获取并发名额，排队时不阻塞事件循环"""
+        waiter = self._enqueue(priority, asyncio.get_running_loop())
+        if waiter is None:
+            return LLMLease(self)
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.queue_timeouts[priority] or None)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._abandon(waiter, cancelled=True)
+            raise
+        self._abandon(waiter)
+        return LLMLease(self)
+
+    def acquire_sync(self, priority: int = PRIORITY_BATCH) -> LLMLease:
+        """同步获取并发名额（供脚本和后台线程使用）"""
+        waiter = self._enqueue(priority)
+        if waiter is None:
+            return LLMLease(self)
+        waiter.event.wait(timeout=self.queue_timeouts[priority] or None)
+        self._abandon(waiter)
+        return LLMLease(self)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            admitted = self.stats["admitted"]
+            return {
+                "max_concurrency": self.max_concurrency,
+                "inflight": self._inflight,
+                "queue_depth": sum(self._queued.values()),
+                "queue_depth_by_priority": {name: self._queued[p] for name, p in PRIORITIES.items()},
+                **{k: v for k, v in self.stats.items() if not k.endswith("seconds")},
+                "avg_wait_ms": round(self.stats["wait_seconds"] / admitted * 1000, 1) if admitted else 0.0,
+                "max_wait_ms": round(self.stats["max_wait_seconds"] * 1000, 1),
+                "avg_service_ms": round(self._service_seconds * 1000, 1)
+            }
+
+    def _enqueue(self, priority: int, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """有空闲名额且无人排队时直接占用并返回 None，否则排队；排队已满时拒绝"""
+        with self._lock:
+            if not self.max_concurrency or (self._inflight < self.max_concurrency and not any(self._queued.values())):
+                self._inflight += 1
+                self._record_wait(0.0)
+                return None
+            if sum(self._queued.values()) >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                raise LLMOverloadedError("模型服务繁忙，排队已满", 429, self._retry_after())
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self._queued[priority] += 1
+            self.stats["queued"] += 1
+            return waiter
+
+    def _abandon(self, waiter: _Waiter, cancelled: bool = False):
+        """等待结束：已分到名额时返回（取消时归还名额），否则移出队列并拒绝"""
+        with self._lock:
+            if waiter.granted:
+                granted = True
+            else:
+                granted = False
+                waiter.cancelled = True
+                self._queued[waiter.priority] -= 1
+                if not cancelled:
+                    self.stats["rejected_timeout"] += 1
+                    retry_after = self._retry_after()
+        if granted:
+            if cancelled:
+                self._release(0.0)
+            return
+        if not cancelled:
+            timeout = self.queue_timeouts[waiter.priority]
+            raise LLMOverloadedError(f"模型服务繁忙，排队超过 {timeout}s", 503, retry_after)
+
+    def _release(self, seconds: float):
+        with self._lock:
+            if seconds:
+                self._service_seconds = seconds if not self._service_seconds else 0.8 * self._service_seconds + 0.2 * seconds
+            self._inflight -= 1
+            while self._heap and self._inflight < self.max_concurrency:
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._queued[waiter.priority] -= 1
+                self._inflight += 1
+                self._record_wait(time.monotonic() - waiter.enqueued)
+                waiter.wake()
+
+    def _record_wait(self, seconds: float):
+        self.stats["admitted"] += 1
+        self.stats["wait_seconds"] += seconds
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], seconds)
+
+    def _retry_after(self) -> int:
+        """按排队长度和平均生成耗时估算重试间隔（秒）"""
+        depth = sum(self._queued.values()) + 1
+        estimate = self._service_seconds * depth / max(self.max_concurrency, 1)
+        return min(max(math.ceil(estimate), 1), 60)
+
+
+# 全局模型服务准入控制实例
+llm_admission = LLMAdmission()
@@ -0,0 +1,375 @@
+from collections import deque
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from langchain_core.messages import BaseMessage
+from langchain_openai import ChatOpenAI
+from app.core.config import settings
+import asyncio
+import hashlib
+import httpx
+import logging
+import openai
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# 可以换一个副本重试的错误：连接失败、超时、服务端 5xx（请求参数错误等 4xx 换副本也没用）
+FAILOVER_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+# 一次请求最多尝试的副本数（不含备用模型）
+MAX_ATTEMPTS = 2
+# 计算 P95 延迟用的最近样本数，样本不足 HEDGE_MIN_SAMPLES 时对冲延迟用配置的初始值
+LATENCY_SAMPLES = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+class LLMTimeoutError(Exception):
+    """在截止时间内没有得到模型服务的响应"""
+
+
+def parse_base_urls(value: Optional[str]) -> List[str]:
+    """解析逗号分隔的地址列表（YAML 中写成列表时也能识别）"""
+    if not value:
+        return []
+    return [url.strip(" '\"[]").rstrip("/") for url in value.split(",") if url.strip(" '\"[]")]
+
+
+def parse_fallbacks(value: Optional[str]) -> List[Tuple[Optional[str], str]]:
+    """解析备用模型列表：逗号分隔的 "模型@地址"，只写地址时使用主模型"""
+    fallbacks = []
+    for entry in parse_base_urls(value):
+        model, _, base_url = entry.rpartition("@") if "@" in entry else ("", "", entry)
+        fallbacks.append((model or None, base_url))
+    return fallbacks
+
+
+class LLMEndpoint:
+    """一个 OpenAI 兼容的推理服务副本"""
+
+    def __init__(self, base_url: Optional[str], llm: ChatOpenAI, model: Optional[str] = None):
+        self.base_url = base_url
+        self.llm = llm
+        self.model = model
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.stats = {"requests": 0, "failures": 0, "ejections": 0}
+        self._latency = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return sorted(self.latencies)[int(len(self.latencies) * 0.95) - 1]
+
+    def get_stats(self, now: float) -> dict:
+        p95 = self.p95()
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "healthy": self.healthy,
+            "ejected": now < self.ejected_until,
+            "outstanding": self.outstanding,
+            **self.stats,
+            "avg_latency_ms": round(self._latency * 1000, 1),
+            "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+
+class LLMRouter:
+    """多个推理副本之间的请求路由
+
+    - 优先选择进行中请求最少的副本（least outstanding requests）
+    - 带会话键（affinity_key）的请求用 rendezvous 哈希固定到同一副本，复用该副本上的前缀 KV 缓存；
+      该副本比最空闲的副本多出 affinity_slack 个以上进行中请求时改走最空闲的副本
+    - 连续失败 eject_failures 次的副本暂停使用 eject_seconds 秒；
+      后台线程定期请求各副本的 /models，检查失败的副本标记为不健康
+    - 请求在输出第一个 token 之前因连接失败或 5xx 出错时换一个副本重试，副本都失败后依次尝试备用模型
+    - 每个请求有截止时间（流式请求为首个 token 的截止时间），超时抛出 LLMTimeoutError；
+      开启对冲时，非流式请求超过该副本的 P95 延迟仍未返回，就向下一个副本或备用模型再发一份，
+      先成功的结果胜出，其余的请求取消
+    """
+
+    def __init__(
+        self,
+        endpoints: List[LLMEndpoint],
+        api_key: Optional[str] = None,
+        fallbacks: Optional[List[LLMEndpoint]] = None
+    ):
+        self.endpoints = endpoints
+        self.fallbacks = fallbacks or []
+        self.api_key = api_key
+        self.request_timeout = settings.llm_request_timeout
+        self.failover_reserve = settings.llm_failover_reserve
+        self.hedge_enabled = settings.llm_hedge_enabled
+        self.hedge_delay = settings.llm_hedge_delay
+        self.affinity_slack = settings.llm_affinity_slack
+        self.eject_failures = settings.llm_eject_failures
+        self.eject_seconds = settings.llm_eject_seconds
+        self.health_interval = settings.llm_health_interval
+        self._lock = threading.Lock()
+        self.stats = {
+            "affinity_hits": 0,
+            "affinity_overflows": 0,
+            "failovers": 0,
+            "fallbacks": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "timeouts": 0
+        }
+
+        self._stop = threading.Event()
+        self._checker = None
+        if len(endpoints) > 1 and self.health_interval > 0:
+            self._checker = threading.Thread(target=self._health_loop, name="llm-health-check", daemon=True)
+            self._checker.start()
+
+    def candidates(self, affinity_key: Optional[str] = None) -> List[LLMEndpoint]:
+        """按优先顺序返回本次请求要尝试的副本"""
+        now = time.monotonic()
+        with self._lock:
+            # 全部副本都不可用时仍然尝试，而不是直接失败
+            available = [e for e in self.endpoints if e.available(now)] or list(self.endpoints)
+            ordered = sorted(available, key=lambda e: (e.outstanding, random.random()))
+            if affinity_key and len(ordered) > 1:
+                preferred = max(ordered, key=lambda e: self._affinity(affinity_key, e))
+                if preferred.outstanding <= ordered[0].outstanding + self.affinity_slack:
+                    self.stats["affinity_hits"] += 1
+                    ordered.remove(preferred)
+                    ordered.insert(0, preferred)
+                else:
+                    self.stats["affinity_overflows"] += 1
+        return ordered[:MAX_ATTEMPTS]
+
+    def invoke(self, messages: List[BaseMessage], affinity_key: Optional[str] = None):
+        """同步调用：依次尝试副本和备用模型（超时由客户端的 timeout 保证）"""
+        chain = self._chain(affinity_key)
+        for attempt, endpoint in enumerate(chain):
+            try:
+                with self._track(endpoint):
+                    return endpoint.llm.invoke(messages)
+            except FAILOVER_ERRORS:
+                if attempt == len(chain) - 1:
+                    raise
+                self._failover(endpoint, chain[attempt + 1])
+
+    async def ainvoke(self, messages: List[BaseMessage], affinity_key: Optional[str] = None):
+        """异步调用：截止时间 + 失败切换 + 可选的对冲请求，先成功的结果胜出"""
+        chain = self._chain(affinity_key)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.request_timeout if self.request_timeout else None
+        pending: Dict[asyncio.Future, LLMEndpoint] = {}
+        attempts = iter(chain)
+        hedge = None
+        error = None
+        # 最近一次发出的请求及其发出时间，对冲延迟从这里算起
+        latest = (chain[0], loop.time())
+
+        def launch() -> Optional[asyncio.Future]:
+            nonlocal latest
+            endpoint = next(attempts, None)
+            if endpoint is None:
+                return None
+            task = asyncio.ensure_future(self._ainvoke_on(endpoint, messages))
+            pending[task] = endpoint
+            latest = (endpoint, loop.time())
+            return task
+
+        launch()
+        try:
+            while pending:
+                timeouts = []
+                if deadline is not None:
+                    timeouts.append(deadline - loop.time())
+                if self.hedge_enabled and hedge is None and len(pending) == 1:
+                    timeouts.append(latest[1] + self._hedge_delay(latest[0]) - loop.time())
+                timeout = max(min(timeouts), 0) if timeouts else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    endpoint = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except FAILOVER_ERRORS as e:
+                        error = e
+                        if launch() is not None:
+                            self._failover(endpoint, list(pending.values())[-1])
+                        continue
+                    self._record_winner(endpoint, hedged=task is hedge)
+                    return result
+                if done:
+                    continue
+
+                if deadline is not None and loop.time() >= deadline:
+                    with self._lock:
+                        self.stats["timeouts"] += 1
+                    error = LLMTimeoutError(f"模型服务 {self.request_timeout}s 内没有响应")
+                    for endpoint in pending.values():
+                        self._record_failure(endpoint, error)
+                    raise error
+                # 主请求超过 P95 延迟仍未返回：向下一个副本或备用模型再发一份
+                hedge = launch() or False
+                if hedge:
+                    with self._lock:
+                        self.stats["hedges"] += 1
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stream(self, messages: List[BaseMessage], affinity_key: Optional[str] = None) -> Iterator:
+        chain = self._chain(affinity_key)
+        for attempt, endpoint in enumerate(chain):
+            started = False
+            try:
+                with self._track(endpoint):
+                    for chunk in endpoint.llm.stream(messages):
+                        started = True
+                        yield chunk
+                return
+            except FAILOVER_ERRORS:
+                # 已经输出过内容时不能换副本重来
+                if started or attempt == len(chain) - 1:
+                    raise
+                self._failover(endpoint, chain[attempt + 1])
+
+    async def astream(self, messages: List[BaseMessage], affinity_key: Optional[str] = None) -> AsyncIterator:
+        """异步流式调用：截止时间限制首个 token，之前失败时切换副本或备用模型
+
+        当前副本可以用到剩余时间减去为后面的副本和备用模型保留的 failover_reserve 秒，
+        没有按时输出首个 token 时关闭它的流并切换到下一个，最后一个用完剩余时间仍超时才抛出 LLMTimeoutError。
+        """
+        chain = self._chain(affinity_key)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.request_timeout if self.request_timeout else None
+        for attempt, endpoint in enumerate(chain):
+            started = False
+            try:
+                with self._track(endpoint):
+                    chunks = endpoint.llm.astream(messages)
+                    try:
+                        try:
+                            timeout = None
+                            if deadline is not None:
+                                timeout = max(deadline - loop.time(), 0)
+                                if attempt < len(chain) - 1:
+                                    timeout -= min(self.failover_reserve, timeout / 2)
+                            first = await asyncio.wait_for(chunks.__anext__(), timeout)
+                        except StopAsyncIteration:
+                            return
+                        except asyncio.TimeoutError:
+                            raise LLMTimeoutError(f"模型服务 {self.request_timeout}s 内没有输出")
+                        started = True
+                        if attempt:
+                            self._record_winner(endpoint, hedged=False)
+                        yield first
+                        async for chunk in chunks:
+                            yield chunk
+                    finally:
+                        # 超时或调用方提前结束时关闭底层流，释放连接
+                        await chunks.aclose()
+                return
+            except LLMTimeoutError:
+                if attempt == len(chain) - 1:
+                    with self._lock:
+                        self.stats["timeouts"] += 1
+                    raise
+                self._failover(endpoint, chain[attempt + 1])
+            except FAILOVER_ERRORS:
+                if started or attempt == len(chain) - 1:
+                    raise
+                self._failover(endpoint, chain[attempt + 1])
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                **self.stats,
+                "endpoints": [e.get_stats(now) for e in self.endpoints],
+                "fallback_endpoints": [e.get_stats(now) for e in self.fallbacks]
+            }
+
+    def close(self):
+        self._stop.set()
+
+    @contextmanager
+    def _track(self, endpoint: LLMEndpoint):
+        """记录进行中请求数；连接失败、5xx 或超时计为副本失败，连续失败过多时暂停使用"""
+        started = time.monotonic()
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.stats["requests"] += 1
+        try:
+            yield
+        except FAILOVER_ERRORS + (LLMTimeoutError,) as e:
+            self._record_failure(endpoint, e)
+            raise
+        else:
+            seconds = time.monotonic() - started
+            with self._lock:
+                endpoint.failures = 0
+                endpoint._latency = seconds if not endpoint._latency else 0.8 * endpoint._latency + 0.2 * seconds
+                endpoint.latencies.append(seconds)
+        finally:
+            with self._lock:
+                endpoint.outstanding -= 1
+
+    def _record_failure(self, endpoint: LLMEndpoint, error: Exception):
+        with self._lock:
+            endpoint.stats["failures"] += 1
+            endpoint.failures += 1
+            if endpoint.failures >= self.eject_failures:
+                endpoint.failures = 0
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                endpoint.stats["ejections"] += 1
+                logger.warning(f"LLM 副本 {endpoint.base_url} 连续失败，暂停使用 {self.eject_seconds}s: {error}")
+
+    def _chain(self, affinity_key: Optional[str] = None) -> List[LLMEndpoint]:
+        """本次请求依次尝试的副本，之后是备用模型"""
+        return self.candidates(affinity_key) + self.fallbacks
+
+    async def _ainvoke_on(self, endpoint: LLMEndpoint, messages: List[BaseMessage]):
+        with self._track(endpoint):
+            return await endpoint.llm.ainvoke(messages)
+
+    def _hedge_delay(self, endpoint: LLMEndpoint) -> float:
+        """发出对冲请求前等待的时间：该副本最近的 P95 延迟，样本不足时用配置的初始值"""
+        p95 = endpoint.p95()
+        return p95 if p95 is not None else self.hedge_delay
+
+    def _record_winner(self, endpoint: LLMEndpoint, hedged: bool):
+        with self._lock:
+            if hedged:
+                self.stats["hedge_wins"] += 1
+            if endpoint in self.fallbacks:
+                self.stats["fallbacks"] += 1
+                logger.warning(f"使用备用模型 {endpoint.model or ''}@{endpoint.base_url} 的回复")
+
+    def _failover(self, endpoint: LLMEndpoint, next_endpoint: LLMEndpoint):
+        with self._lock:
+            self.stats["failovers"] += 1
+        logger.warning(f"LLM 副本 {endpoint.base_url} 请求失败，改用 {next_endpoint.base_url}")
+
+    @staticmethod
+    def _affinity(key: str, endpoint: LLMEndpoint) -> int:
+        digest = hashlib.blake2b(f"{key}|{endpoint.base_url}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def _health_loop(self):
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        with httpx.Client(timeout=min(self.health_interval, 5.0), headers=headers) as client:
+            while not self._stop.wait(self.health_interval):
+                for endpoint in self.endpoints:
+                    try:
+                        healthy = client.get(f"{endpoint.base_url}/models").status_code == 200
+                    except httpx.HTTPError:
+                        healthy = False
+                    if healthy != endpoint.healthy:
+                        logger.warning(f"LLM 副本 {endpoint.base_url} 健康检查{'恢复' if healthy else '失败'}")
+                    endpoint.healthy = healthy
@@ -1,8 +1,11 @@
 from langchain_openai import ChatOpenAI
 
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
-from typing import List, Optional, Dict, Iterator
+from typing import AsyncIterator, List, Optional, Dict, Iterator, Tuple
 from app.core.config import settings
+from app.services.llm_admission import llm_admission, LLMLease, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from app.services.llm_router import LLMEndpoint, LLMRouter, parse_base_urls, parse_fallbacks
+import hashlib
 import logging
 
 
@@ -14,6 +17,24 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# 提示词布局：default 为原有布局；prefix_cache 按内容稳定程度排列，便于推理服务复用前缀缓存
+PROMPT_LAYOUT_DEFAULT = "default"
+PROMPT_LAYOUT_PREFIX_CACHE = "prefix_cache"
+# prefix_cache 布局的历史对话窗口：最少 / 最多保留的消息数，平均每几轮出现一个窗口起点
+HISTORY_MIN_MESSAGES = 10
+HISTORY_MAX_MESSAGES = 20
+HISTORY_ANCHOR_EVERY = 3
+
+BASE_SYSTEM_PROMPT = """你是一个智能助手，能够基于提供的知识库内容和用户的历史对话记忆回答问题。
+                        请遵循以下原则：
+                        1. 基于知识库内容回答，不要编造信息
+                        2. 如果知识库中没有相关信息，诚实告知用户
+                        3. 结合用户的历史记忆，提供个性化的回答
+                        4. 回答要准确、清晰、有帮助
+                        5. 使用中文回答
+                        """
+
+
 class LLMService:
     """LLM 服务"""
     def __init__(self):
@@ -22,25 +43,47 @@ class LLMService:
         self.max_tokens = settings.llm_max_tokens
         self.api_key = settings.openai_api_key
         self.provider = settings.llm_provider.lower()
+        self.prompt_layout = settings.llm_prompt_layout.lower()
+        # 流式生成统计：客户端中途断开而取消的生成及其已输出的量
+        self.stream_stats = {
+            "streams": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "cancelled_chunks": 0,
+            "cancelled_chars": 0,
+            "cancelled_seconds": 0.0
+        }
         self.base_url=settings.llm_base_url
 
 
-        is_local = self.provider == "local" or self.base_url is not None
+        base_urls = parse_base_urls(settings.llm_base_urls)
+        fallbacks = parse_fallbacks(settings.llm_fallbacks)
+        is_local = self.provider == "local" or self.base_url is not None or bool(base_urls)
+        # 单次请求的客户端超时，同步调用靠它保证不会无限等待
+        timeout = settings.llm_request_timeout or None
         
         
         if is_local:
             # 本地模型：使用自定义 base_url，api_key 可以是任意值
             self.api_key = settings.openai_api_key or "none"
-            base_url = self.base_url or "http://localhost:8000/v1"
+            # 配置了多个推理副本或备用模型时由路由负责换副本重试，客户端自身不再重试
+            base_urls = base_urls or [self.base_url or "http://localhost:8000/v1"]
+            retries = {"max_retries": 0} if len(base_urls) > 1 or fallbacks else {}
             
-            self.llm = ChatOpenAI(
-                model=self.model_name,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                openai_api_key=self.api_key,
-                base_url=base_url
-            )
-            logger.info(f"已初始化本地 LLM: {self.model_name} (base_url: {base_url})")
+            endpoints = [
+                LLMEndpoint(base_url, ChatOpenAI(
+                    model=self.model_name,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    openai_api_key=self.api_key,
+                    base_url=base_url,
+                    timeout=timeout,
+                    **retries
+                ))
+                for base_url in base_urls
+            ]
+            self.llm = endpoints[0].llm
+            logger.info(f"已初始化本地 LLM: {self.model_name} (base_url: {', '.join(base_urls)})")
         elif self.provider == "dashscope" or "qwen" in self.model_name.lower():
             # DashScope（通义千问）兼容接口
             self.api_key = settings.openai_api_key
@@ -52,8 +95,10 @@ class LLMService:
                 temperature=self.temperature,
                 max_tokens=self.max_tokens,
                 openai_api_key=self.api_key,
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+                timeout=timeout
             )
+            endpoints = [LLMEndpoint("https://dashscope.aliyuncs.com/compatible-mode/v1", self.llm)]
             logger.info(f"已初始化 DashScope LLM: {self.model_name}")
         else:
             # 标准 OpenAI 接口
@@ -65,19 +110,84 @@ class LLMService:
                 model=self.model_name,
                 temperature=self.temperature,
                 max_tokens=self.max_tokens,
-                openai_api_key=self.api_key
+                openai_api_key=self.api_key,
+                timeout=timeout
             )
+            endpoints = [LLMEndpoint("https://api.openai.com/v1", self.llm)]
             logger.info(f"已初始化 OpenAI LLM: {self.model_name}")
+
+        # 备用模型：所有副本都失败时依次尝试，也是对冲请求的目标
+        fallback_endpoints = [
+            LLMEndpoint(base_url, ChatOpenAI(
+                model=model or self.model_name,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                openai_api_key=self.api_key,
+                base_url=base_url,
+                timeout=timeout,
+                max_retries=0
+            ), model=model or self.model_name)
+            for model, base_url in fallbacks
+        ]
+        if fallback_endpoints:
+            logger.info(f"备用模型: {', '.join(f'{e.model}@{e.base_url}' for e in fallback_endpoints)}")
+
+        self.router = LLMRouter(endpoints, api_key=self.api_key, fallbacks=fallback_endpoints)
+
+    def record_stream(self, cancelled: bool, chunks: int, chars: int, seconds: float):
+        """记录一次流式生成的结果"""
+        self.stream_stats["streams"] += 1
+        if not cancelled:
+            self.stream_stats["completed"] += 1
+            return
+        self.stream_stats["cancelled"] += 1
+        self.stream_stats["cancelled_chunks"] += chunks
+        self.stream_stats["cancelled_chars"] += chars
+        self.stream_stats["cancelled_seconds"] += seconds
+        logger.info(f"客户端断开，已取消流式生成: 已输出 {chunks} 块 / {chars} 字, 耗时 {seconds:.2f}s")
+
+    def get_stream_stats(self) -> dict:
+        streams = self.stream_stats["streams"]
+        return {
+            **self.stream_stats,
+            "cancelled_seconds": round(self.stream_stats["cancelled_seconds"], 3),
+            "cancel_rate": round(self.stream_stats["cancelled"] / streams, 4) if streams else 0.0
+        }
+
     def generate(
         self,
         messages: List[BaseMessage],
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        priority: int = PRIORITY_BATCH,
+        affinity_key: Optional[str] = None
     ) -> str:
-        """生成回复"""
+        """生成回复（affinity_key 相同的请求尽量发往同一个推理副本）"""
         if system_prompt:
             messages = [SystemMessage(content=system_prompt)] + messages
         
-        response = self.llm.invoke(messages)
+        lease = llm_admission.acquire_sync(priority)
+        try:
+            response = self.router.invoke(messages, affinity_key)
+        finally:
+            lease.release()
+        return response.content
+
+    async def agenerate(
+        self,
+        messages: List[BaseMessage],
+        system_prompt: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        affinity_key: Optional[str] = None
+    ) -> str:
+        """异步生成回复（等待模型响应时不阻塞事件循环）"""
+        if system_prompt:
+            messages = [SystemMessage(content=system_prompt)] + messages
+
+        lease = await llm_admission.acquire(priority)
+        try:
+            response = await self.router.ainvoke(messages, affinity_key)
+        finally:
+            lease.release()
         return response.content
     
     def generate_with_context(
@@ -85,105 +195,219 @@ class LLMService:
         user_message: str,
         context: List[str],
         conversation_history: List[dict],
-        user_memories: List[dict] = None
+        user_memories: List[dict] = None,
+        core_memories: List[dict] = None,
+        priority: int = PRIORITY_BATCH,
+        affinity_key: Optional[str] = None
     ) -> str:
         """基于上下文生成回复"""
-        # 构建系统提示
-        logger.info(f"user_memories: {user_memories}")
-        system_prompt = self._build_system_prompt(user_memories)
-        logger.info(f"system_prompt: {system_prompt}")
-        
-        # 构建上下文
-        context_text = "\n\n".join([
-            f"[文档 {i+1}]: {doc}" for i, doc in enumerate(context)
-        ])
-        
-        # 构建历史对话
-        history_messages = []
-        for msg in conversation_history[-10:]:  # 最近10轮对话
-            if msg["role"] == "user":
-                history_messages.append(HumanMessage(content=msg["content"]))
-            else:
-                history_messages.append(AIMessage(content=msg["content"]))
-        
-        # 构建当前消息
-        current_message = f"""基于以下知识库内容回答问题：
+        messages, system_prompt = self._build_messages(
+            user_message, context, conversation_history, user_memories, core_memories
+        )
+        return self.generate(messages, system_prompt, priority=priority, affinity_key=affinity_key)
 
-{context_text}
-
-用户问题：{user_message}"""
-        
-        messages = history_messages + [HumanMessage(content=current_message)]
-        
-        return self.generate(messages, system_prompt)
+    async def agenerate_with_context(
+        self,
+        user_message: str,
+        context: List[str],
+        conversation_history: List[dict],
+        user_memories: List[dict] = None,
+        core_memories: List[dict] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        affinity_key: Optional[str] = None
+    ) -> str:
+        """基于上下文异步生成回复"""
+        messages, system_prompt = self._build_messages(
+            user_message, context, conversation_history, user_memories, core_memories
+        )
+        return await self.agenerate(messages, system_prompt, priority=priority, affinity_key=affinity_key)
 
 
     def stream(
         self,
         messages:List[BaseMessage],
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        priority: int = PRIORITY_BATCH,
+        affinity_key: Optional[str] = None
     ) -> Iterator[str]:
         """流式生成回复"""
         if system_prompt:
             messages = [SystemMessage(content=system_prompt)] + messages
         
-        for chunk in self.llm.stream(messages):
-            if chunk.content:
-                yield chunk.content
+        lease = llm_admission.acquire_sync(priority)
+        try:
+            for chunk in self.router.stream(messages, affinity_key):
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            lease.release()
+
+    async def astream(
+        self,
+        messages: List[BaseMessage],
+        system_prompt: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        lease: Optional[LLMLease] = None,
+        affinity_key: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """异步流式生成回复（等待每个 token 时不阻塞事件循环）
+
+        lease 为调用方预先获取的并发名额（以便在响应开始前返回 429/503），不传时在这里排队获取。
+        """
+        if system_prompt:
+            messages = [SystemMessage(content=system_prompt)] + messages
+
+        lease = lease or await llm_admission.acquire(priority)
+        try:
+            async for chunk in self.router.astream(messages, affinity_key):
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            lease.release()
     
     def stream_with_context(
         self,
         user_message: str,
         context: List[str],
         conversation_history: List[dict],
-        user_memories: List[dict] = None
+        user_memories: List[dict] = None,
+        core_memories: List[dict] = None,
+        priority: int = PRIORITY_BATCH,
+        affinity_key: Optional[str] = None
     ) -> Iterator[str]:
         """基于上下文流式生成回复"""
+        messages, system_prompt = self._build_messages(
+            user_message, context, conversation_history, user_memories, core_memories
+        )
+        yield from self.stream(messages, system_prompt, priority=priority, affinity_key=affinity_key)
+
+    async def astream_with_context(
+        self,
+        user_message: str,
+        context: List[str],
+        conversation_history: List[dict],
+        user_memories: List[dict] = None,
+        core_memories: List[dict] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        lease: Optional[LLMLease] = None,
+        affinity_key: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """基于上下文异步流式生成回复"""
+        messages, system_prompt = self._build_messages(
+            user_message, context, conversation_history, user_memories, core_memories
+        )
+        async for chunk in self.astream(messages, system_prompt, priority=priority, lease=lease, affinity_key=affinity_key):
+            yield chunk
+
+    def _build_messages(
+        self,
+        user_message: str,
+        context: List[str],
+        conversation_history: List[dict],
+        user_memories: List[dict] = None,
+        core_memories: List[dict] = None
+    ) -> Tuple[List[BaseMessage], str]:
+        """构建 (消息列表, 系统提示)：历史对话 + 带知识库内容的当前问题"""
+        if self.prompt_layout == PROMPT_LAYOUT_PREFIX_CACHE:
+            return self._build_prefix_cached_messages(
+                user_message, context, conversation_history, user_memories, core_memories
+            )
+
+        # 构建系统提示
         logger.info(f"user_memories: {user_memories}")
         system_prompt = self._build_system_prompt(user_memories)
         logger.info(f"system_prompt: {system_prompt}")
         
-        context_text = "\n\n".join([
-            f"[文档 {i+1}]: {doc}" for i, doc in enumerate(context)
-        ])
+        # 构建历史对话
+        history_messages = self._history_messages(conversation_history[-10:])  # 最近10轮对话
         
-        history_messages = []
-        for msg in conversation_history[-10:]:
+        # 构建当前消息
+        current_message = self._question_message(user_message, context)
+        
+        return history_messages + [HumanMessage(content=current_message)], system_prompt
+
+    def _build_prefix_cached_messages(
+        self,
+        user_message: str,
+        context: List[str],
+        conversation_history: List[dict],
+        user_memories: List[dict] = None,
+        core_memories: List[dict] = None
+    ) -> Tuple[List[BaseMessage], str]:
+        """按内容稳定程度排列的提示词，便于推理服务复用前缀 KV 缓存
+
+        系统提示（逐字节固定）+ 长期记忆 → 历史对话（窗口起点固定）→ 本轮相关记忆、知识库内容和问题。
+        同一用户相邻几轮请求只有最后一条消息不同，前面的部分都能命中前缀缓存。
+        """
+        system_prompt = BASE_SYSTEM_PROMPT
+        if core_memories:
+            system_prompt += self._memory_text("用户长期记忆", core_memories)
+
+        history_messages = self._history_messages(self._stable_history(conversation_history))
+
+        core = {m.get("content") for m in core_memories or []}
+        relevant = [m for m in user_memories or [] if m.get("content") not in core]
+        current_message = self._question_message(user_message, context)
+        if relevant:
+            current_message = self._memory_text("与本问题相关的用户记忆", relevant).lstrip("\n") + "\n" + current_message
+
+        return history_messages + [HumanMessage(content=current_message)], system_prompt
+
+    @staticmethod
+    def _stable_history(conversation_history: List[dict]) -> List[dict]:
+        """选取历史对话窗口，使窗口起点在相邻几轮请求之间保持不变
+
+        起点只取在由该轮内容决定的“锚点”用户消息上：在保留 HISTORY_MIN_MESSAGES ~ HISTORY_MAX_MESSAGES
+        条消息的范围内取最早的锚点，新对话追加在末尾时起点不动，历史前缀随之保持不变；
+        范围内没有锚点时退回到最近 HISTORY_MIN_MESSAGES 条。
+        """
+        first = max(0, len(conversation_history) - HISTORY_MAX_MESSAGES)
+        last = len(conversation_history) - HISTORY_MIN_MESSAGES
+        for start in range(first, last + 1):
+            message = conversation_history[start]
+            if message["role"] != "user":
+                continue
+            key = f"{message.get('timestamp')}|{message['content']}".encode("utf-8")
+            if int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") % HISTORY_ANCHOR_EVERY == 0:
+                return conversation_history[start:]
+        return conversation_history[-HISTORY_MIN_MESSAGES:]
+
+    @staticmethod
+    def _history_messages(conversation_history: List[dict]) -> List[BaseMessage]:
+        messages = []
+        for msg in conversation_history:
             if msg["role"] == "user":
-                history_messages.append(HumanMessage(content=msg["content"]))
+                messages.append(HumanMessage(content=msg["content"]))
             else:
-                history_messages.append(AIMessage(content=msg["content"]))
-        
-        current_message = f"""基于以下知识库内容回答问题：
+                messages.append(AIMessage(content=msg["content"]))
+        return messages
 
-    {context_text}用户问题：{user_message}"""
-        
-        messages = history_messages + [HumanMessage(content=current_message)]
-        
-        # 流式生成
-        for chunk in self.stream(messages, system_prompt):
-            yield chunk
+    @staticmethod
+    def _question_message(user_message: str, context: List[str]) -> str:
+        # 构建上下文
+        context_text = "\n\n".join([
+            f"[文档 {i+1}]: {doc}" for i, doc in enumerate(context)
+        ])
+        return f"""基于以下知识库内容回答问题：
 
+{context_text}
 
-    
+用户问题：{user_message}"""
+
+    @staticmethod
+    def _memory_text(title: str, memories: List[dict]) -> str:
+        memory_text = f"\n\n{title}：\n"
+        for i, memory in enumerate(memories[:5], 1):  # 最多使用5条记忆
+            memory_text += f"{i}. {memory.get('content', '')}\n"
+        return memory_text
     
     def _build_system_prompt(self, user_memories: List[dict] = None) -> str:
         """构建系统提示"""
-        base_prompt = """你是一个智能助手，能够基于提供的知识库内容和用户的历史对话记忆回答问题。
-                        请遵循以下原则：
-                        1. 基于知识库内容回答，不要编造信息
-                        2. 如果知识库中没有相关信息，诚实告知用户
-                        3. 结合用户的历史记忆，提供个性化的回答
-                        4. 回答要准确、清晰、有帮助
-                        5. 使用中文回答
-                        """
+        base_prompt = BASE_SYSTEM_PROMPT
         
         # 如果有用户记忆，添加到系统提示中
         if user_memories:
-            memory_text = "\n\n用户相关记忆：\n"
-            for i, memory in enumerate(user_memories[:5], 1):  # 最多使用5条记忆
-                memory_text += f"{i}. {memory.get('content', '')}\n"
-            base_prompt += memory_text
+            base_prompt += self._memory_text("用户相关记忆", user_memories)
         
         return base_prompt
 
@@ -113,10 +113,12 @@ class MemoryService:
         self,
         user_id: str,
         query: str,
-        top_k: int = 5
+        top_k: int = 5,
+        query_vector: Optional[List[float]] = None
     ) -> List[dict]:
-        """检索相关记忆"""
-        query_vector = embedding_service.encode_single(query)
+        """检索相关记忆（query_vector 为已经算好的查询向量，不传时在这里向量化）"""
+        if query_vector is None:
+            query_vector = embedding_service.encode_single(query)
         
         # 获取用户的所有记忆
         memories = list(self.memory_collection.find({"user_id": user_id}))
@@ -153,6 +155,18 @@ class MemoryService:
         
         return scored_memories[:top_k]
 
+    def get_core_memories(self, user_id: str, limit: int = 5) -> List[dict]:
+        """获取长期记忆：重要性最高的若干条，按写入时间排序
+
+        与当前问题无关，相邻几轮对话得到的内容和顺序相同，适合放在提示词的固定前缀中。
+        """
+        memories = list(self.memory_collection.find(
+            {"user_id": user_id},
+            {"vector": 0}
+        ).sort([("importance", -1), ("timestamp", 1), ("_id", 1)]).limit(limit))
+        memories.sort(key=lambda m: (m["timestamp"], str(m["_id"])))
+        return memories
+
 
 # 全局记忆服务实例
 memory_service = MemoryService()
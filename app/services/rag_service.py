@@ -1,8 +1,22 @@
-from typing import List, Dict
-from app.core.milvus_client import MilvusClient
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from app.core.vector_store import create_vector_store, TENANT_FIELD, normalize_tenant
 from app.services.embedding_service import embedding_service
 from app.core.config import settings
-from app.utils.text_processor import TextProcessor
+from app.utils.text_processor import TextProcessor, content_hash
+from app.services.ingestion_pipeline import IngestionPipeline, insert_batches, stable_doc_id
+from app.services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from app.services.rerank_service import rerank_service
+from app.services.context_compressor import context_compressor
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import functools
+import asyncio
+import numpy as np
+import codecs
+import threading
+import time
 import logging
 
 logging.basicConfig(
@@ -12,35 +26,423 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# 查询向量缓存条数（同一问题的检索和语义缓存查找只向量化一次）
+QUERY_VECTOR_CACHE_SIZE = 256
+
+# 由系统维护的元数据键，比较文档块元数据是否变化时忽略
+DOC_BOOKKEEPING_KEYS = ("doc_id", "doc_version", "chunk_index", "created_at", TENANT_FIELD)
+
+
+def maximal_marginal_relevance(
+    query_vector: List[float],
+    vectors: List[List[float]],
+    top_k: int,
+    lambda_mult: float = 0.7,
+    min_ratio: float = 0.0
+) -> List[int]:
+    """最大边际相关性（MMR）选择，返回选中候选的下标（按选择顺序）
+
+    每一步选 λ·sim(查询, 候选) − (1−λ)·max sim(候选, 已选) 最大的候选；
+    该值低于第一个选中候选的 min_ratio 倍时停止，相关性下降或只剩重复内容时不再凑满 top_k。
+    候选之间的相似度矩阵一次算出，每一步只更新各候选与已选集合的最大相似度。
+    """
+    if not vectors or top_k <= 0:
+        return []
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = lambda_mult * (matrix @ query)
+    similarity = matrix @ matrix.T
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = similarity[first].copy()
+    available = np.ones(len(matrix), dtype=bool)
+    available[first] = False
+    while len(selected) < min(top_k, len(matrix)):
+        marginal = np.where(available, relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(marginal))
+        if relevance[first] > 0 and marginal[best] < relevance[first] * min_ratio:
+            break
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+
 class RAGService:
     """RAG 检索增强生成服务"""
     
     def __init__(self):
-        self.milvus_client = MilvusClient()
+        self.vector_store = create_vector_store()
         self.text_processor = TextProcessor()
         self.top_k = settings.rag_top_k
         self.similarity_threshold = settings.rag_similarity_threshold
+
+        # 知识库每次写入或删除后递增，语义回答缓存据此失效
+        self._kb_generation = 0
+        self._query_vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_vectors_lock = threading.Lock()
+        # 按 (租户, doc_id) 串行化同一文档的增量更新，值为 [锁, 使用中的请求数]
+        self._doc_locks: Dict[Tuple[str, str], list] = {}
+        self._doc_locks_lock = threading.Lock()
+
+        # 异步接口的隔离舱：检索和写入在各自的有界线程池中执行，
+        # 不阻塞事件循环，大批量写入也不会占满检索可用的线程
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=settings.rag_search_workers,
+            thread_name_prefix="rag-search"
+        )
+        self._write_executor = ThreadPoolExecutor(
+            max_workers=settings.rag_write_workers,
+            thread_name_prefix="rag-write"
+        )
+
+        # 混合检索：进程内词法索引 + 向量检索，RRF 融合
+        self.lexical_index: LexicalIndex = None
+        self._lexical_rebuilding = threading.Lock()
+        if settings.rag_hybrid_enabled:
+            self._init_lexical_index()
+
+    def _init_lexical_index(self):
+        """加载词法索引；不存在或与当前集合不一致时在后台重建"""
+        path = Path(settings.rag_lexical_index_path)
+        if not path.is_absolute():
+            path = Path(__file__).parent.parent.parent / path
+        self.lexical_index = LexicalIndex(path, save_interval=settings.rag_lexical_save_interval)
+        try:
+            loaded = self.lexical_index.load()
+        except Exception as e:
+            logger.error(f"加载词法索引失败: {e}", exc_info=True)
+            loaded = False
+        if not loaded or self.lexical_index.source != self.vector_store.physical_collection:
+            self.rebuild_lexical_index(background=True)
+        self.lexical_index.start_autosave()
+
+    def rebuild_lexical_index(self, background: bool = False):
+        """从向量存储全量重建词法索引"""
+        if self.lexical_index is None:
+            return
+        if background:
+            threading.Thread(target=self.rebuild_lexical_index, name="lexical-index-rebuild", daemon=True).start()
+            return
+        if not self._lexical_rebuilding.acquire(blocking=False):
+            logger.info("词法索引正在重建，跳过")
+            return
+        try:
+            source = self.vector_store.physical_collection
+            logger.info(f"开始重建词法索引: {source}")
+            rows = (
+                (row["id"], row["text"], (row.get("metadata") or {}).get(TENANT_FIELD) or settings.tenant_shared)
+                for page in self.vector_store.export_pages(page_size=5000)
+                for row in page
+            )
+            self.lexical_index.rebuild(rows, source=source)
+            self.lexical_index.save()
+        except Exception as e:
+            logger.error(f"重建词法索引失败: {e}", exc_info=True)
+        finally:
+            self._lexical_rebuilding.release()
+
+    def _lexical_ready(self) -> bool:
+        """词法索引可用（集合被重建或从快照恢复后主键会变化，需要重建）"""
+        if self.lexical_index is None:
+            return False
+        if self._lexical_rebuilding.locked():
+            return False
+        if self.lexical_index.source != self.vector_store.physical_collection:
+            self.rebuild_lexical_index(background=True)
+            return False
+        return True
+
+    def _on_insert(self, ids: List[int], texts: List[str], metadatas: List[dict]):
+        self._kb_generation += 1
+        if self.lexical_index is not None:
+            tenants = [normalize_tenant(metadata.get(TENANT_FIELD)) for metadata in metadatas]
+            self.lexical_index.add(ids, texts, tenants)
+
+    def _on_delete(self, ids: List[int]):
+        self._kb_generation += 1
+        if self.lexical_index is not None:
+            self.lexical_index.remove(ids)
     
-    def add_documents(self, texts: List[str], metadatas: List[dict] = None):
-        """添加文档到知识库"""
+    def kb_version(self) -> tuple:
+        """知识库版本：物理集合（整体替换后变化）+ 本进程内的写入次数"""
+        return (self.vector_store.physical_collection, self._kb_generation)
+
+    def embed_query(self, query: str) -> List[float]:
+        """向量化查询（最近的查询向量会被缓存）"""
+        with self._query_vectors_lock:
+            vector = self._query_vectors.get(query)
+            if vector is not None:
+                self._query_vectors.move_to_end(query)
+                return vector
+        vector = embedding_service.encode_single(query)
+        with self._query_vectors_lock:
+            self._query_vectors[query] = vector
+            while len(self._query_vectors) > QUERY_VECTOR_CACHE_SIZE:
+                self._query_vectors.popitem(last=False)
+        return vector
+
+    async def embed_query_async(self, query: str) -> List[float]:
+        """embed_query 的异步版本，在检索线程池中执行"""
+        return await self._run_in(self._search_executor, self.embed_query, query)
+
+    def create_pipeline(self, **kwargs) -> IngestionPipeline:
+        """创建入库流水线"""
+        return IngestionPipeline(
+            self.text_processor,
+            self.vector_store,
+            embedding_service.encode,
+            on_insert=self._on_insert,
+            **kwargs
+        )
+
+    def add_documents(self, texts: List[str], metadatas: List[dict] = None, tenant: Optional[str] = None) -> Dict:
+        """添加文档到租户的知识库（未指定租户时写入共享知识库）"""
         if metadatas is None:
             metadatas = [{}] * len(texts)
+        # 按文件名或指定的 doc_id 标识的文档可能是重新同步，内容变化后要删除旧版本多出来的块
+        resynced = [bool(metadata.get("filename") or metadata.get("doc_id")) for metadata in metadatas]
+        metadatas = [
+            self.with_doc_identity(metadata, tenant, text)
+            for text, metadata in zip(texts, metadatas)
+        ]
         
-        # 文本分块
-        chunks = []
-        chunk_metadatas = []
-        
-        for text, metadata in zip(texts, metadatas):
-            text_chunks = self.text_processor.split_text(text)
-            chunks.extend(text_chunks)
-            chunk_metadatas.extend([metadata] * len(text_chunks))
-        
-        # 生成向量
-        vectors = embedding_service.encode(chunks)
-        
-        # 插入 Milvus
-        self.milvus_client.insert(chunks, vectors, chunk_metadatas)
-        logger.info(f"已添加 {len(chunks)} 个文档块到知识库")
+        # 分块、向量化、写入向量存储三个阶段流水线并发执行
+        pipeline = self.create_pipeline()
+        stats = pipeline.run(texts, metadatas)
+        stats["deleted"] = self.prune_resynced(
+            pipeline,
+            [metadata for metadata, flag in zip(metadatas, resynced) if flag]
+        )
+        stats["doc_ids"] = [metadata["doc_id"] for metadata in metadatas]
+        logger.info(
+            f"已添加 {stats['chunks']} 个文档块到知识库，耗时 {stats['seconds']}s，"
+            f"瓶颈阶段: {stats['bottleneck']}"
+        )
+        return stats
+
+    async def add_documents_async(
+        self,
+        texts: List[str],
+        metadatas: List[dict] = None,
+        tenant: Optional[str] = None
+    ) -> Dict:
+        """add_documents 的异步版本，在写入线程池中执行"""
+        return await self._run_in(self._write_executor, self.add_documents, texts, metadatas, tenant)
+
+    async def _run_in(self, executor: ThreadPoolExecutor, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    def with_doc_identity(self, metadata: dict, tenant: Optional[str] = None, text: Optional[str] = None) -> dict:
+        """补全文档标识：未指定 doc_id 时按文件名或全文内容生成稳定的 id，版本从 1 开始，并记录入库时间和所属租户
+
+        同一文档重新同步时得到同一个 doc_id，未变化的块由 skip 去重跳过，不会重复写入。
+        """
+        metadata = dict(metadata or {})
+        metadata[TENANT_FIELD] = normalize_tenant(tenant or metadata.get(TENANT_FIELD))
+        if not metadata.get("doc_id"):
+            metadata["doc_id"] = stable_doc_id(metadata[TENANT_FIELD], metadata, text)
+        metadata.setdefault("doc_version", 1)
+        metadata.setdefault("created_at", int(time.time()))
+        return metadata
+
+    def prune_resynced(self, pipeline: IngestionPipeline, metadatas: List[dict]) -> int:
+        """删除重新同步的文档中本次没有再出现的旧块，返回删除的块数"""
+        stale_ids = []
+        for metadata in metadatas:
+            try:
+                stale_ids.extend(pipeline.stale_ids(metadata["doc_id"], metadata[TENANT_FIELD]))
+            except ValueError as e:
+                # 旧集合没有 doc_id 字段
+                logger.warning(f"无法清理文档 {metadata['doc_id']} 的旧块: {e}")
+                return 0
+        if stale_ids:
+            self.vector_store.delete(stale_ids)
+            self._on_delete(stale_ids)
+            logger.info(f"重新同步的文档删除了 {len(stale_ids)} 个不再出现的旧块")
+        return len(stale_ids)
+
+    def abort_pipeline(self, pipeline: IngestionPipeline) -> int:
+        """入库失败时停止流水线并删除本次已经写入的文档块，返回删除的块数
+
+        只删除这条流水线写入的行，同名文件重新上传失败时旧版本保持不变。
+        """
+        try:
+            pipeline.join()
+        except Exception as e:
+            logger.warning(f"停止入库流水线时出错: {e}")
+        ids = list(pipeline.inserted_ids)
+        if ids:
+            self.delete_documents(ids)
+        return len(ids)
+
+    def upsert_document(
+        self,
+        doc_id: str,
+        text: str,
+        metadata: dict = None,
+        tenant: Optional[str] = None
+    ) -> Dict:
+        """按文档增量更新
+
+        新旧文档块按内容哈希比对：未变化的块保留，只向量化新出现的文本，
+        元数据变化的块复用原向量重新写入，最后删除不再需要的旧块。
+        同一进程内对同一文档的并发更新依次执行，否则两个请求都会把对方当作旧版本比对并各自写入一份。
+        """
+        tenant = normalize_tenant(tenant)
+        with self._doc_lock(tenant, doc_id):
+            return self._upsert_document(doc_id, text, metadata, tenant)
+
+    @contextmanager
+    def _doc_lock(self, tenant: str, doc_id: str):
+        key = (tenant, doc_id)
+        with self._doc_locks_lock:
+            entry = self._doc_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._doc_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._doc_locks[key]
+
+    def _upsert_document(self, doc_id: str, text: str, metadata: Optional[dict], tenant: str) -> Dict:
+        created_at = (metadata or {}).get("created_at")
+        metadata = {
+            key: value for key, value in (metadata or {}).items()
+            if key not in DOC_BOOKKEEPING_KEYS
+        }
+        existing = self.vector_store.query_by_doc(
+            doc_id,
+            ["id", "content_hash", "doc_version", "metadata", "vector"],
+            tenant
+        )
+        version = max((row["doc_version"] for row in existing), default=0) + 1
+        # 文档的创建时间沿用最早写入的时间
+        if created_at is None:
+            created_at = min(
+                (row["metadata"]["created_at"] for row in existing if (row.get("metadata") or {}).get("created_at")),
+                default=int(time.time())
+            )
+
+        # 同一内容可能出现多次，按哈希分组逐个匹配
+        existing_by_hash: Dict[str, List[dict]] = {}
+        for row in existing:
+            existing_by_hash.setdefault(row["content_hash"], []).append(row)
+
+        chunks = self.text_processor.split_text(text)
+        unchanged = 0
+        replaced_ids = []   # 元数据变化、需要重新写入的旧块
+        to_embed = []       # (chunk, metadata)
+        to_reinsert = []    # (chunk, vector, metadata)
+        for chunk_index, chunk in enumerate(chunks):
+            chunk_metadata = {
+                **metadata,
+                "doc_id": doc_id,
+                "doc_version": version,
+                "chunk_index": chunk_index,
+                "created_at": created_at,
+                TENANT_FIELD: tenant
+            }
+            candidates = existing_by_hash.get(content_hash(chunk))
+            if not candidates:
+                to_embed.append((chunk, chunk_metadata))
+                continue
+            row = candidates.pop()
+            stored_metadata = {
+                key: value for key, value in (row.get("metadata") or {}).items()
+                if key not in DOC_BOOKKEEPING_KEYS
+            }
+            if stored_metadata == metadata:
+                unchanged += 1
+            else:
+                to_reinsert.append((chunk, row["vector"], chunk_metadata))
+                replaced_ids.append(row["id"])
+        stale_ids = replaced_ids + [row["id"] for rows in existing_by_hash.values() for row in rows]
+
+        rows = list(to_reinsert)
+        if to_embed:
+            vectors = embedding_service.encode([chunk for chunk, _ in to_embed])
+            rows.extend(
+                (chunk, vector, chunk_metadata)
+                for (chunk, chunk_metadata), vector in zip(to_embed, vectors)
+            )
+
+        # 先写入新块再删除旧块，更新期间文档始终可检索；与入库流水线一样分批写入，单次请求不超过 gRPC 消息上限
+        inserted_ids = []
+        try:
+            for batch in insert_batches(rows):
+                texts = [row[0] for row in batch]
+                metadatas = [row[2] for row in batch]
+                ids = self.vector_store.insert(texts, [row[1] for row in batch], metadatas)
+                inserted_ids.extend(ids)
+                self._on_insert(ids, texts, metadatas)
+        except Exception:
+            # 部分批次写入失败时删除已写入的新块，文档保持更新前的状态
+            if inserted_ids:
+                self.delete_documents(inserted_ids)
+            raise
+        if stale_ids:
+            self.vector_store.delete(stale_ids)
+            self._on_delete(stale_ids)
+
+        result = {
+            "doc_id": doc_id,
+            "tenant": tenant,
+            "version": version,
+            "chunks": len(chunks),
+            "unchanged": unchanged,
+            "embedded": len(to_embed),
+            "reused": len(to_reinsert),
+            "deleted": len(stale_ids)
+        }
+        logger.info(f"文档增量更新完成: {result}")
+        return result
+
+    def delete_document(self, doc_id: str, tenant: Optional[str] = None) -> int:
+        """删除租户内的整个文档，返回删除的文档块数量"""
+        ids = self.vector_store.delete_by_doc(doc_id, tenant)
+        self._on_delete(ids)
+        logger.info(f"已删除文档 {doc_id} 的 {len(ids)} 个文档块")
+        return len(ids)
+
+    async def add_byte_stream(
+        self,
+        pipeline: IngestionPipeline,
+        blocks: AsyncIterator[bytes],
+        metadata: dict,
+        encoding: str = "utf-8"
+    ) -> int:
+        """增量解码字节流并流式分块，文本块产生后立即送入流水线
+
+        内存占用只与块大小有关，与文件大小无关。返回文档块数量。
+        """
+        decoder = codecs.getincrementaldecoder(encoding)()
+        splitter = self.text_processor.stream_splitter()
+        chunk_count = 0
+
+        async for block in blocks:
+            chunks = splitter.feed(decoder.decode(block))
+            if chunks:
+                # 队列满时 submit 会阻塞，放到线程池执行以免阻塞事件循环
+                await asyncio.to_thread(self._submit_chunks, pipeline, chunks, metadata, chunk_count)
+                chunk_count += len(chunks)
+
+        chunks = splitter.feed(decoder.decode(b"", final=True)) + splitter.finish()
+        if chunks:
+            await asyncio.to_thread(self._submit_chunks, pipeline, chunks, metadata, chunk_count)
+            chunk_count += len(chunks)
+        return chunk_count
+
+    def _submit_chunks(self, pipeline: IngestionPipeline, chunks: List[str], metadata: dict, start_index: int):
+        for chunk_index, chunk in enumerate(chunks, start_index):
+            pipeline.submit_chunk(chunk, {**metadata, "chunk_index": chunk_index})
 
     def delete_documents(self,ids:List[int]):
         """删除文档"""
@@ -48,25 +450,63 @@ class RAGService:
             logger.warning("删除列表为空")
             return 
 
-        self.milvus_client.delete(ids)
+        self.vector_store.delete(ids)
+        self._on_delete(ids)
         logger.info(f"已删除 {len(ids)} 个文档")
 
     
-    def search(self, query: str, top_k: int = None) -> List[Dict]:
-        """检索相关文档"""
+    def search_tenants(self, tenant: Optional[str] = None, include_shared: Optional[bool] = None) -> List[str]:
+        """检索范围：租户自己的知识库，加上（可选的）共享知识库"""
+        if include_shared is None:
+            include_shared = settings.tenant_include_shared
+        tenants = [normalize_tenant(tenant)]
+        if include_shared and settings.tenant_shared not in tenants:
+            tenants.append(settings.tenant_shared)
+        return tenants
+
+    def search(
+        self,
+        query: str,
+        top_k: int = None,
+        filters: Optional[Dict[str, Any]] = None,
+        tenant: Optional[str] = None,
+        include_shared: Optional[bool] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Dict]:
+        """检索相关文档
+
+        filters 按标量字段过滤（source / filename / topic / created_at / doc_id），
+        条件下推到向量存储执行，例如 {"source": "wiki", "created_at": {"gte": 1700000000}}。
+        tenant 限定检索的租户，Milvus 按 partition key 只扫描该租户（和共享租户）所在的分区，
+        本地存储只对该租户的行做精确计算。
+        query_vector 为已经算好的查询向量（同一请求的其他检索共用），不传时在这里向量化。
+        """
+        tenants = self.search_tenants(tenant, include_shared)
         if top_k is None:
             top_k = self.top_k
         
         # 生成查询向量
-        query_vector = embedding_service.encode_single(query)
+        if query_vector is None:
+            query_vector = self.embed_query(query)
 
         
         
-        # 向量搜索
-        results = self.milvus_client.search(query_vector, top_k=top_k)
+        hybrid = self._lexical_ready()
+        rerank = settings.rag_rerank_enabled
+        mmr = settings.rag_mmr_enabled
 
-        logger.info(f"检索查询: '{query}'")
-        logger.info(f"Milvus 返回 {len(results)} 个结果（过滤前）")
+        # 开启重排时先取更宽的候选集，由交叉编码器挑出最好的几个；
+        # 开启 MMR 时从更宽的候选集中挑出相关且互不重复的块，top_k 只是上限
+        candidate_k = max(top_k, settings.rag_rerank_candidates) if rerank else top_k
+        if mmr:
+            candidate_k = max(candidate_k, settings.rag_mmr_candidates)
+
+        # 向量搜索（混合检索时多取一些候选参与融合）
+        vector_top_k = max(candidate_k, settings.rag_hybrid_candidates) if hybrid else candidate_k
+        results = self.vector_store.search(query_vector, top_k=vector_top_k, filters=filters, tenants=tenants)
+
+        logger.info(f"检索查询: '{query}', 租户: {tenants}" + (f", 过滤条件: {filters}" if filters else ""))
+        logger.info(f"向量检索返回 {len(results)} 个结果（过滤前）")
 
         if results:
             scores = [r['score'] for r in results]
@@ -75,7 +515,7 @@ class RAGService:
             for i, r in enumerate(results[:3], 1):  # 只显示前3个
                 logger.info(f"  结果 {i}: 相似度={r['score']:.4f}, 文本={r['text'][:50]}...")
         else:
-            logger.warning("Milvus 未返回任何结果（可能知识库为空）")
+            logger.warning("向量检索未返回任何结果（可能知识库为空）")
         
         
         # 过滤低相似度结果
@@ -83,12 +523,137 @@ class RAGService:
             r for r in results 
             if r["score"] >= self.similarity_threshold
         ]
-        
+
+        if hybrid:
+            filtered_results = self._hybrid_fuse(query, query_vector, filtered_results, candidate_k, filters, tenants)
+
+        vectors = None
+        if mmr and filtered_results:
+            filtered_results, vectors = self._select_diverse(
+                query_vector,
+                filtered_results,
+                settings.rag_rerank_candidates if rerank else top_k
+            )
+
+        if rerank:
+            filtered_results = rerank_service.rerank(
+                query,
+                filtered_results,
+                min(top_k, settings.rag_rerank_top_n)
+            )
+
+        if settings.rag_compress_enabled:
+            filtered_results = context_compressor.compress(query_vector, filtered_results, self.vector_store, vectors)
+
         return filtered_results
 
-    def  get_all_documents(self,limit:int =1000) ->List[Dict]:
-        """获取所有文档"""
-        return self.milvus_client.query_all(limit)
+    def _select_diverse(
+        self,
+        query_vector: List[float],
+        results: List[Dict],
+        top_k: int
+    ) -> Tuple[List[Dict], Optional[Dict[int, List[float]]]]:
+        """按 MMR 从候选中选出相关且互不重复的块，返回 (选中的块, 候选的向量)"""
+        try:
+            rows = self.vector_store.get_by_ids([r["id"] for r in results], with_vectors=True)
+        except Exception as e:
+            logger.warning(f"读取候选向量失败，跳过 MMR: {e}")
+            return results[:top_k], None
+        vectors = {row["id"]: row["vector"] for row in rows}
+        # 读取时已被删除的块不再参与选择
+        results = [r for r in results if r["id"] in vectors]
+        selected = maximal_marginal_relevance(
+            query_vector,
+            [vectors[r["id"]] for r in results],
+            top_k,
+            lambda_mult=settings.rag_mmr_lambda,
+            min_ratio=settings.rag_mmr_min_ratio
+        )
+        logger.info(f"MMR: {len(results)} 个候选中选出 {len(selected)} 个（上限 {top_k}）")
+        return [results[i] for i in selected], vectors
+
+    async def search_async(
+        self,
+        query: str,
+        top_k: int = None,
+        filters: Optional[Dict[str, Any]] = None,
+        tenant: Optional[str] = None,
+        include_shared: Optional[bool] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Dict]:
+        """search 的异步版本，在检索线程池中执行，并发请求的检索互不排队等待事件循环"""
+        return await self._run_in(
+            self._search_executor,
+            self.search,
+            query,
+            top_k=top_k,
+            filters=filters,
+            tenant=tenant,
+            include_shared=include_shared,
+            query_vector=query_vector
+        )
+
+    def _hybrid_fuse(
+        self,
+        query: str,
+        query_vector: List[float],
+        vector_results: List[Dict],
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        tenants: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """把词法检索结果与向量结果按 RRF 融合"""
+        lexical_hits = self.lexical_index.search(query, settings.rag_hybrid_candidates, groups=tenants)
+        lexical_scores = dict(lexical_hits)
+        fused = reciprocal_rank_fusion(
+            [[r["id"] for r in vector_results], [doc_id for doc_id, _ in lexical_hits]],
+            k=settings.rag_rrf_k
+        )
+
+        # 只被词法索引命中的文档块需要回表读取文本，并补算向量相似度；
+        # 回表时带上过滤条件，不满足条件的词法结果在这里被剔除
+        by_id = {r["id"]: r for r in vector_results}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if missing:
+            rows = self.vector_store.get_by_ids(missing, with_vectors=True, filters=filters, tenants=tenants)
+            distances = self.vector_store.compute_distances(query_vector, [row["vector"] for row in rows])
+            for row, distance in zip(rows, distances):
+                by_id[row["id"]] = {
+                    "id": row["id"],
+                    "text": row["text"],
+                    "metadata": row.get("metadata"),
+                    "distance": distance,
+                    "score": self.vector_store.distance_to_score(distance)
+                }
+
+        results = []
+        for doc_id, rrf_score in fused:
+            # 词法索引可能还保留着刚被其他进程删除的 id，或者该块被过滤掉了
+            if doc_id not in by_id:
+                continue
+            if len(results) >= top_k:
+                break
+            results.append({
+                **by_id[doc_id],
+                "rrf_score": rrf_score,
+                "lexical_score": lexical_scores.get(doc_id)
+            })
+        logger.info(f"混合检索: 向量 {len(vector_results)} 个, 词法 {len(lexical_hits)} 个, 融合后 {len(results)} 个")
+        return results
+
+    def tenant_stats(self, tenant: str) -> Dict:
+        """租户知识库统计"""
+        return self.vector_store.tenant_stats(tenant)
+
+    def purge_tenant(self, tenant: str) -> int:
+        """清空租户知识库，返回删除的文档块数量"""
+        ids = self.vector_store.purge_tenant(tenant)
+        self._on_delete(ids)
+        return len(ids)
+
+    def  get_all_documents(self,limit:int =1000, cursor: Optional[int] = None) ->List[Dict]:
+        """按主键顺序分页获取文档（cursor 为上一页最后一个 id）"""
+        return self.vector_store.query_all(limit, cursor)
     
 
 
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from app.core.config import settings
+from app.utils.text_processor import content_hash
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RerankService:
+    """交叉编码器重排服务
+
+    对 (query, 文档块) 做一次批量 CPU 打分，分数按内容哈希缓存；
+    预计耗时超过延迟预算时直接跳过重排，保持原有排序。
+    """
+
+    def __init__(self):
+        self.model_name = settings.rag_rerank_model
+        self.device = settings.embedding_device
+        self.budget_ms = settings.rag_rerank_budget_ms
+        self.cache_size = settings.rag_rerank_cache_size
+
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # 单个文本对的平均打分耗时（指数滑动平均），用于预估批次耗时
+        self._pair_ms: Optional[float] = None
+        self.stats = {"calls": 0, "bypassed": 0, "over_budget": 0, "cache_hits": 0, "scored_pairs": 0}
+
+    def _load_model(self):
+        """首次使用时加载交叉编码器"""
+        with self._load_lock:
+            if self.model is not None:
+                return
+            from sentence_transformers import CrossEncoder
+
+            cache_folder = Path(__file__).parent.parent.parent / "models" / "rerank"
+            cache_folder.mkdir(parents=True, exist_ok=True)
+            self.model = CrossEncoder(self.model_name, device=self.device, cache_folder=str(cache_folder))
+            logger.info(f"已加载重排模型: {self.model_name}")
+
+    def rerank(self, query: str, results: List[Dict], top_n: int) -> List[Dict]:
+        """按交叉编码器分数重排，返回前 top_n 个（带 rerank_score）"""
+        self.stats["calls"] += 1
+        if len(results) <= 1:
+            return results[:top_n]
+
+        query_key = content_hash(query)
+        keys = [(query_key, content_hash(r["text"])) for r in results]
+        scores: List[Optional[float]] = []
+        with self._cache_lock:
+            for key in keys:
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                scores.append(score)
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            estimated_ms = (self._pair_ms or 0.0) * len(missing)
+            if self._pair_ms is not None and estimated_ms > self.budget_ms:
+                self.stats["bypassed"] += 1
+                # 预估逐步衰减，避免一次偶发的慢调用让重排永久失效
+                self._pair_ms *= 0.9
+                logger.info(f"重排预计耗时 {estimated_ms:.0f}ms 超出预算 {self.budget_ms}ms，跳过重排")
+                return results[:top_n]
+
+            if self.model is None:
+                self._load_model()
+            started = time.perf_counter()
+            pairs = [(query, results[i]["text"]) for i in missing]
+            predicted = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            pair_ms = elapsed_ms / len(pairs)
+            self._pair_ms = pair_ms if self._pair_ms is None else 0.8 * self._pair_ms + 0.2 * pair_ms
+            self.stats["scored_pairs"] += len(pairs)
+            if elapsed_ms > self.budget_ms:
+                self.stats["over_budget"] += 1
+                logger.warning(f"重排耗时 {elapsed_ms:.0f}ms 超出预算 {self.budget_ms}ms")
+
+            with self._cache_lock:
+                for i, score in zip(missing, predicted):
+                    scores[i] = float(score)
+                    self._cache[keys[i]] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        ranked = sorted(
+            ({**r, "rerank_score": score} for r, score in zip(results, scores)),
+            key=lambda r: r["rerank_score"],
+            reverse=True
+        )
+        return ranked[:top_n]
+
+
+# 全局重排服务实例（模型在第一次重排时加载）
+rerank_service = RerankService()
@@ -0,0 +1,175 @@
+from typing import Any, Awaitable, Dict, List, Optional
+from app.core.config import settings
+from app.services.rag_service import rag_service
+from app.services.memory_service import memory_service
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# 对话历史条数、相关记忆条数
+HISTORY_LIMIT = 20
+MEMORY_TOP_K = 5
+CORE_MEMORY_LIMIT = 5
+
+
+class RetrievalResult:
+    """一轮对话在调用 LLM 之前需要的全部检索结果
+
+    某个阶段失败或超时时使用空结果，失败原因记录在 errors 中；
+    知识库检索失败时 rag_results 为 None（与“检索成功但没有命中”区分）。
+    """
+
+    def __init__(self):
+        self.query_vector: Optional[List[float]] = None
+        self.conversation_history: List[dict] = []
+        self.rag_results: Optional[List[dict]] = []
+        self.memories: List[dict] = []
+        # 长期记忆（与问题无关），只在提示词使用 prefix_cache 布局时获取
+        self.core_memories: List[dict] = []
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    @property
+    def context(self) -> List[str]:
+        return [r["text"] for r in self.rag_results or []]
+
+    @property
+    def sources(self) -> List[dict]:
+        return [
+            {
+                "text": r["text"],
+                "score": r["score"],
+                "metadata": r.get("metadata", {})
+            }
+            for r in self.rag_results or []
+        ]
+
+    @property
+    def personal_memories(self) -> List[dict]:
+        """本轮用到的全部个人记忆（长期记忆在前，按内容去重）"""
+        seen = set()
+        memories = []
+        for m in self.core_memories + self.memories:
+            if m["content"] not in seen:
+                seen.add(m["content"])
+                memories.append(m)
+        return memories
+
+    @property
+    def memories_used(self) -> List[dict]:
+        return [
+            {
+                "content": m["content"],
+                "type": m["memory_type"],
+                "importance": m["importance"]
+            }
+            for m in self.personal_memories
+        ]
+
+
+class RetrievalPlanner:
+    """对话请求的检索编排
+
+    查询只向量化一次，向量在知识库检索和记忆检索之间共用；
+    对话历史、知识库检索、记忆检索并发执行，各自有超时，
+    调用 LLM 之前的等待时间取决于最慢的阶段而不是各阶段之和。
+    """
+
+    async def plan(
+        self,
+        user_id: str,
+        message: str,
+        use_rag: bool = True,
+        use_memory: bool = True,
+        filters: Optional[Dict[str, Any]] = None,
+        tenant: Optional[str] = None,
+        include_shared: Optional[bool] = None
+    ) -> RetrievalResult:
+        result = RetrievalResult()
+        started = time.perf_counter()
+
+        # 对话历史不依赖查询向量，和向量化同时开始
+        stages = {
+            "history": asyncio.ensure_future(self._stage(
+                result,
+                "history",
+                asyncio.to_thread(memory_service.get_conversation_history, user_id, limit=HISTORY_LIMIT),
+                settings.chat_history_timeout
+            ))
+        }
+        if use_rag or use_memory:
+            result.query_vector = await self._stage(
+                result,
+                "embed",
+                rag_service.embed_query_async(message),
+                settings.chat_embed_timeout
+            )
+
+        # 向量化失败时知识库检索和记忆检索都跳过
+        if use_rag and result.query_vector is not None:
+            stages["rag"] = self._stage(
+                result,
+                "rag",
+                rag_service.search_async(
+                    message,
+                    filters=filters,
+                    tenant=tenant,
+                    include_shared=include_shared,
+                    query_vector=result.query_vector
+                ),
+                settings.chat_rag_timeout
+            )
+        if use_memory and result.query_vector is not None:
+            stages["memory"] = self._stage(
+                result,
+                "memory",
+                asyncio.to_thread(
+                    memory_service.get_relevant_memories,
+                    user_id,
+                    message,
+                    top_k=MEMORY_TOP_K,
+                    query_vector=result.query_vector
+                ),
+                settings.chat_memory_timeout
+            )
+
+        if use_memory and settings.llm_prompt_layout.lower() == "prefix_cache":
+            stages["core_memory"] = self._stage(
+                result,
+                "core_memory",
+                asyncio.to_thread(memory_service.get_core_memories, user_id, limit=CORE_MEMORY_LIMIT),
+                settings.chat_memory_timeout
+            )
+
+        outputs = dict(zip(stages, await asyncio.gather(*stages.values())))
+        result.conversation_history = outputs["history"] or []
+        if use_rag:
+            result.rag_results = outputs.get("rag")
+        result.memories = outputs.get("memory") or []
+        result.core_memories = outputs.get("core_memory") or []
+
+        result.timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"检索耗时(ms): {result.timings}" + (f", 失败阶段: {result.errors}" if result.errors else ""))
+        return result
+
+    async def _stage(self, result: RetrievalResult, name: str, awaitable: Awaitable, timeout: float):
+        """执行一个阶段：超时或失败时记录原因并返回 None"""
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout or None)
+        except asyncio.TimeoutError:
+            result.errors[name] = f"超时（{timeout}s）"
+            logger.warning(f"检索阶段 {name} 超过 {timeout}s，跳过")
+        except Exception as e:
+            result.errors[name] = str(e)
+            logger.error(f"检索阶段 {name} 失败: {e}", exc_info=True)
+        finally:
+            result.timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        return None
+
+
+# 全局检索编排实例
+retrieval_planner = RetrievalPlanner()
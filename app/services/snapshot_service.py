@@ -0,0 +1,242 @@
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from pathlib import Path
+from datetime import datetime, timezone
+from app.core.config import settings
+import numpy as np
+import logging
+import shutil
+import struct
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+
+# 快照格式版本
+SNAPSHOT_FORMAT_VERSION = 1
+
+# 快照目录中的文件
+#   manifest.json          模型、维度、索引参数、行数
+#   vectors.npy            float32 向量矩阵 (N, dim)，可直接 np.load(mmap_mode="r")
+#   text.bin / .offsets    文本列：UTF-8 拼接 + int64 偏移 (N + 1)
+#   metadata.bin / .offsets 元数据列：每行一个 JSON
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+STRING_COLUMNS = ("text", "metadata")
+
+# .npy 头部固定占用的字节数，写完数据后原地改写行数
+_NPY_HEADER_SIZE = 128
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+# 估算单行写入大小时的固定开销
+_ROW_OVERHEAD_BYTES = 64
+
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    """固定长度的 .npy v1.0 头部"""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (dtype.str, tuple(shape))
+    header = header.ljust(_NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2 - 1) + "\n"
+    return _NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class _NpyAppender:
+    """按行追加写入 .npy 文件，行数在关闭时回填到头部"""
+
+    def __init__(self, path: Path, dtype, row_shape: Tuple[int, ...] = ()):
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self._file = open(path, "wb")
+        self._file.write(_npy_header(self.dtype, (0,) + self.row_shape))
+
+    def append(self, array: np.ndarray):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        self._file.write(array.tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, (self.rows,) + self.row_shape))
+        self._file.close()
+
+
+class _StringColumnWriter:
+    """字符串列：UTF-8 数据拼接写入 .bin，行边界写入 .offsets.npy"""
+
+    def __init__(self, directory: Path, name: str):
+        self._data = open(directory / f"{name}.bin", "wb")
+        self._offsets = _NpyAppender(directory / f"{name}.offsets.npy", np.int64)
+        self._offsets.append(np.zeros(1, dtype=np.int64))
+        self._position = 0
+
+    def append(self, values: List[str]):
+        encoded = [value.encode("utf-8") for value in values]
+        self._data.write(b"".join(encoded))
+        ends = self._position + np.cumsum([len(item) for item in encoded], dtype=np.int64)
+        self._offsets.append(ends)
+        if len(ends):
+            self._position = int(ends[-1])
+
+    def close(self):
+        self._data.close()
+        self._offsets.close()
+
+
+class _StringColumnReader:
+    """按行区间读取字符串列"""
+
+    def __init__(self, directory: Path, name: str):
+        self.offsets = np.load(directory / f"{name}.offsets.npy", mmap_mode="r")
+        self._data: BinaryIO = open(directory / f"{name}.bin", "rb")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def byte_sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def read(self, start: int, end: int) -> List[str]:
+        offsets = np.asarray(self.offsets[start:end + 1]) - self.offsets[start]
+        self._data.seek(int(self.offsets[start]))
+        data = self._data.read(int(offsets[-1]))
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(end - start)]
+
+    def close(self):
+        self._data.close()
+
+
+def create_snapshot(vector_store, path: str, page_size: int = 2000) -> dict:
+    """把知识库（含向量）导出为快照目录，返回 manifest
+
+    先写到临时目录，全部完成后再改名，中途失败不会留下不完整的快照。
+    """
+    target = Path(path)
+    if target.exists():
+        raise ValueError(f"快照目录已存在: {target}")
+    tmp = target.with_name(target.name + ".tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    started = time.perf_counter()
+    dimension = vector_store.dimension
+    vectors = _NpyAppender(tmp / VECTORS_FILE, np.float32, (dimension,))
+    columns = {name: _StringColumnWriter(tmp, name) for name in STRING_COLUMNS}
+    try:
+        for page in vector_store.export_pages(with_vectors=True, page_size=page_size):
+            vectors.append(np.asarray([row["vector"] for row in page], dtype=np.float32))
+            columns["text"].append([row["text"] for row in page])
+            columns["metadata"].append([
+                json.dumps(row.get("metadata") or {}, ensure_ascii=False) for row in page
+            ])
+            logger.info(f"快照已写入 {vectors.rows} 条")
+    finally:
+        vectors.close()
+        for column in columns.values():
+            column.close()
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "collection_name": vector_store.collection_name,
+        "physical_collection": vector_store.physical_name(),
+        "embedding_model": settings.embedding_model,
+        "dimension": dimension,
+        "metric_type": vector_store.metric_type,
+        "index_params": vector_store.index_params,
+        "rows": vectors.rows,
+        "files": {
+            "vectors": VECTORS_FILE,
+            **{name: [f"{name}.bin", f"{name}.offsets.npy"] for name in STRING_COLUMNS}
+        }
+    }
+    with open(tmp / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, target)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"快照完成: {manifest['rows']} 条 -> {target}，耗时 {elapsed:.1f}s")
+    return manifest
+
+
+def load_manifest(path: str) -> dict:
+    """读取并校验快照 manifest（嵌入模型和维度必须与当前配置一致）"""
+    manifest_path = Path(path) / MANIFEST_FILE
+    if not manifest_path.exists():
+        raise ValueError(f"不是有效的快照目录（缺少 {MANIFEST_FILE}）: {path}")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"不支持的快照格式版本: {manifest.get('format_version')}")
+    if manifest["embedding_model"] != settings.embedding_model:
+        raise ValueError(
+            f"快照的嵌入模型 {manifest['embedding_model']} 与当前配置 {settings.embedding_model} 不一致，"
+            f"向量不可复用"
+        )
+    if manifest["dimension"] != settings.milvus_dimension:
+        raise ValueError(f"快照的向量维度 {manifest['dimension']} 与当前配置 {settings.milvus_dimension} 不一致")
+    return manifest
+
+
+def iter_snapshot_batches(
+    path: str,
+    batch_size: int,
+    max_bytes: int
+) -> Iterator[Tuple[List[str], List[List[float]], List[dict]]]:
+    """按行数和字节数上限分批读取快照，向量通过 mmap 读取"""
+    directory = Path(path)
+    vectors = np.load(directory / VECTORS_FILE, mmap_mode="r")
+    texts = _StringColumnReader(directory, "text")
+    metadatas = _StringColumnReader(directory, "metadata")
+    try:
+        rows = len(vectors)
+        if len(texts) != rows or len(metadatas) != rows:
+            raise ValueError(f"快照文件行数不一致: vectors={rows}, text={len(texts)}, metadata={len(metadatas)}")
+
+        row_bytes = (
+            texts.byte_sizes() + metadatas.byte_sizes()
+            + vectors.shape[1] * 4 + _ROW_OVERHEAD_BYTES
+        )
+        start = 0
+        while start < rows:
+            # 在行数上限内找到累计字节数不超过 max_bytes 的位置（至少一行）
+            end = min(start + batch_size, rows)
+            cumulative = np.cumsum(row_bytes[start:end])
+            end = start + max(1, int(np.searchsorted(cumulative, max_bytes, side="right")))
+            yield (
+                texts.read(start, end),
+                vectors[start:end].tolist(),
+                [json.loads(item) for item in metadatas.read(start, end)]
+            )
+            start = end
+    finally:
+        texts.close()
+        metadatas.close()
+
+
+def restore_snapshot(
+    vector_store,
+    path: str,
+    index_type: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    workers: Optional[int] = None
+) -> dict:
+    """从快照恢复知识库（替换当前集合），不需要重新向量化"""
+    manifest = load_manifest(path)
+    started = time.perf_counter()
+    result = vector_store.bulk_load(
+        iter_snapshot_batches(
+            path,
+            batch_size or settings.ingest_insert_batch_size,
+            settings.ingest_insert_max_bytes
+        ),
+        index_type=index_type or manifest.get("index_params", {}).get("index_type"),
+        expected_rows=manifest["rows"],
+        workers=workers or settings.ingest_insert_workers
+    )
+    elapsed = time.perf_counter() - started
+    result["rows_per_second"] = round(manifest["rows"] / elapsed, 1) if elapsed else None
+    logger.info(f"快照恢复完成: {manifest['rows']} 条，耗时 {elapsed:.1f}s")
+    return result
@@ -0,0 +1,120 @@
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+from starlette.requests import ClientDisconnect
+import asyncio
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库 json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def encode_event(data: dict) -> bytes:
+    """编码一条 SSE 事件（data: <json>\\n\\n）"""
+    if orjson is not None:
+        try:
+            return b"data: " + orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+        except TypeError:
+            # orjson 不支持的类型（如 float 子类）交给标准库处理
+            pass
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class _FramePump:
+    """后台任务拉取上游输出的块放入缓冲区，消费方按帧取走
+
+    每个 token 只做一次追加，等待和计时都按帧发生，合并后的 CPU 开销低于逐 token 转发。
+    """
+
+    def __init__(self, chunks: AsyncIterator[str], max_bytes: int):
+        self.chunks = chunks
+        self.max_bytes = max_bytes
+        self.buffer: List[str] = []
+        self.size = 0
+        self.finished = False
+        self.disconnected = False
+        self.error: Optional[BaseException] = None
+        # ready: 缓冲区有数据或状态变化；flush: 需要立即发帧（字节数达到上限、结束或断开）
+        self.ready = asyncio.Event()
+        self.flush = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            async for chunk in self.chunks:
+                self.buffer.append(chunk)
+                self.size += len(chunk.encode("utf-8"))
+                if not self.ready.is_set():
+                    self.ready.set()
+                if self.size >= self.max_bytes and not self.flush.is_set():
+                    self.flush.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self.ready.set()
+            self.flush.set()
+
+    async def watch(self, is_disconnected: Callable[[], Awaitable[bool]], poll_interval: float):
+        """轮询客户端连接，断开时取消上游读取"""
+        while not self.finished:
+            if await is_disconnected():
+                self.disconnected = True
+                self.task.cancel()
+                return
+            await asyncio.sleep(poll_interval)
+
+    def take(self) -> str:
+        frame = "".join(self.buffer)
+        self.buffer.clear()
+        self.size = 0
+        self.ready.clear()
+        self.flush.clear()
+        return frame
+
+
+async def coalesce_frames(
+    chunks: AsyncIterator[str],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    window: float,
+    max_bytes: int,
+    poll_interval: float
+) -> AsyncIterator[str]:
+    """把 LLM 输出的块合并成帧转发，客户端断开时立即取消上游生成并抛出 ClientDisconnect
+
+    距上一帧已超过 window 秒时新块立即发出（首 token 不增加延迟，慢速输出也不额外等待），
+    否则先缓存，到窗口结束或累计字节数达到 max_bytes 时合并成一帧；window 为 0 时逐块转发。
+    断开检测与等待 token 同时进行，不必等到下一次写响应失败才发现；
+    取消正在进行的读取会关闭到模型服务的流式请求，模型服务随之停止生成。
+    """
+    loop = asyncio.get_running_loop()
+    pump = _FramePump(chunks, max_bytes)
+    watcher = asyncio.ensure_future(pump.watch(is_disconnected, poll_interval))
+    last_flush = float("-inf")
+    try:
+        while True:
+            await pump.ready.wait()
+            remaining = last_flush + window - loop.time()
+            if remaining > 0 and not pump.flush.is_set():
+                try:
+                    await asyncio.wait_for(pump.flush.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            if pump.disconnected:
+                raise ClientDisconnect()
+            finished = pump.finished
+            frame = pump.take()
+            if frame:
+                last_flush = loop.time()
+                yield frame
+            if finished:
+                if pump.error is not None:
+                    raise pump.error
+                return
+    finally:
+        # 这里不能 await（外层可能已被取消）；取消拉取任务即关闭上游的流式请求
+        watcher.cancel()
+        pump.task.cancel()
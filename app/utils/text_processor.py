@@ -1,8 +1,14 @@
-from typing import List
+from typing import Iterable, Iterator, List
 from app.core.config import settings
+import hashlib
 import re
 
 
+def content_hash(text: str) -> str:
+    """文档块内容哈希（忽略首尾空白），用于去重"""
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+
 class TextProcessor:
     """文本处理工具"""
     
@@ -15,33 +21,17 @@ class TextProcessor:
         # 按段落分割
         paragraphs = re.split(r'\n\s*\n', text)
         
+        chunker = _ParagraphChunker(self)
         chunks = []
-        current_chunk = ""
-        
         for paragraph in paragraphs:
-            
-            paragraph = paragraph.strip()
-            if not paragraph:
-                continue
-            
-            # 如果当前块加上新段落超过大小限制
-            if len(current_chunk) + len(paragraph) > self.chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                    # 保留重叠部分
-                    overlap_text = current_chunk[-self.chunk_overlap:]
-                    current_chunk = overlap_text + "\n\n" + paragraph
-                else:
-                    # 段落本身太长，强制分割
-                    chunks.extend(self._split_long_paragraph(paragraph))
-                    current_chunk = ""
-            else:
-                current_chunk += "\n\n" + paragraph if current_chunk else paragraph
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+            chunks.extend(chunker.add(paragraph))
+        chunks.extend(chunker.finish())
         
         return chunks
+
+    def stream_splitter(self, max_pending: int = None) -> "StreamingSplitter":
+        """创建流式分块器，分块结果与 split_text 一致"""
+        return StreamingSplitter(self, max_pending)
     
     def _split_long_paragraph(self, paragraph: str) -> List[str]:
         """分割超长段落"""
@@ -54,14 +44,15 @@ class TextProcessor:
             if not sentence:
                 continue
             
-            if len(current_chunk) + len(sentence) > self.chunk_size:
+            if len(current_chunk) + len(sentence) + 1 > self.chunk_size:
                 if current_chunk:
                     chunks.append(current_chunk.strip())
-                    current_chunk = sentence
-                else:
+                    current_chunk = ""
+                while len(sentence) >= self.chunk_size:
                     # 句子本身太长，按字符分割
                     chunks.append(sentence[:self.chunk_size])
-                    current_chunk = sentence[self.chunk_size:]
+                    sentence = sentence[self.chunk_size:]
+                current_chunk = sentence + "。" if sentence else ""
             else:
                 current_chunk += sentence + "。"
         
@@ -78,3 +69,89 @@ class TextProcessor:
         text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s，。！？；：、""''（）【】]', '', text)
         return text.strip()
 
+
+
+
+class _ParagraphChunker:
+    """按段落累积文本块的状态机（split_text 与流式分块共用）"""
+
+    def __init__(self, processor: TextProcessor):
+        self.processor = processor
+        self.current_chunk = ""
+
+    def add(self, paragraph: str) -> List[str]:
+        """加入一个段落，返回已经完成的文本块"""
+        paragraph = paragraph.strip()
+        if not paragraph:
+            return []
+
+        chunks = []
+        # 如果当前块加上新段落超过大小限制
+        if len(self.current_chunk) + len(paragraph) > self.processor.chunk_size:
+            overlap_text = ""
+            if self.current_chunk:
+                chunks.append(self.current_chunk.strip())
+                # 保留重叠部分
+                overlap_text = self.current_chunk[-self.processor.chunk_overlap:]
+            if self.current_chunk and len(overlap_text) + 2 + len(paragraph) <= self.processor.chunk_size:
+                self.current_chunk = overlap_text + "\n\n" + paragraph
+            else:
+                # 段落本身（加上重叠部分）超过大小限制，强制分割，不与前一块的重叠部分拼在一起
+                chunks.extend(self.processor._split_long_paragraph(paragraph))
+                self.current_chunk = ""
+        else:
+            self.current_chunk += "\n\n" + paragraph if self.current_chunk else paragraph
+        return chunks
+
+    def finish(self) -> List[str]:
+        """输出最后一个未满的文本块"""
+        chunks = [self.current_chunk.strip()] if self.current_chunk else []
+        self.current_chunk = ""
+        return chunks
+
+
+class StreamingSplitter:
+    """流式分块器
+
+    逐段喂入文本，只缓存最后一个不完整的段落，内存占用与输入总长度无关。
+    超长段落（没有空行分隔）超过 max_pending 时在句末强制切开。
+    """
+
+    def __init__(self, processor: TextProcessor, max_pending: int = None):
+        self.chunker = _ParagraphChunker(processor)
+        self.max_pending = max_pending or processor.chunk_size * 8
+        self.pending = ""
+
+    def feed(self, text: str) -> List[str]:
+        """喂入一段文本，返回已经可以确定的文本块"""
+        self.pending += text
+        chunks = []
+
+        paragraphs = re.split(r'\n\s*\n', self.pending)
+        # 最后一段可能还没结束，留到下一次
+        self.pending = paragraphs.pop()
+        for paragraph in paragraphs:
+            chunks.extend(self.chunker.add(paragraph))
+
+        while len(self.pending) > self.max_pending:
+            head = self.pending[:self.max_pending]
+            cut = max(head.rfind(mark) for mark in "。！？\n") + 1
+            if cut <= 0:
+                cut = self.max_pending
+            chunks.extend(self.chunker.add(self.pending[:cut]))
+            self.pending = self.pending[cut:]
+
+        return chunks
+
+    def finish(self) -> List[str]:
+        """输入结束，输出剩余的文本块"""
+        chunks = self.chunker.add(self.pending)
+        self.pending = ""
+        chunks.extend(self.chunker.finish())
+        return chunks
+
+    def split(self, texts: Iterable[str]) -> Iterator[str]:
+        """对文本片段序列做流式分块"""
+        for text in texts:
+            yield from self.feed(text)
+        yield from self.finish()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+管理脚本 - 知识库运维命令
+
+用法:
+    python manage.py rebuild-index-offline [--index-type HNSW]    # 先停止所有写入
+    python manage.py rebuild-lexical
+    python manage.py export --output kb.ndjson [--with-vectors] [--resume]
+    python manage.py snapshot --output snapshots/kb-20240101
+    python manage.py restore --input snapshots/kb-20240101
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def rebuild_index(args):
+    """离线重建向量索引（需先停止服务的写入）"""
+    from app.core.config import settings
+    from app.core.vector_store import create_vector_store
+
+    client = create_vector_store()
+    result = client.rebuild_index(args.index_type, batch_size=args.batch_size)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if settings.vector_store_backend.lower() == "milvus":
+        print("主键已重新分配，词法索引会在服务检测到集合变化后自动重建（或执行 rebuild-lexical）")
+
+
+def rebuild_lexical(args):
+    """从向量存储全量重建混合检索使用的词法索引"""
+    from pathlib import Path
+    from app.core.config import settings
+    from app.core.vector_store import create_vector_store, TENANT_FIELD
+    from app.services.lexical_index import LexicalIndex
+
+    client = create_vector_store()
+    path = Path(settings.rag_lexical_index_path)
+    if not path.is_absolute():
+        path = Path(__file__).parent / path
+    index = LexicalIndex(path)
+    rows = (
+        (row["id"], row["text"], (row.get("metadata") or {}).get(TENANT_FIELD) or settings.tenant_shared)
+        for page in client.export_pages(page_size=5000)
+        for row in page
+    )
+    index.rebuild(rows, source=client.physical_collection)
+    index.save()
+    print(f"词法索引重建完成: {len(index)} 个文档块 -> {path}")
+
+
+def _resume_cursor(path: str) -> int:
+    """读取导出文件最后一个完整行的 id；末尾不完整的行会被截掉"""
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        # 从文件末尾向前找到最后两个换行符
+        block_size = 64 * 1024
+        tail = b""
+        pos = end
+        while pos > 0 and tail.count(b"\n") < 2:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+        complete = tail[:tail.rfind(b"\n") + 1] if b"\n" in tail else b""
+        # 截掉上次中断时写了一半的行
+        f.truncate(pos + len(complete))
+    lines = complete.strip().split(b"\n")
+    if not lines or not lines[-1]:
+        raise SystemExit(f"{path} 中没有完整的记录，无法续传")
+    return int(json.loads(lines[-1])["id"])
+
+
+def export(args):
+    """流式导出知识库为 NDJSON"""
+    from app.core.vector_store import create_vector_store
+    from app.services.export_service import export_ndjson
+
+    cursor = args.cursor
+    mode = "wb"
+    if args.resume:
+        if not args.output or not os.path.exists(args.output):
+            raise SystemExit("--resume 需要指定已存在的 --output 文件")
+        cursor = _resume_cursor(args.output)
+        mode = "ab"
+        print(f"从 id > {cursor} 继续导出", file=sys.stderr)
+
+    client = create_vector_store()
+    out = open(args.output, mode) if args.output else sys.stdout.buffer
+    try:
+        pages = export_ndjson(client, cursor, args.with_vectors, args.page_size, args.tenant)
+        for i, page in enumerate(pages, 1):
+            out.write(page)
+            out.flush()
+            if args.output and i % 10 == 0:
+                print(f"已导出 {i} 页", file=sys.stderr)
+    finally:
+        if args.output:
+            out.close()
+
+
+def snapshot(args):
+    """导出二进制快照（向量 + 文本 + 元数据）"""
+    from app.core.vector_store import create_vector_store
+    from app.services.snapshot_service import create_snapshot
+
+    client = create_vector_store()
+    manifest = create_snapshot(client, args.output, page_size=args.page_size)
+    print(json.dumps(manifest, ensure_ascii=False, indent=2))
+
+
+def restore(args):
+    """从快照恢复知识库（替换当前集合，不重新向量化）"""
+    from app.core.vector_store import create_vector_store
+    from app.services.snapshot_service import load_manifest, restore_snapshot
+
+    manifest = load_manifest(args.input)
+    print(f"快照: {manifest['rows']} 条, 模型 {manifest['embedding_model']}, 创建于 {manifest['created_at']}")
+    client = create_vector_store()
+    result = restore_snapshot(
+        client,
+        args.input,
+        index_type=args.index_type,
+        batch_size=args.batch_size,
+        workers=args.workers
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print("主键已重新分配，词法索引会在服务检测到集合变化后自动重建（或执行 rebuild-lexical）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="个人知识库智能助手 - 管理命令")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser(
+        "rebuild-index-offline",
+        help="离线重建向量索引（影子集合 + 别名切换，主键重新分配）：运行前先停止所有写入"
+    )
+    rebuild.add_argument(
+        "--index-type",
+        default=None,
+        help="索引类型: AUTO | FLAT | IVF_FLAT | IVF_SQ8 | IVF_PQ | HNSW（local 后端: AUTO | FLAT | HNSW），默认读取配置"
+    )
+    rebuild.add_argument("--batch-size", type=int, default=2000, help="复制数据的批大小")
+    rebuild.set_defaults(func=rebuild_index)
+
+    lexical = subparsers.add_parser("rebuild-lexical", help="从向量存储全量重建词法索引")
+    lexical.set_defaults(func=rebuild_lexical)
+
+    exporter = subparsers.add_parser("export", help="流式导出知识库为 NDJSON（可断点续传）")
+    exporter.add_argument("--output", default=None, help="输出文件，默认写到标准输出")
+    exporter.add_argument("--with-vectors", action="store_true", help="同时导出向量")
+    exporter.add_argument("--page-size", type=int, default=1000, help="每页行数")
+    exporter.add_argument("--tenant", default=None, help="只导出某个租户")
+    exporter.add_argument("--cursor", type=int, default=None, help="从该 id 之后开始导出")
+    exporter.add_argument("--resume", action="store_true", help="读取输出文件最后一行的 id 继续导出")
+    exporter.set_defaults(func=export)
+
+    snap = subparsers.add_parser("snapshot", help="导出二进制快照（含向量，恢复时无需重新向量化）")
+    snap.add_argument("--output", required=True, help="快照目录（不能已存在）")
+    snap.add_argument("--page-size", type=int, default=2000, help="每次读取的行数")
+    snap.set_defaults(func=snapshot)
+
+    rest = subparsers.add_parser("restore", help="从快照恢复知识库（替换当前集合）")
+    rest.add_argument("--input", required=True, help="快照目录")
+    rest.add_argument("--index-type", default=None, help="恢复后使用的索引类型，默认沿用快照记录的索引")
+    rest.add_argument("--batch-size", type=int, default=None, help="每次 insert 的最大行数，默认读取配置")
+    rest.add_argument("--workers", type=int, default=None, help="并发写入线程数，默认读取配置")
+    rest.set_defaults(func=restore)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
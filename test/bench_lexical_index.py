@@ -0,0 +1,125 @@
+"""
+词法索引基准测试
+
+生成合成语料（常用字组成的词按 Zipf 分布抽样，部分文档块带错误码等标识符），
+统计全量构建耗时，以及三类查询的检索延迟：
+  - phrase      从文档块中截取的中文短语（6 个字）
+  - identifier  错误码（只出现在少数文档块中）
+  - mixed       错误码 + 中文短语
+同时统计按分组（租户）过滤后的延迟。不需要 Milvus 和嵌入模型。
+
+用法:
+    python test/bench_lexical_index.py --rows 1000000 --queries 500
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.lexical_index import LexicalIndex
+
+# 常用汉字区间内取字，组成词表
+CHAR_POOL = [chr(code) for code in range(0x4e00, 0x4e00 + 3000)]
+
+
+def make_corpus(rows: int, chunk_words: int, identifier_ratio: float, seed: int = 0):
+    """返回 (texts, identifiers)，identifiers[i] 为第 i 个文档块中的错误码（没有时为 None）"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(2, 5, size=20000)
+    vocabulary = ["".join(rng.choice(CHAR_POOL, size=n)) for n in lengths]
+    # Zipf 分布：少数词非常常见，大部分词很少出现
+    ranks = np.arange(1, len(vocabulary) + 1)
+    probabilities = 1.0 / ranks
+    probabilities /= probabilities.sum()
+
+    texts, identifiers = [], []
+    for _ in range(rows):
+        words = rng.choice(len(vocabulary), size=chunk_words, p=probabilities)
+        text = "".join(vocabulary[w] for w in words)
+        identifier = None
+        if rng.random() < identifier_ratio:
+            identifier = f"err-{int(rng.integers(0, rows)):07d}"
+            position = int(rng.integers(0, len(text)))
+            text = f"{text[:position]} {identifier} {text[position:]}"
+        texts.append(text)
+        identifiers.append(identifier)
+    return texts, identifiers
+
+
+def make_queries(texts: list, identifiers: list, count: int, seed: int = 1) -> dict:
+    rng = np.random.default_rng(seed)
+    with_identifier = [i for i, identifier in enumerate(identifiers) if identifier]
+    queries = {"phrase": [], "identifier": [], "mixed": []}
+    for _ in range(count):
+        text = texts[int(rng.integers(0, len(texts)))].split(" ")[0]
+        start = int(rng.integers(0, max(len(text) - 6, 1)))
+        phrase = text[start:start + 6]
+        identifier = identifiers[with_identifier[int(rng.integers(0, len(with_identifier)))]]
+        queries["phrase"].append(phrase)
+        queries["identifier"].append(identifier)
+        queries["mixed"].append(f"{identifier} {phrase}")
+    return queries
+
+
+def bench(index: LexicalIndex, queries: list, top_k: int, groups: list = None) -> dict:
+    latencies = []
+    for i, query in enumerate(queries):
+        scope = [groups[i % len(groups)]] if groups else None
+        started = time.perf_counter()
+        index.search(query, top_k=top_k, groups=scope)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "avg_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="词法索引基准测试")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunk-words", type=int, default=60, help="每个文档块的词数（约 180 个汉字）")
+    parser.add_argument("--identifier-ratio", type=float, default=0.05, help="带错误码的文档块比例")
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=20)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    texts, identifiers = make_corpus(args.rows, args.chunk_words, args.identifier_ratio)
+    corpus_seconds = time.perf_counter() - started
+
+    index = LexicalIndex()
+    started = time.perf_counter()
+    index.rebuild((i, text, f"tenant-{i % args.groups}") for i, text in enumerate(texts))
+    build_seconds = time.perf_counter() - started
+
+    queries = make_queries(texts, identifiers, args.queries)
+    groups = [f"tenant-{g}" for g in range(args.groups)]
+    # 预热
+    for query in queries["mixed"][:20]:
+        index.search(query, top_k=args.top_k)
+    runs = {
+        name: (bench(index, items, args.top_k), bench(index, items, args.top_k, groups))
+        for name, items in queries.items()
+    }
+
+    print("=" * 72)
+    print(
+        f"词法索引基准: {args.rows} 个文档块, 约 {args.chunk_words * 3} 字/块, {args.groups} 个分组, "
+        f"{args.queries} 次查询, top_k={args.top_k}"
+    )
+    print(f"生成语料: {corpus_seconds:.1f}s，构建索引: {build_seconds:.1f}s ({args.rows / build_seconds:.0f} 块/s)")
+    print("=" * 72)
+    print(f"{'查询':<12}{'平均(ms)':>10}{'P50(ms)':>10}{'P95(ms)':>10}{'分组平均(ms)':>14}{'分组P95(ms)':>13}")
+    for name, (all_groups, one_group) in runs.items():
+        print(
+            f"{name:<12}{all_groups['avg_ms']:>10.2f}{all_groups['p50_ms']:>10.2f}{all_groups['p95_ms']:>10.2f}"
+            f"{one_group['avg_ms']:>14.2f}{one_group['p95_ms']:>13.2f}"
+        )
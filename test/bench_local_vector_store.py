@@ -0,0 +1,106 @@
+"""
+本地向量存储基准测试
+
+在临时目录中写入随机向量，对比 FLAT（精确检索）和 HNSW（需要安装 hnswlib）的
+检索延迟，以及 HNSW 相对精确结果的召回率；同时统计按租户过滤后的检索延迟。不需要 Milvus。
+
+用法:
+    python test/bench_local_vector_store.py --rows 100000 --tenants 50 --queries 200
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.core.local_vector_store import LocalVectorStore, hnswlib
+
+
+def load_data(store: LocalVectorStore, rows: int, tenants: int, batch_size: int = 5000):
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    for start in range(0, rows, batch_size):
+        count = min(batch_size, rows - start)
+        vectors = rng.standard_normal((count, store.dimension), dtype=np.float32)
+        metadatas = [{"tenant": f"tenant-{(start + j) % tenants}"} for j in range(count)]
+        texts = [f"bench {start + j}" for j in range(count)]
+        store.insert(texts, vectors, metadatas)
+    return time.perf_counter() - started
+
+
+def bench(store: LocalVectorStore, queries: int, tenants: int, top_k: int, exact: dict = None) -> dict:
+    rng = np.random.default_rng(1)
+    latencies = {"all": [], "tenant": []}
+    results = []
+    for i in range(queries):
+        query_vector = rng.standard_normal(store.dimension, dtype=np.float32).tolist()
+
+        started = time.perf_counter()
+        hits = store.search(query_vector, top_k=top_k)
+        latencies["all"].append(time.perf_counter() - started)
+        results.append({hit["id"] for hit in hits})
+
+        started = time.perf_counter()
+        store.search(query_vector, top_k=top_k, tenants=[f"tenant-{i % tenants}"])
+        latencies["tenant"].append(time.perf_counter() - started)
+
+    summary = {
+        name: {
+            "avg_ms": statistics.mean(values) * 1000,
+            "p95_ms": sorted(values)[int(len(values) * 0.95) - 1] * 1000
+        }
+        for name, values in latencies.items()
+    }
+    if exact is not None:
+        summary["recall"] = statistics.mean(
+            len(found & truth) / len(truth) for found, truth in zip(results, exact["results"])
+        )
+    summary["results"] = results
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地向量存储基准测试")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = LocalVectorStore(collection_name="bench_local", path=directory)
+        load_seconds = load_data(store, args.rows, args.tenants)
+
+        store.rebuild_index("FLAT")
+        runs = {"FLAT": bench(store, args.queries, args.tenants, args.top_k)}
+        if hnswlib is not None:
+            started = time.perf_counter()
+            store.rebuild_index("HNSW")
+            build_seconds = time.perf_counter() - started
+            runs["HNSW"] = bench(store, args.queries, args.tenants, args.top_k, exact=runs["FLAT"])
+        store.close()
+
+    print("=" * 72)
+    print(
+        f"本地向量存储基准: {args.rows} 条, 维度 {settings.milvus_dimension}, {args.tenants} 个租户, "
+        f"{args.queries} 次查询, top_k={args.top_k}"
+    )
+    print(f"写入耗时: {load_seconds:.1f}s ({args.rows / load_seconds:.0f} 条/s)")
+    if "HNSW" in runs:
+        print(f"HNSW 构建耗时: {build_seconds:.1f}s")
+    else:
+        print("未安装 hnswlib，跳过 HNSW")
+    print("=" * 72)
+    print(f"{'索引':<8}{'全库平均(ms)':>14}{'全库P95(ms)':>14}{'租户平均(ms)':>14}{'召回率':>10}")
+    for name, r in runs.items():
+        recall = f"{r['recall']:.1%}" if "recall" in r else "-"
+        print(
+            f"{name:<8}{r['all']['avg_ms']:>14.2f}{r['all']['p95_ms']:>14.2f}"
+            f"{r['tenant']['avg_ms']:>14.2f}{recall:>10}"
+        )
@@ -0,0 +1,144 @@
+"""
+提示词布局与前缀缓存基准测试
+
+启动模拟推理服务（test/fake_openai_server.py，模拟 vLLM 自动前缀缓存和预填充耗时），
+模拟多个用户交替进行多轮对话：每轮检索到的文档和相关记忆随问题变化，长期记忆不变。
+分别用 default 和 prefix_cache 两种提示词布局发送同样的对话，
+对比前缀缓存命中率、预填充耗时和请求延迟。不需要真实的模型服务。
+
+用法:
+    python test/bench_prompt_layout.py --users 8 --turns 12 --prefill-us-per-token 100
+"""
+import argparse
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+
+SERVER = Path(__file__).parent / "fake_openai_server.py"
+TOPICS = ["向量数据库", "检索增强生成", "大语言模型推理", "分布式系统", "知识图谱", "数据治理"]
+
+
+def make_conversations(users: int, turns: int) -> list:
+    """生成每个用户每一轮的输入（两种布局使用完全相同的数据）"""
+    rng = random.Random(0)
+    corpus = [
+        f"{topic}相关资料第{i}段：" + "".join(rng.choice("的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经") for _ in range(300))
+        for i, topic in enumerate(TOPICS * 10)
+    ]
+    started = datetime(2026, 1, 1)
+    conversations = []
+    for u in range(users):
+        core = [
+            {"_id": f"{u}-core-{i}", "content": f"用户{u}的长期偏好{i}：喜欢简洁的回答，关注{TOPICS[(u + i) % len(TOPICS)]}", "memory_type": "preference", "importance": 0.9}
+            for i in range(3)
+        ]
+        pool = [
+            {"_id": f"{u}-mem-{i}", "content": f"用户{u}曾经提到的事实{i}：正在做{TOPICS[i % len(TOPICS)]}相关的项目", "memory_type": "fact", "importance": 0.5}
+            for i in range(8)
+        ]
+        history = []
+        for t in range(turns):
+            question = f"第{t}个问题：请介绍一下{rng.choice(TOPICS)}的最新进展和实践经验"
+            conversations.append({
+                "user": u,
+                "turn": t,
+                "question": question,
+                "docs": rng.sample(corpus, 3),
+                "core": core,
+                "relevant": rng.sample(pool, 2),
+                "history": list(history)
+            })
+            timestamp = started + timedelta(minutes=u * 1000 + t)
+            answer = f"关于{question}的回答：" + "这是模拟的回答内容。" * 20
+            history += [
+                {"role": "user", "content": question, "timestamp": timestamp},
+                {"role": "assistant", "content": answer, "timestamp": timestamp}
+            ]
+    # 多个用户的对话交替进行
+    conversations.sort(key=lambda c: (c["turn"], c["user"]))
+    return conversations
+
+
+def run(service, base_url: str, layout: str, conversations: list) -> dict:
+    httpx.post(f"{base_url}/admin/reset")
+    service.prompt_layout = layout
+    rng = random.Random(1)
+    latencies = []
+    for c in conversations:
+        if layout == "prefix_cache":
+            user_memories, core_memories = c["relevant"], c["core"]
+        else:
+            # 原有布局中记忆按与问题的相关度排序放进系统提示，顺序随问题变化
+            user_memories, core_memories = rng.sample(c["relevant"] + c["core"], 5), None
+        started = time.perf_counter()
+        service.generate_with_context(
+            user_message=c["question"],
+            context=c["docs"],
+            conversation_history=c["history"],
+            user_memories=user_memories,
+            core_memories=core_memories
+        )
+        latencies.append(time.perf_counter() - started)
+    stats = httpx.get(f"{base_url}/admin/stats").json()
+    return {
+        **stats,
+        "avg_prompt_tokens": stats["prompt_tokens"] / stats["requests"],
+        "avg_prefill_ms": stats["prefill_seconds"] / stats["requests"] * 1000,
+        "avg_latency_ms": statistics.mean(latencies) * 1000
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="提示词布局与前缀缓存基准测试")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--prefill-us-per-token", type=float, default=100.0)
+    parser.add_argument("--port", type=int, default=9201)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([
+        sys.executable, str(SERVER), "--port", str(args.port), "--tokens", "5", "--delay-ms", "1",
+        "--prefill-us-per-token", str(args.prefill_us_per_token)
+    ])
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{base_url}/v1/models", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+        settings.llm_provider = "local"
+        settings.llm_base_url = f"{base_url}/v1"
+        settings.llm_base_urls = ""
+        from app.services.llm_service import LLMService
+        service = LLMService()
+
+        conversations = make_conversations(args.users, args.turns)
+        runs = {layout: run(service, base_url, layout, conversations) for layout in ("default", "prefix_cache")}
+    finally:
+        server.terminate()
+
+    print("=" * 84)
+    print(
+        f"提示词布局基准: {args.users} 个用户 × {args.turns} 轮, "
+        f"预填充 {args.prefill_us_per_token}μs/token（模拟）"
+    )
+    print("=" * 84)
+    print(f"{'布局':<16}{'平均提示词token':>16}{'缓存命中率':>12}{'平均预填充(ms)':>16}{'平均延迟(ms)':>14}")
+    for layout, r in runs.items():
+        print(
+            f"{layout:<16}{r['avg_prompt_tokens']:>16.0f}{r['hit_ratio']:>12.1%}"
+            f"{r['avg_prefill_ms']:>16.1f}{r['avg_latency_ms']:>14.1f}"
+        )
@@ -0,0 +1,141 @@
+"""
+流式输出合并成帧基准测试
+
+在子进程中启动一个 uvicorn 服务，模拟 LLM 以固定间隔输出单个中文字符的 token，
+分别按“逐 token + json.dumps”（原实现）和“合并成帧 + encode_event”两种方式发送 SSE 事件。
+客户端同时发起 N 个流式请求，统计事件数、每秒事件数、首帧时间，
+以及服务进程每个流消耗的 CPU 时间。不需要 Milvus、MongoDB 和 LLM。
+
+用法:
+    python test/bench_sse_frames.py --streams 50 --tokens 500 --interval-ms 5
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.utils.sse import coalesce_frames, encode_event, orjson
+
+app = FastAPI()
+
+
+async def tokens(count: int, interval: float):
+    for i in range(count):
+        await asyncio.sleep(interval)
+        yield "测试文本"[i % 4]
+
+
+@app.get("/stream")
+async def stream(request: Request, mode: str, tokens_: int, interval_ms: float, window_ms: float, max_bytes: int):
+    source = tokens(tokens_, interval_ms / 1000)
+
+    async def per_token():
+        async for chunk in source:
+            yield f"data: {json.dumps({'type': 'chunk', 'content': chunk}, ensure_ascii=False)}\n\n"
+
+    async def coalesced():
+        frames = coalesce_frames(source, request.is_disconnected, window_ms / 1000, max_bytes, poll_interval=0.5)
+        async for frame in frames:
+            yield encode_event({"type": "chunk", "content": frame})
+
+    return StreamingResponse(per_token() if mode == "token" else coalesced(), media_type="text/event-stream")
+
+
+@app.get("/cpu")
+async def cpu():
+    return {"cpu": time.process_time()}
+
+
+def serve(port: int):
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def one_stream(client: httpx.AsyncClient, params: dict) -> dict:
+    started = time.perf_counter()
+    ttft = None
+    events = 0
+    async with client.stream("GET", "/stream", params=params) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                events += 1
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+    return {"ttft": ttft, "events": events}
+
+
+async def run(base_url: str, args, mode: str) -> dict:
+    params = {
+        "mode": mode,
+        "tokens_": args.tokens,
+        "interval_ms": args.interval_ms,
+        "window_ms": args.window_ms,
+        "max_bytes": args.max_bytes
+    }
+    limits = httpx.Limits(max_connections=args.streams + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        cpu = (await client.get("/cpu")).json()["cpu"]
+        started = time.perf_counter()
+        results = await asyncio.gather(*[one_stream(client, params) for _ in range(args.streams)])
+        wall = time.perf_counter() - started
+        cpu = (await client.get("/cpu")).json()["cpu"] - cpu
+    events = sum(r["events"] for r in results)
+    return {
+        "events": events,
+        "events_per_s": events / wall,
+        "ttft_ms": statistics.median(r["ttft"] for r in results) * 1000,
+        "cpu_ms_per_stream": cpu / args.streams * 1000
+    }
+
+
+async def main(args):
+    base_url = f"http://127.0.0.1:{args.port}"
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(100):
+            try:
+                await client.get("/cpu")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    return {
+        "逐token+json": await run(base_url, args, "token"),
+        "合并成帧+encode_event": await run(base_url, args, "frames")
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式输出合并成帧基准测试")
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--interval-ms", type=float, default=5.0, help="相邻 token 的间隔")
+    parser.add_argument("--window-ms", type=float, default=30.0, help="合并成帧的时间窗口")
+    parser.add_argument("--max-bytes", type=int, default=1024)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = multiprocessing.Process(target=serve, args=(args.port,), daemon=True)
+    server.start()
+    try:
+        runs = asyncio.run(main(args))
+    finally:
+        server.terminate()
+
+    print("=" * 80)
+    print(
+        f"SSE 合并成帧基准: {args.streams} 个并发流, 每流 {args.tokens} 个 token, "
+        f"间隔 {args.interval_ms}ms, 窗口 {args.window_ms}ms, 编码器 {'orjson' if orjson else 'json'}"
+    )
+    print("=" * 80)
+    print(f"{'方式':<24}{'事件数':>10}{'事件/秒':>12}{'首帧(ms)':>12}{'服务端CPU/流(ms)':>20}")
+    for name, r in runs.items():
+        print(f"{name:<24}{r['events']:>10}{r['events_per_s']:>12.0f}{r['ttft_ms']:>12.1f}{r['cpu_ms_per_stream']:>20.2f}")
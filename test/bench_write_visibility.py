@@ -0,0 +1,73 @@
+"""
+写入可见性策略基准测试
+
+对 strong / bounded / periodic 三种模式分别写入相同数量的随机向量，
+统计写入吞吐以及写入结束后的 segment 数量。需要本地运行 Milvus。
+
+用法:
+    python test/bench_write_visibility.py --batches 200 --batch-size 20
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pymilvus import utility
+from app.core.config import settings
+from app.core.milvus_client import MilvusClient, WRITE_VISIBILITY_MODES
+
+
+def bench_mode(mode: str, batches: int, batch_size: int) -> dict:
+    """在独立的临时集合上测试一种模式"""
+    collection_name = f"bench_write_{mode}"
+    client = MilvusClient(collection_name=collection_name, write_visibility=mode)
+    physical_name = client.physical_name()
+    rng = np.random.default_rng(0)
+
+    try:
+        started = time.perf_counter()
+        for i in range(batches):
+            vectors = rng.standard_normal((batch_size, settings.milvus_dimension), dtype=np.float32)
+            texts = [f"bench {mode} {i}-{j}" for j in range(batch_size)]
+            client.insert(texts, vectors.tolist(), [{"source": "bench"}] * batch_size)
+        elapsed = time.perf_counter() - started
+
+        # 检索可见性：bounded / periodic 模式下未 flush 的数据也应可见
+        visible = client.count()
+        client.close()
+        segments = utility.get_query_segment_info(physical_name)
+
+        return {
+            "mode": mode,
+            "rows": batches * batch_size,
+            "seconds": elapsed,
+            "rows_per_second": batches * batch_size / elapsed,
+            "visible_rows": visible,
+            "segments": len(segments)
+        }
+    finally:
+        utility.drop_alias(collection_name)
+        utility.drop_collection(physical_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="写入可见性策略基准测试")
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", default=list(WRITE_VISIBILITY_MODES))
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"写入可见性基准: {args.batches} 批 x {args.batch_size} 条, 维度 {settings.milvus_dimension}")
+    print("=" * 72)
+    print(f"{'模式':<10}{'行数':>8}{'耗时(s)':>10}{'行/秒':>12}{'可见行数':>10}{'segment数':>12}")
+    for mode in args.modes:
+        r = bench_mode(mode, args.batches, args.batch_size)
+        print(
+            f"{r['mode']:<10}{r['rows']:>8}{r['seconds']:>10.2f}"
+            f"{r['rows_per_second']:>12.1f}{r['visible_rows']:>10}{r['segments']:>12}"
+        )
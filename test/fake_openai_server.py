@@ -0,0 +1,204 @@
+"""
+模拟 OpenAI 兼容的推理服务
+
+实现 /v1/models 和 /v1/chat/completions（含流式），回复内容带上副本名称，
+可以模拟 token 间隔、故障和长尾延迟，用来代替本地推理副本测试多副本路由。
+
+同时模拟 vLLM 的自动前缀缓存：提示词按 ChatML 模板展开后每个字符算一个 token，
+按块（--block-size）计算链式哈希，从头开始连续命中缓存的块不需要预填充，
+其余 token 按 --prefill-us-per-token 模拟预填充耗时；usage 中返回 cached_tokens。
+
+用法:
+    python test/fake_openai_server.py --port 9001 --name replica-1 --tokens 20 --delay-ms 20
+
+故障开关:
+    POST /admin/fail?on=true   之后所有请求（含 /v1/models）返回 500
+    POST /admin/fail?on=false  恢复
+    POST /admin/slow?ratio=0.05&ms=2000  之后每个请求以 ratio 的概率在输出前多等 ms 毫秒（ratio=1 模拟卡住的副本）
+    GET  /admin/stats          已处理的请求数、前缀缓存命中率和预填充耗时
+    POST /admin/reset          清空统计和前缀缓存
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from collections import OrderedDict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+state = {
+    "name": "replica",
+    "tokens": 20,
+    "delay": 0.02,
+    "failing": False,
+    "block_size": 16,
+    "cache_blocks": 50000,
+    "prefill_per_token": 0.0,
+    "slow_ratio": 0.0,
+    "slow_seconds": 0.0
+}
+stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "prefill_seconds": 0.0, "slow": 0}
+prefix_cache: "OrderedDict[bytes, None]" = OrderedDict()
+
+
+def _render(messages: list) -> str:
+    """按 ChatML 模板展开消息"""
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content)
+        parts.append(f"<|im_start|>{message['role']}\n{content}<|im_end|>\n")
+    return "".join(parts) + "<|im_start|>assistant\n"
+
+
+def _prefill(prompt: str) -> tuple:
+    """返回 (提示词 token 数, 命中前缀缓存的 token 数)，并把提示词的完整块写入缓存"""
+    size = state["block_size"]
+    digest = b""
+    cached = 0
+    hitting = True
+    for start in range(0, len(prompt) - size + 1, size):
+        digest = hashlib.blake2b(digest + prompt[start:start + size].encode("utf-8"), digest_size=16).digest()
+        if hitting and digest in prefix_cache:
+            cached += size
+        else:
+            hitting = False
+        prefix_cache[digest] = None
+        prefix_cache.move_to_end(digest)
+    while len(prefix_cache) > state["cache_blocks"]:
+        prefix_cache.popitem(last=False)
+    return len(prompt), cached
+
+
+def _failure() -> JSONResponse:
+    return JSONResponse(status_code=500, content={"error": {"message": f"{state['name']} 模拟故障", "type": "server_error"}})
+
+
+def _tokens():
+    return [f"[{state['name']}]"] + [f" t{i}" for i in range(state["tokens"])]
+
+
+@app.get("/v1/models")
+async def models():
+    if state["failing"]:
+        return _failure()
+    return {"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": state["name"]}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    if state["failing"]:
+        return _failure()
+    body = await request.json()
+    prompt_tokens, cached_tokens = _prefill(_render(body.get("messages", [])))
+    prefill_seconds = (prompt_tokens - cached_tokens) * state["prefill_per_token"]
+    stats["requests"] += 1
+    stats["prompt_tokens"] += prompt_tokens
+    stats["cached_tokens"] += cached_tokens
+    stats["prefill_seconds"] += prefill_seconds
+    await asyncio.sleep(prefill_seconds)
+    if random.random() < state["slow_ratio"]:
+        stats["slow"] += 1
+        await asyncio.sleep(state["slow_seconds"])
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": state["tokens"],
+        "total_tokens": prompt_tokens + state["tokens"],
+        "prompt_tokens_details": {"cached_tokens": cached_tokens}
+    }
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "fake-model")
+
+    if not body.get("stream"):
+        await asyncio.sleep(state["delay"] * state["tokens"])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(_tokens())}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+    async def events():
+        for token in _tokens():
+            await asyncio.sleep(state["delay"])
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        done = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        }
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/admin/fail")
+async def set_failing(on: bool):
+    state["failing"] = on
+    return {"failing": on}
+
+
+@app.post("/admin/slow")
+async def set_slow(ratio: float, ms: float = 0.0):
+    state.update(slow_ratio=ratio, slow_seconds=ms / 1000)
+    return {"slow_ratio": ratio, "slow_ms": ms}
+
+
+@app.get("/admin/stats")
+async def get_stats():
+    return {
+        "name": state["name"],
+        "failing": state["failing"],
+        **stats,
+        "hit_ratio": round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0
+    }
+
+
+@app.post("/admin/reset")
+async def reset():
+    stats.update(requests=0, prompt_tokens=0, cached_tokens=0, prefill_seconds=0.0, slow=0)
+    prefix_cache.clear()
+    return {"reset": True}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟 OpenAI 兼容的推理服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--name", default="replica")
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--delay-ms", type=float, default=20.0, help="每个 token 的间隔")
+    parser.add_argument("--block-size", type=int, default=16, help="前缀缓存的块大小（token）")
+    parser.add_argument("--cache-blocks", type=int, default=50000, help="前缀缓存最多保留的块数")
+    parser.add_argument("--prefill-us-per-token", type=float, default=0.0, help="未命中缓存的 token 的预填充耗时（微秒）")
+    args = parser.parse_args()
+
+    state.update(
+        name=args.name,
+        tokens=args.tokens,
+        delay=args.delay_ms / 1000,
+        block_size=args.block_size,
+        cache_blocks=args.cache_blocks,
+        prefill_per_token=args.prefill_us_per_token / 1e6
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,99 @@
+"""
+语义回答缓存测试
+
+验证：
+1. 相似度达到阈值且检索上下文相同时命中，低于阈值或上下文不同时不命中
+2. 条目超过 ttl 后失效
+3. 知识库版本变化时整体失效，超过 max_entries 时淘汰最久未使用的上下文
+不需要嵌入模型和 LLM。
+
+用法:
+    python test/test_answer_cache.py
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.services.answer_cache import AnswerCache
+
+RESULTS = [{"id": 1, "text": "向量检索按余弦相似度排序。"}, {"id": 2, "text": "重排序使用交叉编码器。"}]
+
+
+def make_cache(threshold: float = 0.95, ttl: float = 3600, max_entries: int = 100) -> AnswerCache:
+    settings.answer_cache_enabled = True
+    settings.answer_cache_threshold = threshold
+    settings.answer_cache_ttl = ttl
+    settings.answer_cache_max_entries = max_entries
+    return AnswerCache()
+
+
+def rotated(vector: np.ndarray, similarity: float, rng) -> np.ndarray:
+    """构造与 vector 余弦相似度为 similarity 的向量"""
+    noise = rng.standard_normal(len(vector))
+    noise -= (noise @ vector) * vector
+    noise /= np.linalg.norm(noise)
+    return similarity * vector + np.sqrt(1 - similarity ** 2) * noise
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal(settings.milvus_dimension)
+    query /= np.linalg.norm(query)
+    fingerprint = AnswerCache.fingerprint(RESULTS, scope="rag=True")
+
+    print("[1/3] 相似度阈值与检索上下文...")
+    cache = make_cache()
+    cache.store(query.tolist(), fingerprint, 1, "缓存的回答")
+    check("相同问题命中", cache.lookup(query.tolist(), fingerprint, 1) == "缓存的回答")
+    check("相似度高于阈值命中", cache.lookup(rotated(query, 0.97, rng).tolist(), fingerprint, 1) == "缓存的回答")
+    check("相似度低于阈值不命中", cache.lookup(rotated(query, 0.9, rng).tolist(), fingerprint, 1) is None)
+    other = AnswerCache.fingerprint(RESULTS[:1], scope="rag=True")
+    check("检索上下文不同不命中", cache.lookup(query.tolist(), other, 1) is None)
+    check("检索范围不同时指纹不同", AnswerCache.fingerprint(RESULTS, scope="rag=False") != fingerprint)
+    cache.bypass()
+    stats = cache.get_stats()
+    check(
+        "命中统计",
+        stats["hits"] == 2 and stats["misses"] == 2 and stats["bypassed"] == 1 and stats["hit_rate"] == 0.5,
+        f"hits={stats['hits']} misses={stats['misses']} bypassed={stats['bypassed']}"
+    )
+
+    print("[2/3] 有效期...")
+    cache = make_cache(ttl=0.2)
+    cache.store(query.tolist(), fingerprint, 1, "缓存的回答")
+    check("有效期内命中", cache.lookup(query.tolist(), fingerprint, 1) == "缓存的回答")
+    time.sleep(0.3)
+    check("过期后不命中", cache.lookup(query.tolist(), fingerprint, 1) is None)
+    check("过期条目被清除", cache.get_stats()["entries"] == 0)
+
+    print("[3/3] 知识库版本与容量...")
+    cache = make_cache(max_entries=2)
+    cache.store(query.tolist(), fingerprint, 1, "缓存的回答")
+    check("知识库版本变化后不命中", cache.lookup(query.tolist(), fingerprint, 2) is None)
+    check("版本变化时整体清空", cache.get_stats()["entries"] == 0 and cache.get_stats()["invalidations"] == 1)
+    for i in range(3):
+        cache.store(query.tolist(), AnswerCache.fingerprint(RESULTS, scope=str(i)), 2, f"回答 {i}")
+    check("超过容量时淘汰最久未使用的上下文", cache.get_stats()["entries"] == 2)
+    check("最早的条目被淘汰", cache.lookup(query.tolist(), AnswerCache.fingerprint(RESULTS, scope="0"), 2) is None)
+    check("最近的条目保留", cache.lookup(query.tolist(), AnswerCache.fingerprint(RESULTS, scope="2"), 2) == "回答 2")
+    cache.store(query.tolist(), fingerprint, 2, "")
+    check("空回答不缓存", cache.get_stats()["entries"] == 2)
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
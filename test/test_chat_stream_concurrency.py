@@ -0,0 +1,90 @@
+"""
+流式聊天并发测试
+
+先单独发起一次 /api/v1/chat/stream 得到基准首 token 时间（TTFT），
+再同时发起 N 个流式请求，统计每个请求的 TTFT 和总耗时。
+LLM 流式输出不阻塞事件循环时，各请求的 TTFT 应与基准接近，不会随并发数线性增加。
+
+集成测试：不会自动启动服务，需要先启动应用（python main.py）和它配置的模型服务
+（没有真实模型时可以用 python test/fake_openai_server.py 并把 llm.base_url 指向它），连接失败时直接退出。
+
+用法:
+    python test/test_chat_stream_concurrency.py --streams 8
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+async def stream_once(client: httpx.AsyncClient, base_url: str, index: int, message: str) -> dict:
+    """发起一次流式请求，返回首 token 时间和总耗时（秒）"""
+    payload = {
+        "user_id": f"concurrency-test-{index}",
+        "message": message,
+        "use_memory": False,
+        "use_cache": False
+    }
+    started = time.perf_counter()
+    ttft = None
+    chunks = 0
+    async with client.stream("POST", f"{base_url}/api/v1/chat/stream", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if event["type"] == "chunk":
+                chunks += 1
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+            elif event["type"] == "error":
+                raise RuntimeError(event["message"])
+    return {"ttft": ttft, "total": time.perf_counter() - started, "chunks": chunks}
+
+
+async def main(base_url: str, streams: int, message: str, tolerance: float) -> bool:
+    async with httpx.AsyncClient(timeout=120) as client:
+        print("[1/2] 单个流式请求基准...")
+        baseline = await stream_once(client, base_url, 0, message)
+        print(f"  TTFT {baseline['ttft'] * 1000:.0f}ms, 总耗时 {baseline['total'] * 1000:.0f}ms, {baseline['chunks']} 个 chunk")
+
+        print(f"\n[2/2] {streams} 个并发流式请求...")
+        results = await asyncio.gather(*[
+            stream_once(client, base_url, i + 1, message) for i in range(streams)
+        ])
+
+    ttfts = [r["ttft"] for r in results if r["ttft"] is not None]
+    totals = [r["total"] for r in results]
+    for i, r in enumerate(results, 1):
+        ttft = f"{r['ttft'] * 1000:.0f}ms" if r["ttft"] is not None else "-"
+        print(f"  #{i:<3} TTFT {ttft:>8}, 总耗时 {r['total'] * 1000:.0f}ms")
+    print(f"  TTFT 中位数 {statistics.median(ttfts) * 1000:.0f}ms, 最大 {max(ttfts) * 1000:.0f}ms")
+    print(f"  总耗时最大 {max(totals) * 1000:.0f}ms（串行执行约需 {baseline['total'] * streams * 1000:.0f}ms）")
+
+    # 事件循环被阻塞时，后面的请求要等前面的流全部结束，TTFT 会接近 N 倍基准
+    limit = baseline["ttft"] * tolerance
+    if len(ttfts) == streams and max(ttfts) <= limit:
+        print(f"✓ 所有并发请求的 TTFT 都在基准的 {tolerance} 倍以内")
+        return True
+    print(f"✗ 有请求的 TTFT 超过基准的 {tolerance} 倍（{limit * 1000:.0f}ms）或没有输出")
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式聊天并发测试")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--message", default="用三句话介绍一下人工智能")
+    parser.add_argument("--tolerance", type=float, default=3.0, help="并发 TTFT 相对基准允许的倍数")
+    args = parser.parse_args()
+
+    try:
+        ok = asyncio.run(main(args.base_url, args.streams, args.message, args.tolerance))
+    except httpx.ConnectError as e:
+        print(f"✗ 无法连接 {args.base_url}（{e}），请先启动服务: python main.py")
+        ok = False
+    raise SystemExit(0 if ok else 1)
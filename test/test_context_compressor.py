@@ -0,0 +1,104 @@
+"""
+上下文压缩测试
+
+验证：
+1. 同一文档中 chunk_index 相邻的块合并，首尾重叠的块去掉重叠部分后合并，版本不同且不重叠的块不合并
+2. 其他文档中向量近似重复的块丢弃，同一文档的块不按向量去重
+3. 统计节省的 token 数
+不需要 Milvus 和 LLM（导入时会加载嵌入模型，句子抽取关闭，不调用模型）。
+
+用法:
+    python test/test_context_compressor.py
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.services.context_compressor import ContextCompressor, estimate_tokens
+
+TENANT = "team-a"
+
+
+def chunk(id_: int, text: str, doc_id: str, chunk_index=None, version: int = 1, score: float = 0.8) -> dict:
+    metadata = {"doc_id": doc_id, "doc_version": version, "tenant": TENANT}
+    if chunk_index is not None:
+        metadata["chunk_index"] = chunk_index
+    return {"id": id_, "text": text, "score": score, "metadata": metadata}
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    settings.rag_compress_dedup_threshold = 0.95
+    settings.rag_compress_extract = False
+    compressor = ContextCompressor()
+    rng = np.random.default_rng(0)
+    vectors = {i: rng.standard_normal(64).tolist() for i in range(1, 10)}
+
+    print("[1/3] 合并同一文档的块...")
+    # 首尾重叠至少 MIN_OVERLAP_CHARS 个字符才合并
+    bridge = "这一句用于凑够重叠长度，让首尾重叠超过二十个字符。"
+    head = "向量检索先把问题编码成向量，再在索引中查找最相近的文档块。"
+    tail = "最相近的文档块。" + "重排序阶段用交叉编码器重新打分，保留得分最高的几个块。"
+    results = [
+        chunk(2, "第二段：索引类型按数据量自动选择。", "guide", chunk_index=1, score=0.7),
+        chunk(1, "第一段：知识库的整体结构。", "guide", chunk_index=0, score=0.9),
+        chunk(3, head + bridge, "notes", score=0.6),
+        chunk(4, bridge + tail, "notes", score=0.5),
+        chunk(5, "旧版本中的另一段内容。", "guide", chunk_index=2, version=2, score=0.4)
+    ]
+    compressed = compressor.compress(None, results, vector_store=None, vectors=vectors)
+    by_id = {r["id"]: r for r in compressed}
+    merged = by_id.get(2)
+    check(
+        "相邻序号的块按文档顺序合并",
+        merged is not None and merged["text"] == results[1]["text"] + "\n\n" + results[0]["text"]
+        and merged["merged_ids"] == [1, 2] and merged["score"] == 0.9,
+        merged and merged["text"]
+    )
+    overlap = by_id.get(3)
+    check(
+        "首尾重叠的块去掉重叠部分",
+        overlap is not None and overlap["text"] == head + bridge + tail
+        and overlap["merged_ids"] == [3, 4],
+        overlap and overlap["text"]
+    )
+    check("版本不同且不重叠的块不合并", 5 in by_id and "merged_ids" not in by_id[5])
+    check("按各组排名最靠前的块排序", [r["id"] for r in compressed] == [2, 3, 5], [r["id"] for r in compressed])
+
+    print("[2/3] 近似重复去重...")
+    vectors[7] = (np.asarray(vectors[6]) + rng.standard_normal(64) * 0.01).tolist()
+    vectors[8] = vectors[6]
+    results = [
+        chunk(6, "重复上传的内容。", "upload-1"),
+        chunk(7, "重复上传的内容！", "upload-2"),
+        chunk(8, "同一文档里的重复块。", "upload-1", chunk_index=5),
+        chunk(9, "完全不同的内容。", "other")
+    ]
+    compressed = compressor.compress(None, results, vector_store=None, vectors=vectors)
+    ids = [r["id"] for r in compressed]
+    check("其他文档中的近似重复块丢弃", 7 not in ids and 6 in ids and 9 in ids, ids)
+    check("同一文档的块不按向量去重", 8 in ids or any(8 in r.get("merged_ids", []) for r in compressed), ids)
+
+    print("[3/3] 统计...")
+    stats = compressor.get_stats()
+    check("请求数与块数", stats["requests"] == 2 and stats["chunks_in"] == 9 and stats["chunks_out"] == 6)
+    check("合并与去重计数", stats["merged"] == 2 and stats["deduplicated"] == 1)
+    check("节省的 token 为正", stats["tokens_saved"] > 0 and stats["tokens_in"] > stats["tokens_out"])
+    check("中文按字、其他字符约四个一个估算 token", estimate_tokens("向量检索") == 4 and estimate_tokens("abcdefgh") == 2)
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,136 @@
+"""
+入库流水线测试
+
+使用本地向量存储和确定性的假嵌入函数，验证：
+1. 写入按 insert_batch_size 和 insert_max_bytes 分批，文本与元数据数量不一致时拒绝
+2. 同一文档重新同步（内容不变）时 skip 去重不写入任何新行，也不重新向量化
+3. 文档内容变化后重新同步只写入新出现的块，旧版本中不再出现的块可以找出并删除
+不需要 Milvus 和嵌入模型。
+
+用法:
+    python test/test_ingestion_pipeline.py
+"""
+import hashlib
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.core.local_vector_store import LocalVectorStore
+from app.services.ingestion_pipeline import IngestionPipeline, estimate_row_bytes, insert_batches, stable_doc_id
+from app.utils.text_processor import TextProcessor
+
+TENANT = "team-a"
+DOCUMENT = "\n\n".join(f"第 {i} 段：关于向量检索与入库流水线的说明文字。" * 6 for i in range(8))
+
+
+def fake_embed(texts):
+    """按文本哈希生成确定的单位向量"""
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(settings.milvus_dimension)
+        vectors.append((vector / np.linalg.norm(vector)).tolist())
+    return vectors
+
+
+class RecordingStore:
+    """记录每次 insert 的行数，其余调用转给本地向量存储"""
+
+    def __init__(self, store):
+        self.store = store
+        self.batches = []
+
+    def insert(self, texts, vectors, metadatas):
+        self.batches.append(len(texts))
+        return self.store.insert(texts, vectors, metadatas)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def ingest(store, text: str, metadata: dict):
+    pipeline = IngestionPipeline(TextProcessor(), store, fake_embed, dedup="skip")
+    stats = pipeline.run([text], [metadata])
+    return pipeline, stats
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = LocalVectorStore(collection_name="test_ingestion", path=directory)
+        try:
+            metadata = {"source": "file", "filename": "guide.md", "tenant": TENANT}
+            doc_id = stable_doc_id(TENANT, metadata)
+            check("同名文件得到同一个 doc_id", doc_id == stable_doc_id(TENANT, dict(metadata)))
+            check("不同租户的 doc_id 不同", doc_id != stable_doc_id("team-b", metadata))
+            check(
+                "没有文件名时按内容生成",
+                stable_doc_id(TENANT, {}, DOCUMENT) == stable_doc_id(TENANT, {}, DOCUMENT)
+                and stable_doc_id(TENANT, {}, DOCUMENT) != stable_doc_id(TENANT, {}, DOCUMENT + "。")
+            )
+            metadata["doc_id"] = doc_id
+
+            print("[1/3] 分批写入...")
+            texts = [f"批次测试文档 {i:02d}。" + "内容" * 40 for i in range(25)]
+            recording = RecordingStore(store)
+            pipeline = IngestionPipeline(TextProcessor(), recording, fake_embed, dedup="off", insert_batch_size=10)
+            stats = pipeline.run(texts, [{"tenant": "batch"}] * len(texts))
+            check("按行数分批", sorted(recording.batches, reverse=True) == [10, 10, 5], recording.batches)
+            check("写入全部行并记录主键", stats["chunks"] == 25 and len(pipeline.inserted_ids) == 25)
+
+            rows = [(text, vector, {"tenant": "batch"}) for text, vector in zip(texts, fake_embed(texts))]
+            row_bytes = estimate_row_bytes(rows[0])
+            batches = list(insert_batches(rows, batch_size=100, max_bytes=row_bytes * 3))
+            check(
+                "按估算大小分批",
+                [len(batch) for batch in batches] == [3] * 8 + [1]
+                and all(sum(estimate_row_bytes(row) for row in batch) <= row_bytes * 3 for batch in batches)
+            )
+            check("单行超过上限时单独成批", [len(batch) for batch in insert_batches(rows[:2], 100, 1)] == [1, 1])
+            store.delete(pipeline.inserted_ids)
+
+            try:
+                IngestionPipeline(TextProcessor(), store, fake_embed).run(texts[:3], [{}] * 2)
+                check("数量不一致时拒绝", False)
+            except ValueError as e:
+                check("数量不一致时拒绝", store.count() == 0, e)
+
+            print("[2/3] 首次入库与重新同步...")
+            _, first = ingest(store, DOCUMENT, metadata)
+            rows = store.count()
+            check("首次入库写入全部块", first["chunks"] == rows > 0, first["dedup"])
+
+            pipeline, again = ingest(store, DOCUMENT, metadata)
+            check("内容不变时写入 0 行", again["chunks"] == 0 and store.count() == rows, again["dedup"])
+            check("内容不变时不重新向量化", again["dedup"]["embedded"] == 0)
+            check("没有需要删除的旧块", pipeline.stale_ids(doc_id, TENANT) == [])
+
+            print("[3/3] 内容变化后重新同步...")
+            changed = DOCUMENT.rsplit("\n\n", 1)[0] + "\n\n新增的一段：重新同步时只写入这一块。"
+            pipeline, updated = ingest(store, changed, metadata)
+            stale = pipeline.stale_ids(doc_id, TENANT)
+            check("只写入新出现的块", updated["chunks"] == updated["dedup"]["embedded"] >= 1, updated["dedup"])
+            check("找出旧版本多出来的块", len(stale) >= 1, stale)
+            store.delete(stale)
+            _, final = ingest(store, changed, metadata)
+            check("清理后与新版本一致", final["chunks"] == 0 and store.count() == len(TextProcessor().split_text(changed)))
+        finally:
+            store.close()
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,83 @@
+"""
+词法索引增量更新与持久化测试
+
+验证 add → search → add → save → search 之后检索仍然正常（save 合并增量时权重与倒排表等长），
+保存的索引重新加载后检索结果一致，删除和按分组过滤仍然生效；全量重建与逐条加入的结果一致，
+重建期间的增删在切换后仍然生效。不需要 Milvus 和嵌入模型。
+
+用法:
+    python test/test_lexical_index.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.lexical_index import LexicalIndex
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = LexicalIndex(path=directory)
+        index.add([1, 2, 5], ["数据库连接池配置说明", "向量检索的索引参数", "长连接与短连接的区别"], ["a", "a", "a"])
+        first = index.search("连接")
+        check("首次检索", sorted(doc_id for doc_id, _ in first) == [1, 5], first)
+
+        # 新增的倒排项先进入增量，save 时合并（已合并的部分不止一项，权重长度不一致时无法广播）
+        index.add([3, 4], ["连接超时的排查方法", "连接数上限与连接池大小"], ["a", "b"])
+        index.save()
+        try:
+            after_save = index.search("连接")
+            check("保存后检索", sorted(doc_id for doc_id, _ in after_save) == [1, 3, 4, 5], after_save)
+        except ValueError as e:
+            after_save = []
+            check("保存后检索", False, f"ValueError: {e}")
+
+        check("按分组过滤", [doc_id for doc_id, _ in index.search("连接", groups=["b"])] == [4])
+
+        reloaded = LexicalIndex(path=directory)
+        check("重新加载", reloaded.load())
+        loaded = reloaded.search("连接")
+        check("加载后结果一致", [doc_id for doc_id, _ in loaded] == [doc_id for doc_id, _ in after_save], loaded)
+
+        index.remove([3])
+        index.save()
+        check("删除后不再命中", 3 not in [doc_id for doc_id, _ in index.search("连接")])
+
+        # 全量重建：遍历数据期间发生的写入和删除记入日志，切换后重放
+        rows = [(1, "数据库连接池配置说明", "a"), (2, "向量检索的索引参数", "a"),
+                (4, "连接数上限与连接池大小", "b"), (5, "长连接与短连接的区别", "a")]
+
+        def rows_with_writes():
+            for i, row in enumerate(rows):
+                yield row
+                if i == 1:
+                    index.add([6], ["重建期间新增的连接配置"], ["b"])
+                    index.remove([1])
+
+        expected = [doc_id for doc_id, _ in index.search("连接") if doc_id != 1]
+        index.rebuild(rows_with_writes(), source="test")
+        rebuilt = index.search("连接")
+        check("重建期间的删除生效", 1 not in [doc_id for doc_id, _ in rebuilt], rebuilt)
+        check("重建期间的写入生效", 6 in [doc_id for doc_id, _ in rebuilt], rebuilt)
+        check(
+            "重建结果与逐条加入一致",
+            [doc_id for doc_id, _ in rebuilt if doc_id != 6] == expected,
+            rebuilt
+        )
+        check("重建后按分组过滤", sorted(doc_id for doc_id, _ in index.search("连接", groups=["b"])) == [4, 6])
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,107 @@
+"""
+模型服务准入控制测试
+
+验证：
+1. 名额用完后排队，释放后交互式请求先于批量任务获得名额
+2. 排队已满时立即拒绝（429），排队超过等待期限时拒绝（503），都带上重试间隔
+3. 排队中被取消的请求不占用名额
+不需要模型服务。
+
+用法:
+    python test/test_llm_admission.py
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.services.llm_admission import LLMAdmission, LLMOverloadedError, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+
+
+def make_admission(max_concurrency: int, max_queue: int, queue_timeout: float) -> LLMAdmission:
+    settings.llm_max_concurrency = max_concurrency
+    settings.llm_max_queue = max_queue
+    settings.llm_queue_timeout = queue_timeout
+    settings.llm_batch_queue_timeout = queue_timeout
+    return LLMAdmission()
+
+
+async def run(check):
+    print("[1/3] 排队与优先级...")
+    admission = make_admission(1, 4, 5)
+    holder = await admission.acquire()
+    order = []
+
+    async def wait_for(name: str, priority: int):
+        lease = await admission.acquire(priority)
+        order.append(name)
+        lease.release()
+
+    batch = asyncio.create_task(wait_for("batch", PRIORITY_BATCH))
+    await asyncio.sleep(0.05)
+    interactive = asyncio.create_task(wait_for("interactive", PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0.05)
+    check("名额用完后排队", admission.get_stats()["queue_depth"] == 2)
+    holder.release()
+    await asyncio.gather(batch, interactive)
+    check("交互式请求先获得名额", order == ["interactive", "batch"], order)
+    stats = admission.get_stats()
+    check("全部完成后名额归还", stats["inflight"] == 0 and stats["queue_depth"] == 0)
+
+    print("[2/3] 429 与 503...")
+    admission = make_admission(1, 1, 0.2)
+    holder = await admission.acquire()
+    queued = asyncio.create_task(admission.acquire())
+    await asyncio.sleep(0.05)
+    try:
+        await admission.acquire()
+        check("排队已满返回 429", False)
+    except LLMOverloadedError as e:
+        check("排队已满返回 429", e.status_code == 429 and e.retry_after >= 1, f"retry_after={e.retry_after}")
+    started = time.monotonic()
+    try:
+        await queued
+        check("排队超时返回 503", False)
+    except LLMOverloadedError as e:
+        waited = time.monotonic() - started
+        check("排队超时返回 503", e.status_code == 503 and e.retry_after >= 1 and waited < 1, f"{waited:.2f}s")
+    stats = admission.get_stats()
+    check(
+        "拒绝计入统计",
+        stats["rejected_queue_full"] == 1 and stats["rejected_timeout"] == 1 and stats["queue_depth"] == 0
+    )
+    holder.release()
+    lease = admission.acquire_sync()
+    check("超时的请求不占用名额", admission.get_stats()["inflight"] == 1)
+    lease.release()
+
+    print("[3/3] 排队中取消...")
+    admission = make_admission(1, 4, 5)
+    holder = await admission.acquire()
+    cancelled = asyncio.create_task(admission.acquire())
+    await asyncio.sleep(0.05)
+    cancelled.cancel()
+    await asyncio.gather(cancelled, return_exceptions=True)
+    holder.release()
+    stats = admission.get_stats()
+    check("取消的请求不占用名额", stats["inflight"] == 0 and stats["queue_depth"] == 0)
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    asyncio.run(run(check))
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,176 @@
+"""
+LLM 请求截止时间、对冲请求和备用模型测试
+
+启动两个模拟推理副本和一个模拟的备用模型服务（test/fake_openai_server.py），验证：
+1. 副本卡住时请求在截止时间内以 LLMTimeoutError 结束（非流式和流式）；
+   有备用模型时流式请求在截止时间内改用备用模型完成
+2. 副本有长尾延迟时，开启对冲请求后尾延迟明显下降
+3. 所有副本故障时改用备用模型完成请求
+不需要真实的模型服务。
+
+用法:
+    python test/test_llm_deadlines.py --requests 200 --slow-ratio 0.03 --slow-ms 1500
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.services.llm_router import LLMEndpoint, LLMRouter, LLMTimeoutError
+
+SERVER = Path(__file__).parent / "fake_openai_server.py"
+MESSAGES = [HumanMessage(content="你好")]
+
+
+def start_servers(names: list, base_port: int) -> list:
+    processes = [
+        subprocess.Popen([
+            sys.executable, str(SERVER), "--port", str(base_port + i), "--name", name,
+            "--tokens", "10", "--delay-ms", "5"
+        ])
+        for i, name in enumerate(names)
+    ]
+    for i in range(len(names)):
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{base_port + i}/v1/models", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+    return processes
+
+
+def admin(url: str, action: str, **params):
+    httpx.post(f"{url.rsplit('/v1', 1)[0]}/admin/{action}", params=params)
+
+
+def make_router(urls: list, fallback_urls: list = ()) -> LLMRouter:
+    def endpoint(url: str) -> LLMEndpoint:
+        return LLMEndpoint(url, ChatOpenAI(model="fake-model", openai_api_key="none", base_url=url, max_retries=0))
+
+    return LLMRouter([endpoint(url) for url in urls], api_key="none", fallbacks=[endpoint(url) for url in fallback_urls])
+
+
+def percentile(values: list, q: float) -> float:
+    return sorted(values)[int(len(values) * q) - 1]
+
+
+async def measure(router: LLMRouter, requests: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> float:
+        async with semaphore:
+            started = time.perf_counter()
+            await router.ainvoke(MESSAGES)
+            return time.perf_counter() - started
+
+    return await asyncio.gather(*[one() for _ in range(requests)])
+
+
+async def main(args) -> bool:
+    urls = [f"http://127.0.0.1:{args.base_port + i}/v1" for i in range(2)]
+    fallback_url = f"http://127.0.0.1:{args.base_port + 2}/v1"
+    settings.llm_health_interval = 0
+    ok = True
+
+    print("[1/3] 副本卡住...")
+    settings.llm_request_timeout = args.timeout
+    settings.llm_hedge_enabled = False
+    router = make_router(urls[:1])
+    admin(urls[0], "slow", ratio=1, ms=60000)
+    for stream in (False, True):
+        started = time.perf_counter()
+        try:
+            if stream:
+                [chunk async for chunk in router.astream(MESSAGES)]
+            else:
+                await router.ainvoke(MESSAGES)
+            outcome = "正常返回"
+        except LLMTimeoutError as e:
+            outcome = f"LLMTimeoutError({e})"
+        seconds = time.perf_counter() - started
+        print(f"  {'流式' if stream else '非流式'}: {outcome}，耗时 {seconds:.2f}s（截止时间 {args.timeout}s）")
+        if not outcome.startswith("LLMTimeoutError") or seconds > args.timeout + 0.5:
+            print("  ✗ 请求没有在截止时间内结束")
+            ok = False
+    router = make_router(urls[:1], [fallback_url])
+    started = time.perf_counter()
+    answer = "".join([chunk.content async for chunk in router.astream(MESSAGES)])
+    seconds = time.perf_counter() - started
+    served = answer.split("]")[0].lstrip("[")
+    print(f"  流式（有备用模型）: 由 {served} 完成，耗时 {seconds:.2f}s")
+    if served != "fallback" or seconds > args.timeout + 0.5:
+        print("  ✗ 首个 token 超时后没有在截止时间内改用备用模型")
+        ok = False
+    admin(urls[0], "slow", ratio=0)
+
+    print(f"\n[2/3] 长尾延迟（{args.slow_ratio:.0%} 的请求多等 {args.slow_ms:.0f}ms）...")
+    settings.llm_request_timeout = 30
+    for url in urls:
+        admin(url, "slow", ratio=args.slow_ratio, ms=args.slow_ms)
+    results = {}
+    for hedge in (False, True):
+        settings.llm_hedge_enabled = hedge
+        router = make_router(urls)
+        # 预热：积累 P95 延迟样本
+        await measure(router, 60, args.concurrency)
+        latencies = await measure(router, args.requests, args.concurrency)
+        results[hedge] = latencies
+        stats = router.get_stats()
+        print(
+            f"  对冲{'开启' if hedge else '关闭'}: p50={statistics.median(latencies) * 1000:.0f}ms "
+            f"p95={percentile(latencies, 0.95) * 1000:.0f}ms p99={percentile(latencies, 0.99) * 1000:.0f}ms "
+            f"max={max(latencies) * 1000:.0f}ms 对冲={stats['hedges']} 对冲胜出={stats['hedge_wins']}"
+        )
+    if percentile(results[True], 0.99) > percentile(results[False], 0.99) * 0.6:
+        print("  ✗ 开启对冲后尾延迟没有明显下降")
+        ok = False
+    for url in urls:
+        admin(url, "slow", ratio=0)
+
+    print("\n[3/3] 所有副本故障...")
+    settings.llm_hedge_enabled = False
+    router = make_router(urls, [fallback_url])
+    for url in urls:
+        admin(url, "fail", on=True)
+    answers = [(await router.ainvoke(MESSAGES)).content for _ in range(3)]
+    answers.append("".join([chunk.content async for chunk in router.astream(MESSAGES)]))
+    served = [answer.split("]")[0].lstrip("[") for answer in answers]
+    print(f"  处理服务: {served}")
+    stats = router.get_stats()
+    print(f"  路由统计: failovers={stats['failovers']} fallbacks={stats['fallbacks']}")
+    if any(name != "fallback" for name in served):
+        print("  ✗ 副本故障时没有改用备用模型")
+        ok = False
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM 请求截止时间、对冲请求和备用模型测试")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=1.0, help="副本卡住时的截止时间（秒）")
+    parser.add_argument("--slow-ratio", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=1500.0)
+    parser.add_argument("--base-port", type=int, default=9301)
+    args = parser.parse_args()
+
+    servers = start_servers(["replica-0", "replica-1", "fallback"], args.base_port)
+    try:
+        ok = asyncio.run(main(args))
+    finally:
+        for process in servers:
+            process.terminate()
+    raise SystemExit(0 if ok else 1)
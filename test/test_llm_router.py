@@ -0,0 +1,132 @@
+"""
+多副本 LLM 路由测试
+
+启动若干个模拟推理副本（test/fake_openai_server.py），验证：
+1. 不带会话键的并发请求分散到所有副本
+2. 同一会话的多轮请求固定发往同一副本
+3. 副本故障时请求换副本完成，连续失败后该副本被暂停使用、健康检查标记为不健康
+4. 副本恢复后重新参与路由
+不需要真实的模型服务。
+
+用法:
+    python test/test_llm_router.py --replicas 3
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.services.llm_router import LLMEndpoint, LLMRouter
+
+SERVER = Path(__file__).parent / "fake_openai_server.py"
+
+
+def start_replicas(count: int, base_port: int) -> list:
+    processes = [
+        subprocess.Popen([
+            sys.executable, str(SERVER), "--port", str(base_port + i), "--name", f"replica-{i}",
+            "--tokens", "10", "--delay-ms", "10"
+        ])
+        for i in range(count)
+    ]
+    for i in range(count):
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{base_port + i}/v1/models", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+    return processes
+
+
+def replica_of(text: str) -> str:
+    return text.split("]")[0].lstrip("[")
+
+
+async def ask(router: LLMRouter, key: str = None, stream: bool = False) -> str:
+    messages = [HumanMessage(content="你好")]
+    if stream:
+        return "".join([chunk.content async for chunk in router.astream(messages, key)])
+    return (await router.ainvoke(messages, key)).content
+
+
+async def main(args) -> bool:
+    urls = [f"http://127.0.0.1:{args.base_port + i}/v1" for i in range(args.replicas)]
+    settings.llm_health_interval = 0.5
+    settings.llm_eject_seconds = 2.0
+    router = LLMRouter(
+        [
+            LLMEndpoint(url, ChatOpenAI(model="fake-model", openai_api_key="none", base_url=url, max_retries=0))
+            for url in urls
+        ],
+        api_key="none"
+    )
+    ok = True
+
+    print("[1/4] 不带会话键的并发请求...")
+    served = Counter(replica_of(r) for r in await asyncio.gather(*[ask(router) for _ in range(args.requests)]))
+    print(f"  各副本处理数: {dict(served)}")
+    if len(served) != args.replicas:
+        print("  ✗ 有副本没有分到请求")
+        ok = False
+
+    print("\n[2/4] 同一会话的多轮请求（含流式）...")
+    turns = [replica_of(await ask(router, "conversation-1", stream=i % 2 == 1)) for i in range(10)]
+    print(f"  处理副本: {turns}")
+    if len(set(turns)) != 1:
+        print("  ✗ 同一会话的请求发往了不同副本")
+        ok = False
+    sticky = turns[0]
+
+    print(f"\n[3/4] {sticky} 故障...")
+    sticky_url = urls[int(sticky.rsplit("-", 1)[1])]
+    httpx.post(f"{sticky_url.rsplit('/v1', 1)[0]}/admin/fail", params={"on": True})
+    failover = [replica_of(await ask(router, "conversation-1")) for _ in range(5)]
+    await asyncio.sleep(1.5)
+    stats = {e["base_url"]: e for e in router.get_stats()["endpoints"]}[sticky_url]
+    print(f"  故障期间处理副本: {failover}")
+    print(f"  {sticky}: healthy={stats['healthy']}, ejected={stats['ejected']}, failures={stats['failures']}")
+    if sticky in failover or stats["healthy"]:
+        print("  ✗ 故障副本仍在处理请求或未被标记为不健康")
+        ok = False
+
+    print(f"\n[4/4] {sticky} 恢复...")
+    httpx.post(f"{sticky_url.rsplit('/v1', 1)[0]}/admin/fail", params={"on": False})
+    await asyncio.sleep(args.recover_wait)
+    recovered = replica_of(await ask(router, "conversation-1"))
+    print(f"  恢复后处理副本: {recovered}")
+    if recovered != sticky:
+        print("  ✗ 恢复的副本没有重新接收会话请求")
+        ok = False
+
+    print(f"\n路由统计: {router.get_stats()}")
+    router.close()
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多副本 LLM 路由测试")
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--base-port", type=int, default=9101)
+    parser.add_argument("--recover-wait", type=float, default=2.5, help="等待暂停期结束和健康检查恢复的时间")
+    args = parser.parse_args()
+
+    replicas = start_replicas(args.replicas, args.base_port)
+    try:
+        ok = asyncio.run(main(args))
+    finally:
+        for process in replicas:
+            process.terminate()
+    raise SystemExit(0 if ok else 1)
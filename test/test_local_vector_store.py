@@ -0,0 +1,142 @@
+"""
+本地向量存储持久化测试
+
+验证：
+1. 数据目录被一个进程打开时，其他进程（例如 manage.py）打开同一目录立即失败
+2. 压缩后、落盘前崩溃（只留下旧的 state.pkl）时，重新加载的数据与上次保存时一致
+3. 压缩并落盘后重新加载，主键、向量和检索结果正确，旧一代文件被删除
+4. 后台保存序列化 state.pkl 期间检索和写入不被阻塞
+不需要 Milvus 和嵌入模型。
+
+用法:
+    python test/test_local_vector_store.py
+"""
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.core.local_vector_store import LocalVectorStore, fcntl
+
+COLLECTION = "test_local_store"
+# 测试中手动控制落盘时机，关闭后台定期保存
+settings.vector_store_save_interval = 3600
+
+# 在子进程中打开同一目录，输出 locked 或 opened
+OPEN_IN_CHILD = """
+import sys
+sys.path.insert(0, {root!r})
+from app.core.local_vector_store import LocalVectorStore
+try:
+    LocalVectorStore(collection_name={collection!r}, path={path!r}).close()
+    print("opened")
+except RuntimeError:
+    print("locked")
+"""
+
+
+def open_in_child(path: str) -> str:
+    code = OPEN_IN_CHILD.format(root=str(Path(__file__).parent.parent), collection=COLLECTION, path=path)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=120)
+    return result.stdout.strip().splitlines()[-1] if result.stdout.strip() else result.stderr[-300:]
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((60, settings.milvus_dimension)).astype(np.float32).tolist()
+    texts = [f"文档块 {i}" for i in range(60)]
+
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(collection_name=COLLECTION, path=path)
+        ids = store.insert(texts, vectors, [{"doc_id": f"d{i}"} for i in range(60)])
+        store.flush()
+
+        print("[1/4] 跨进程互斥...")
+        if fcntl is None:
+            print("  - 当前平台没有 fcntl，跳过")
+        else:
+            check("其他进程打开同一目录失败", open_in_child(path) == "locked")
+
+        print("[2/4] 压缩后落盘前崩溃...")
+        store.delete(ids[:40])
+        segment = store._segment
+        segment.compact()
+        files = sorted(p.name for p in segment.directory.iterdir())
+        check("压缩写入新一代文件，旧文件保留", "vectors.npy" in files and "vectors.1.npy" in files, files)
+        # 模拟崩溃：不落盘直接释放目录锁，再按磁盘上的 state.pkl 加载
+        store._closed.set()
+        store._segment.close()
+        if store._lock_file is not None:
+            fcntl.flock(store._lock_file, fcntl.LOCK_UN)
+            store._lock_file.close()
+            store._lock_file = None
+        reloaded = LocalVectorStore(collection_name=COLLECTION, path=path)
+        rows = reloaded.get_by_ids([ids[0], ids[50]], with_vectors=True)
+        check("按上次保存的状态加载", reloaded.count() == 60 and len(rows) == 2)
+        check("主键与向量对应", all(np.allclose(row["vector"], vectors[ids.index(row["id"])]) for row in rows))
+
+        print("[3/4] 压缩并落盘...")
+        reloaded.delete(ids[:40])
+        reloaded.flush()
+        files = sorted(p.name for p in reloaded._segment.directory.iterdir())
+        check("删除旧一代文件", "vectors.npy" not in files, files)
+        reloaded.close()
+        final = LocalVectorStore(collection_name=COLLECTION, path=path)
+        try:
+            rows = final.get_by_ids([ids[45]], with_vectors=True)
+            check("重新加载后数据正确", final.count() == 20 and np.allclose(rows[0]["vector"], vectors[45]))
+            hits = final.search(vectors[55], top_k=1)
+            check("检索命中原文档块", hits and hits[0]["id"] == ids[55])
+
+            print("[4/4] 保存期间的检索和写入...")
+            # 让序列化 state.pkl 停在中途，检查锁已经释放
+            segment = final._segment
+            writing, release = threading.Event(), threading.Event()
+            write_state = segment.write_state
+
+            def slow_write_state(state):
+                writing.set()
+                release.wait(30)
+                write_state(state)
+
+            segment.write_state = slow_write_state
+            final.insert(["保存前写入"], [vectors[0]], [{}])
+            saver = threading.Thread(target=final.flush)
+            saver.start()
+            writing.wait(30)
+            result = {}
+
+            def search_and_insert():
+                result["hits"] = final.search(vectors[56], top_k=1)
+                result["ids"] = final.insert(["保存期间写入"], [vectors[1]], [{}])
+
+            worker = threading.Thread(target=search_and_insert)
+            worker.start()
+            worker.join(5)
+            check("序列化期间检索和写入不阻塞", not worker.is_alive() and result["hits"][0]["id"] == ids[56])
+            release.set()
+            saver.join(30)
+            del segment.write_state
+            check("保存期间的写入在下次保存前保持未落盘标记", final._dirty)
+        finally:
+            final.close()
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
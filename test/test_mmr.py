@@ -0,0 +1,94 @@
+"""
+MMR 多样性选择测试
+
+用构造的向量验证 maximal_marginal_relevance：
+1. 候选中有重复内容时，先选相关且互不重复的块
+2. lambda_mult = 1 时退化为按相关性排序
+3. 边际相关性低于第一个块的 mmr_min_ratio 倍时提前停止，不凑满 top_k
+不需要 Milvus 和 LLM（导入 rag_service 时会加载嵌入模型，向量存储使用临时目录中的本地存储）。
+
+用法:
+    python test/test_mmr.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+
+# 导入 rag_service 前切换到本地向量存储，不连接 Milvus
+_data = tempfile.TemporaryDirectory()
+settings.vector_store_backend = "local"
+settings.vector_store_path = _data.name
+settings.vector_store_save_interval = 3600
+settings.rag_hybrid_enabled = False
+
+from app.services.rag_service import maximal_marginal_relevance
+
+
+def unit(vector: np.ndarray) -> np.ndarray:
+    return vector / np.linalg.norm(vector)
+
+
+def make_candidates(rng):
+    """查询向量和 6 个候选：0-2 为同一内容的重复（最相关），3、4 为不同角度的相关内容，5 几乎无关"""
+    dimension = 64
+    # 查询向量和 4 个与它正交、彼此正交的方向
+    basis, _ = np.linalg.qr(rng.standard_normal((dimension, 5)))
+    query, directions = basis[:, 0], basis[:, 1:].T
+
+    duplicate = unit(0.75 * query + 0.66 * directions[0])
+    candidates = [
+        duplicate,
+        unit(duplicate + 0.01 * rng.standard_normal(dimension)),
+        unit(duplicate + 0.01 * rng.standard_normal(dimension)),
+        unit(0.72 * query + 0.69 * directions[1]),
+        unit(0.7 * query + 0.71 * directions[2]),
+        unit(0.1 * query + 0.99 * directions[3])
+    ]
+    return query, candidates
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    rng = np.random.default_rng(0)
+    query, candidates = make_candidates(rng)
+    relevance_order = list(np.argsort(-(np.stack(candidates) @ query)))
+
+    print("[1/3] 去除重复内容...")
+    selected = maximal_marginal_relevance(query, candidates, top_k=3, lambda_mult=0.7)
+    check("第一个是最相关的块", selected[0] == relevance_order[0], selected)
+    check("不再选它的重复", sorted(selected[1:]) == [3, 4], selected)
+    check("返回下标不重复", len(set(selected)) == len(selected))
+
+    print("[2/3] 只看相关性...")
+    selected = maximal_marginal_relevance(query, candidates, top_k=6, lambda_mult=1.0)
+    check("lambda_mult = 1 时按相关性排序", selected == relevance_order, selected)
+    check("空候选或 top_k = 0 时为空", maximal_marginal_relevance(query, [], 3) == []
+          and maximal_marginal_relevance(query, candidates, 0) == [])
+
+    print("[3/3] mmr_min_ratio 截断...")
+    full = maximal_marginal_relevance(query, candidates, top_k=6, lambda_mult=0.7, min_ratio=0.0)
+    check("min_ratio = 0 时凑满 top_k", len(full) == 6, full)
+    cut = maximal_marginal_relevance(query, candidates, top_k=6, lambda_mult=0.7, min_ratio=0.5)
+    check("只剩重复和无关内容时停止", len(cut) == 3 and cut[0] in (0, 1, 2) and sorted(cut[1:]) == [3, 4], cut)
+    check("截断前的选择顺序不变", cut == full[:len(cut)], full)
+    strict = maximal_marginal_relevance(query, candidates, top_k=6, lambda_mult=0.7, min_ratio=0.99)
+    check("min_ratio 接近 1 时只保留第一个", strict == full[:1], strict)
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
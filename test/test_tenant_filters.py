@@ -0,0 +1,106 @@
+"""
+租户隔离与过滤条件校验测试
+
+使用本地向量存储验证：
+1. 租户名称校验：空值归入共享租户，含引号、空格等字符的名称被拒绝
+2. 过滤条件校验：不支持的字段、范围操作符、空列表和类型错误的值被拒绝
+3. 检索只返回指定租户范围内、满足过滤条件的文档块，按文档删除不影响其他租户
+不需要 Milvus、嵌入模型和 LLM。
+
+用法:
+    python test/test_tenant_filters.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.core.local_vector_store import LocalVectorStore
+from app.core.vector_store import TENANT_FIELD, normalize_tenant
+
+# 测试中不需要后台定期保存
+settings.vector_store_save_interval = 3600
+
+
+def rejects(func, *args) -> bool:
+    try:
+        func(*args)
+    except ValueError:
+        return True
+    return False
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    print("[1/3] 租户名称...")
+    check("未指定租户归入共享租户", normalize_tenant(None) == normalize_tenant("") == settings.tenant_shared)
+    check("合法名称原样返回", normalize_tenant("team-a.dev:1@corp") == "team-a.dev:1@corp")
+    for name in ('a" or tenant != "', "team a", "租户", "x" * 129):
+        check(f"拒绝 {name[:20]!r}", rejects(normalize_tenant, name))
+
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(collection_name="test_tenant_filters", path=path)
+        try:
+            print("[2/3] 过滤条件...")
+            check("等于、列表和范围", store.parse_filters({
+                "source": "wiki", "doc_id": ["a", "b"], "created_at": {"gte": 10, "lt": 20}
+            }) == [
+                ("source", "==", "wiki"), ("doc_id", "in", ["a", "b"]),
+                ("created_at", ">=", 10), ("created_at", "<", 20)
+            ])
+            check("拒绝不支持的字段", rejects(store.parse_filters, {"text": "x"}))
+            check("拒绝不支持的范围操作符", rejects(store.parse_filters, {"created_at": {"ne": 1}}))
+            check("拒绝空的取值列表", rejects(store.parse_filters, {"source": []}))
+            check("拒绝数值字段的字符串值", rejects(store.parse_filters, {"created_at": "1 or 1"}))
+            check("拒绝数值字段的布尔值", rejects(store.parse_filters, {"created_at": True}))
+            check("检索范围中的非法租户被拒绝", rejects(store.validate_scope, None, ["team-a", "bad tenant"]))
+
+            print("[3/3] 检索范围...")
+            rng = np.random.default_rng(0)
+            vector = rng.standard_normal(settings.milvus_dimension)
+            vectors = [(vector + rng.standard_normal(len(vector)) * 0.01).tolist() for _ in range(6)]
+            metadatas = [
+                {TENANT_FIELD: tenant, "doc_id": f"{tenant}-doc", "source": source, "created_at": created_at}
+                for tenant, source, created_at in [
+                    ("team-a", "wiki", 10), ("team-a", "faq", 20), ("team-b", "wiki", 10),
+                    ("team-b", "faq", 20), (None, "wiki", 10), (None, "faq", 20)
+                ]
+            ]
+            store.insert([f"文档块 {i}" for i in range(6)], vectors, metadatas)
+
+            def tenants_of(hits):
+                return sorted({normalize_tenant(hit["metadata"][TENANT_FIELD]) for hit in hits})
+
+            hits = store.search(vector.tolist(), top_k=10, tenants=["team-a"])
+            check("只返回本租户的文档块", tenants_of(hits) == ["team-a"] and len(hits) == 2, tenants_of(hits))
+            hits = store.search(vector.tolist(), top_k=10, tenants=["team-a", settings.tenant_shared])
+            check("包含共享知识库", tenants_of(hits) == sorted(["team-a", settings.tenant_shared]) and len(hits) == 4)
+            hits = store.search(vector.tolist(), top_k=10, filters={"source": "wiki"}, tenants=["team-b"])
+            check("租户范围与过滤条件同时生效", len(hits) == 1 and hits[0]["metadata"]["source"] == "wiki")
+            hits = store.search(vector.tolist(), top_k=10, filters={"created_at": {"gt": 10}})
+            check("不限租户时按范围过滤", len(hits) == 3 and all(hit["metadata"]["created_at"] == 20 for hit in hits))
+            check("未知租户检索为空", store.search(vector.tolist(), top_k=10, tenants=["team-c"]) == [])
+
+            deleted = store.delete_by_doc("team-a-doc", "team-b")
+            check("按文档删除限定在租户内", deleted == [] and store.count() == 6)
+            deleted = store.delete_by_doc("team-a-doc", "team-a")
+            check("删除本租户的文档", len(deleted) == 2 and store.count() == 4)
+        finally:
+            store.close()
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
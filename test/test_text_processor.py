@@ -0,0 +1,88 @@
+"""
+文本分块测试
+
+验证：
+1. 流式分块（任意切分输入）与 split_text 的结果完全一致
+2. 超过 max_pending 的超长段落在句末强制切开，缓存不超过 max_pending，内容不丢失
+3. 长段落跟在短段落之后时同样按 chunk_size 切分，不会产生超长文本块
+不需要 Milvus、嵌入模型和 LLM。
+
+用法:
+    python test/test_text_processor.py
+"""
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.utils.text_processor import TextProcessor
+
+
+def sentence(i: int) -> str:
+    return f"第{i}句说明向量检索的流程和注意事项。"
+
+
+def stream(processor: TextProcessor, text: str, piece: int, max_pending: int = None):
+    """按固定长度切开输入喂给流式分块器，返回 (文本块, 最大缓存长度)"""
+    splitter = processor.stream_splitter(max_pending)
+    chunks, pending = [], 0
+    for start in range(0, len(text), piece):
+        chunks.extend(splitter.feed(text[start:start + piece]))
+        pending = max(pending, len(splitter.pending))
+    return chunks + splitter.finish(), pending
+
+
+def covers(chunks, sentences) -> bool:
+    """每个句子都出现在分块结果中（忽略句末标点）"""
+    joined = "".join(chunks).replace("。", "")
+    return all(s.rstrip("。") in joined for s in sentences)
+
+
+def main() -> bool:
+    ok = True
+
+    def check(name: str, passed: bool, detail=""):
+        nonlocal ok
+        print(f"  {'✓' if passed else '✗'} {name}" + (f": {detail}" if detail else ""))
+        ok = ok and passed
+
+    processor = TextProcessor()
+    limit = processor.chunk_size
+
+    print("[1/3] 流式分块与 split_text 一致...")
+    rng = random.Random(0)
+    paragraphs = ["".join(sentence(i * 10 + j) for j in range(rng.randint(1, 12))) for i in range(60)]
+    text = "\n\n".join(paragraphs) + "\n \n" + "结尾。"
+    expected = processor.split_text(text)
+    for piece in (1, 7, 64, 4096):
+        chunks, _ = stream(processor, text, piece)
+        check(f"每次喂入 {piece} 个字符", chunks == expected, f"{len(chunks)} / {len(expected)} 块")
+
+    print("[2/3] 超长段落强制切开...")
+    sentences = [sentence(i) for i in range(400)]
+    long_text = "开头一段。\n\n" + "".join(sentences) + "\n\n结尾一段。"
+    max_pending = limit * 8
+    chunks, pending = stream(processor, long_text, 1000)
+    check("缓存不超过 max_pending", pending <= max_pending, f"{pending} / {max_pending}")
+    check("内容不丢失", covers(chunks, sentences) and chunks[0] == "开头一段。" and chunks[-1] == "结尾一段。")
+    check("文本块不超过 chunk_size", max(len(c) for c in chunks) <= limit, max(len(c) for c in chunks))
+    no_marks = "".join(sentences).replace("。", "，")
+    chunks, pending = stream(processor, no_marks, 1000)
+    check("没有句末标点时按 max_pending 切开", pending <= max_pending and "".join(chunks).replace("。", "") == no_marks)
+    check("没有句末标点时文本块不超过 chunk_size", max(len(c) for c in chunks) <= limit, max(len(c) for c in chunks))
+
+    print("[3/3] 长段落跟在短段落之后...")
+    chunks = processor.split_text(long_text)
+    check("文本块不超过 chunk_size", max(len(c) for c in chunks) <= limit, max(len(c) for c in chunks))
+    check("内容不丢失", covers(chunks, sentences))
+    check("相邻句子不粘连", all("事项第" not in c for c in chunks))
+    chunks = processor.split_text(no_marks)
+    check("没有句末标点的长段落按字符切分", max(len(c) for c in chunks) <= limit and "".join(chunks).replace("。", "") == no_marks)
+
+    print("\n✓ 全部通过" if ok else "\n✗ 存在失败项")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)